@@ -0,0 +1,404 @@
+"""
+End-to-end load test for the REST app (src/adapters/inbound/rest.py).
+
+Builds the real app and service graph (src/server.py) and serves it under
+uvicorn against an in-memory Qdrant. The LLM is replaced by a deterministic
+stub generator (fixed latency, no network). It then drives POST /ingest
+(polling each job to completion) and POST /ask or /ask/stream at a fixed
+concurrency. It reports p50/p95/p99 latency, requests/s and per-stage
+timings (query embedding, retrieval, generation, parsing, indexing) and
+writes everything as JSON.
+
+    python -m benchmarks.bench_rest --ask-requests 500 --concurrency 16 --output bench.json
+    python -m benchmarks.bench_rest --output new.json --baseline bench.json
+
+With --url an already running server is driven instead. Nothing is
+stubbed in that case and no per-stage timings are reported.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, List
+
+import httpx
+import numpy as np
+
+from src.domain.model import Answer, BaseDocument, Citation, SyncPlan
+from src.domain.ports import EmbeddingPort, IngestionPort, RetrieveDocumentsPort, StreamingGenerateAnswerPort
+
+WORDS = (
+    "vector index query latency throughput shard replica cache embedding token chunk document "
+    "retrieval ranking filter metadata tenant ingestion pipeline batch stream budget context answer "
+    "model server worker queue memory disk network cluster payload score overlap sentence parser"
+).split()
+
+
+# ---------- stage timing ----------
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def time(self, stage: str, awaitable: Awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.samples[stage].append(time.perf_counter() - started)
+
+    async def time_stream(self, stage: str, stream: AsyncIterator) -> AsyncIterator:
+        """Items of `stream`, recording the time spent producing each one."""
+        items = stream.__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                item = await items.__anext__()
+            except StopAsyncIteration:
+                return
+            self.samples[stage].append(time.perf_counter() - started)
+            yield item
+
+    def summary(self) -> dict:
+        return {stage: latency_summary(values) for stage, values in sorted(self.samples.items())}
+
+
+class TimedEmbedder(EmbeddingPort):
+    def __init__(self, inner: EmbeddingPort, timer: StageTimer) -> None:
+        self._inner, self._timer = inner, timer
+
+    async def embed_query(self, text: str) -> List[float]:
+        return await self._timer.time("query_embedding", self._inner.embed_query(text))
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self._timer.time("query_embedding", self._inner.embed_queries(texts))
+
+
+class TimedRetriever(RetrieveDocumentsPort):
+    def __init__(self, inner: RetrieveDocumentsPort, timer: StageTimer) -> None:
+        self._inner, self._timer = inner, timer
+
+    async def retrieve(self, query: str, filters: dict = None, query_embedding: list[float] | None = None) -> List[BaseDocument]:
+        return await self._timer.time("retrieval", self._inner.retrieve(query, filters=filters, query_embedding=query_embedding))
+
+    async def retrieve_batch(self, queries: List[str], filters: dict | None = None,
+                             query_embeddings: List[List[float]] | None = None) -> List[List[BaseDocument]]:
+        return await self._timer.time("retrieval", self._inner.retrieve_batch(
+            queries, filters=filters, query_embeddings=query_embeddings,
+        ))
+
+    async def ingest(self, documents: List[BaseDocument], **kwargs) -> None:
+        return await self._timer.time("ingest.indexing", self._inner.ingest(documents, **kwargs))
+
+    async def delete(self, ids: List[str]) -> None:
+        return await self._timer.time("ingest.delete", self._inner.delete(ids))
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+
+
+class TimedIngester(IngestionPort):
+    def __init__(self, inner: IngestionPort, timer: StageTimer) -> None:
+        self._inner, self._timer = inner, timer
+
+    async def ingest(self, **kwargs) -> List[BaseDocument]:
+        return await self._timer.time("ingest.parsing", self._inner.ingest(**kwargs))
+
+    def ingest_stream(self, **kwargs) -> AsyncIterator[List[BaseDocument]]:
+        return self._timer.time_stream("ingest.parsing", self._inner.ingest_stream(**kwargs))
+
+    async def sync(self, **kwargs) -> SyncPlan:
+        return await self._timer.time("ingest.planning", self._inner.sync(**kwargs))
+
+    def sync_stream(self, plan: SyncPlan, **kwargs) -> AsyncIterator[List[BaseDocument]]:
+        return self._timer.time_stream("ingest.parsing", self._inner.sync_stream(plan, **kwargs))
+
+    def commit_sync(self, plan: SyncPlan) -> None:
+        self._inner.commit_sync(plan)
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+
+
+class StubGenerator(StreamingGenerateAnswerPort):
+    """Deterministic stand-in for the LLM: fixed latency, answer derived from the question and doc ids."""
+
+    def __init__(self, timer: StageTimer, latency_ms: float = 50.0, tokens: int = 32) -> None:
+        self._timer = timer
+        self.latency = latency_ms / 1000.0
+        self.tokens = tokens
+
+    def _tokens(self, question: str, docs: List[BaseDocument]) -> list[str]:
+        seed = hashlib.sha256((question + "|".join(d.id for d in docs)).encode()).digest()
+        rng = random.Random(seed)
+        return [rng.choice(WORDS) + " " for _ in range(self.tokens)]
+
+    async def generate(self, question: str, docs: List[BaseDocument]) -> Answer:
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        text = "".join(self._tokens(question, docs))
+        self._timer.samples["generation"].append(time.perf_counter() - started)
+        return Answer(text=text, citations=[Citation(document_id=d.id, snippet=d.text[:200]) for d in docs])
+
+    async def generate_stream(self, question: str, docs: List[BaseDocument]) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        tokens = self._tokens(question, docs)
+        for token in tokens:
+            await asyncio.sleep(self.latency / len(tokens))
+            yield token
+        self._timer.samples["generation"].append(time.perf_counter() - started)
+
+
+# ---------- workload ----------
+
+def latency_summary(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ms = np.asarray(values) * 1000.0
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def make_document(rng: random.Random, words: int) -> str:
+    sentences, count = [], 0
+    while count < words:
+        length = rng.randint(6, 18)
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+        count += length
+    return " ".join(sentences)
+
+
+def make_question(rng: random.Random) -> str:
+    return "What does the " + " ".join(rng.sample(WORDS, 3)) + " do?"
+
+
+async def run_load(n: int, concurrency: int, request: Callable[[int], Awaitable[None]]) -> dict:
+    """Fire `n` requests from `concurrency` workers; returns latency stats, errors and requests/s."""
+    latencies, errors = [], []
+    counter = iter(range(n))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await request(i)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": n,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "latency": latency_summary(latencies),
+    }
+
+
+async def bench_ingest(client: httpx.AsyncClient, args, rng: random.Random, workdir: Path) -> dict:
+    files = []
+    for i in range(args.ingest_files):
+        path = workdir / f"bench-{args.seed}-{i}.txt"
+        path.write_text(make_document(rng, args.doc_words))
+        files.append(path)
+    submit_latencies = []
+
+    async def request(i: int) -> None:
+        started = time.perf_counter()
+        with open(files[i], "rb") as f:
+            response = await client.post("/ingest", files={"file": (files[i].name, f, "text/plain")}, data={"metadata": "{}"})
+        response.raise_for_status()
+        submit_latencies.append(time.perf_counter() - started)
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"/ingest/{job_id}")).json()
+            if job["status"] == "failed":
+                raise RuntimeError(f"ingestion job failed: {job['error']}")
+            if job["status"] == "succeeded":
+                return
+            await asyncio.sleep(args.poll_interval)
+
+    result = await run_load(len(files), args.ingest_concurrency or args.concurrency, request)
+    result["submit_latency"] = latency_summary(submit_latencies)
+    return result
+
+
+async def bench_ask(client: httpx.AsyncClient, args, rng: random.Random) -> dict:
+    questions = [make_question(rng) for _ in range(args.ask_requests)]
+    first_token = []
+
+    async def ask(i: int) -> None:
+        response = await client.post("/ask", json={"query": questions[i], "filters": {}})
+        response.raise_for_status()
+
+    async def ask_stream(i: int) -> None:
+        started, seen_token = time.perf_counter(), False
+        async with client.stream("POST", "/ask/stream", json={"query": questions[i], "filters": {}}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line == "event: token" and not seen_token:
+                    first_token.append(time.perf_counter() - started)
+                    seen_token = True
+                elif line == "event: error":
+                    raise RuntimeError("stream reported an error")
+
+    result = await run_load(len(questions), args.concurrency, ask_stream if args.stream else ask)
+    if args.stream:
+        result["time_to_first_token"] = latency_summary(first_token)
+    return result
+
+
+# ---------- server ----------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_app(timer: StageTimer, args):
+    """The real app and service graph from src/server.py, with stage timers around the ports and the stub LLM."""
+    from src import server
+    from src.adapters.inbound.rest import create_app
+    from src.config import load_config
+
+    config = load_config()
+    config.qdrant.url = ":memory:"
+    config.retrieval.sparse_index_dir = tempfile.mkdtemp(prefix="bench-sparse-")
+    config.tenants.warm = []
+    components = server.build_components(config, server.load_models(config))
+    components.ingester = TimedIngester(components.ingester, timer)
+    components.retriever = TimedRetriever(components.retriever, timer)
+    components.embedder = TimedEmbedder(components.embedder, timer)
+    components.generator = StubGenerator(timer, latency_ms=args.llm_latency_ms, tokens=args.llm_tokens)
+    if not args.answer_cache:
+        components.answer_cache = None
+    return create_app(rag_service=server.build_rag_service(components, config), config=config)
+
+
+async def serve_app(args, timer: StageTimer):
+    import uvicorn
+
+    app = await asyncio.to_thread(build_app, timer, args)
+    port = args.port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, task
+
+
+# ---------- reporting ----------
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict) -> None:
+    print(f"{'metric':<32}{'baseline':>12}{'current':>12}{'change':>10}")
+    for section in ("ingest", "ask"):
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            old = baseline.get(section, {}).get("latency", {}).get(metric)
+            new = current.get(section, {}).get("latency", {}).get(metric)
+            if old and new:
+                print(f"{section + '.' + metric:<32}{old:>12.1f}{new:>12.1f}{(new - old) / old:>+10.1%}")
+        old = baseline.get(section, {}).get("requests_per_s")
+        new = current.get(section, {}).get("requests_per_s")
+        if old and new:
+            print(f"{section + '.requests_per_s':<32}{old:>12.1f}{new:>12.1f}{(new - old) / old:>+10.1%}")
+
+
+async def main(args) -> dict:
+    timer = StageTimer()
+    server = task = None
+    if args.url:
+        base_url = args.url
+    else:
+        base_url, server, task = await serve_app(args, timer)
+    rng = random.Random(args.seed)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "target": args.url or "in-process (qdrant :memory:, stub LLM)",
+            "args": vars(args),
+        },
+    }
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+            with tempfile.TemporaryDirectory(prefix="bench-docs-") as workdir:
+                if args.ingest_files:
+                    results["ingest"] = await bench_ingest(client, args, rng, Path(workdir))
+            if args.ask_requests:
+                # A few unmeasured requests first, so model and connection warmup is not counted.
+                for _ in range(args.warmup):
+                    await client.post("/ask", json={"query": make_question(rng), "filters": {}})
+                timer.samples.clear()
+                results["ask"] = await bench_ask(client, args, rng)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+    if not args.url:
+        results["stages"] = timer.summary()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of starting one in-process")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ask-requests", type=int, default=200)
+    parser.add_argument("--stream", action="store_true", help="use /ask/stream and report time to first token")
+    parser.add_argument("--ingest-files", type=int, default=20)
+    parser.add_argument("--ingest-concurrency", type=int, default=0, help="defaults to --concurrency")
+    parser.add_argument("--doc-words", type=int, default=2000)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=32)
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(json.dumps({k: v for k, v in results.items() if k != "meta"}, indent=2))
+    if args.baseline:
+        compare(results, json.loads(Path(args.baseline).read_text()))
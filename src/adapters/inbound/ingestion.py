@@ -1,6 +1,18 @@
 from ...domain.ports import IngestionPort
-from ...domain.model import File, BaseDocument
-from typing import Any
+from ...domain.model import File, BaseDocument, SyncPlan
+import asyncio
+import copy
+import hashlib
+import json
+import multiprocessing
+import os
+import tarfile
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Iterator
 from pathlib import Path
 from functools import partial
 from llama_index.core.readers.file.base import default_file_metadata_func
@@ -15,10 +27,20 @@ from llama_index.core.schema import (
 )
 from llama_index.core.ingestion.cache import DEFAULT_CACHE_NAME, IngestionCache
 from datetime import datetime
+from src.core.text_stream import StreamingSentenceChunker, iter_text_blocks
 from src.logger import setup_logger
+from src.tracing import span
 
 logger = setup_logger(__name__)
 
+MANIFEST_DIR = '.manifests'
+# Single manifest written before they were kept per org and directory; read as a fallback for the default org.
+LEGACY_MANIFEST_FILE = '.ingestion_manifest.json'
+CHUNK_ID_NAMESPACE = uuid.UUID('6f1c1f0e-4d1b-4a53-9a43-2f6c3e1b7a10')
+HASH_BLOCK_BYTES = 1 << 20
+# Plain-text formats that can be chunked from a stream instead of loaded whole.
+STREAMABLE_SUFFIXES = ('.txt', '.log', '.md', '.csv', '.tsv', '.jsonl', '.ndjson')
+
 def now() -> str:
     """Returns the current timestamp in ISO format."""
     return datetime.now().isoformat()
@@ -32,40 +54,241 @@ def llamadocs_to_docs(documets:list[Document]) -> list[BaseDocument]:
                 text=doc.text,
                 score= doc.score if hasattr(doc, 'score') else 0,
                 metadata=doc.metadata,
-                embedding=doc.embedding
+                embedding=doc.embedding,
+                start_char_idx=getattr(doc, 'start_char_idx', None),
+                end_char_idx=getattr(doc, 'end_char_idx', None),
             )
         )
     return docs
 
+def file_hash(path: Path) -> str:
+    """sha256 of the file contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source: str, content_hash: str, ordinal: int, offset: int | None) -> str:
+    """
+    Deterministic chunk id: the same file with the same content always yields
+    the same ids. The source path is part of it, so copies of a file never
+    share (and overwrite or delete) each other's chunks.
+    """
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{source}\0{content_hash}:{ordinal}:{offset}"))
+
+def assign_chunk_ids(nodes: list[BaseNode], hashes: dict[str, str]) -> None:
+    """Give nodes ids derived from their source file, its hash and their position. Nodes without a known file keep their id."""
+    # Ordinals count per file, so ids do not depend on which other files share the batch.
+    ordinals: dict[str, int] = {}
+    for node in nodes:
+        source = node.metadata.get('file_path', '')
+        content_hash = hashes.get(source)
+        if content_hash is None:
+            continue
+        ordinal = ordinals.get(source, 0)
+        ordinals[source] = ordinal + 1
+        node.id_ = chunk_id(source, content_hash, ordinal, getattr(node, 'start_char_idx', None))
+
 def add_metadata(input_file: str, x: dict, metadata_fn=default_file_metadata_func, fs=None) -> dict:
     metadata = metadata_fn(file_path=input_file, fs=fs)
     metadata.update(x)
     return metadata
 
 
-def get_documents(filepath: Path, additional_metadata: dict=None, **kwargs) -> list[Document]:
+def get_documents(filepath: Path | list[Path], additional_metadata: dict=None, **kwargs) -> list[Document]:
     metadata_fn = kwargs.pop('file_metadata', default_file_metadata_func)
 
     if additional_metadata:
         metadata_fn = partial(add_metadata, x=additional_metadata, metadata_fn=metadata_fn)
 
-
-    documents = SimpleDirectoryReader(input_files=[filepath.absolute().as_posix()], file_metadata=metadata_fn, **kwargs).load_data()
+    filepaths = filepath if isinstance(filepath, list) else [filepath]
+    input_files = [path.absolute().as_posix() for path in filepaths]
+    documents = SimpleDirectoryReader(input_files=input_files, file_metadata=metadata_fn, **kwargs).load_data()
 
     
     return documents
 
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+def is_archive(path: Path) -> bool:
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+def extract_archive(archive: Path, dest: Path) -> list[Path]:
+    """Extract a zip/tar archive into dest, refusing members that would escape it. Returns the extracted files."""
+    dest.mkdir(parents=True, exist_ok=True)
+    root = dest.resolve()
+    try:
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                for member in zf.infolist():
+                    target = (dest / member.filename).resolve()
+                    if not target.is_relative_to(root):
+                        raise ValueError(f"Unsafe path in archive: {member.filename}")
+                zf.extractall(dest)
+        else:
+            with tarfile.open(archive) as tf:
+                if hasattr(tarfile, 'data_filter'):
+                    tf.extractall(dest, filter='data')
+                else:
+                    # No extraction filters before Python 3.11.4: allow only plain files and directories inside dest.
+                    for member in tf.getmembers():
+                        target = (dest / member.name).resolve()
+                        if not target.is_relative_to(root) or not (member.isfile() or member.isdir()):
+                            raise ValueError(f"Unsafe member in archive: {member.name}")
+                    tf.extractall(dest)
+    except (tarfile.TarError, zipfile.BadZipFile) as e:
+        raise ValueError(f"Invalid archive {archive.name}: {e}") from e
+    files = sorted(p for p in dest.rglob('*') if p.is_file() and not p.name.startswith('.'))
+    logger.debug("Extracted %d files from %s", len(files), archive)
+    return files
+
+def shard_files(paths: list[Path], shards: int) -> list[list[Path]]:
+    """Split files into at most `shards` groups of similar total size (largest first, each to the lightest group)."""
+    groups: list[list[Path]] = [[] for _ in range(max(1, min(shards, len(paths))))]
+    sizes = [0] * len(groups)
+    for path in sorted(paths, key=lambda p: p.stat().st_size, reverse=True):
+        lightest = sizes.index(min(sizes))
+        groups[lightest].append(path)
+        sizes[lightest] += path.stat().st_size
+    return [group for group in groups if group]
+
+# ---------- process-pool workers ----------
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+_spawn_env_lock = threading.Lock()
+
+class _ThreadCappedProcess(multiprocessing.context.SpawnProcess):
+    """
+    Spawned process started with `thread_env` in its environment. The math
+    libraries read these variables once, when the child imports them, which
+    happens while it unpickles its target and before any initializer runs.
+    """
+    thread_env: dict[str, str] = {}
+
+    def start(self) -> None:
+        # The child copies the parent's environment at spawn: set it only for that moment.
+        with _spawn_env_lock:
+            saved = {var: os.environ.get(var) for var in self.thread_env}
+            os.environ.update(self.thread_env)
+            try:
+                super().start()
+            finally:
+                for var, value in saved.items():
+                    if value is None:
+                        os.environ.pop(var, None)
+                    else:
+                        os.environ[var] = value
+
+class ThreadCappedSpawnContext(multiprocessing.context.SpawnContext):
+    """Spawn context whose processes run their math libraries on at most `threads` threads."""
+
+    def __init__(self, threads: int) -> None:
+        super().__init__()
+        self.thread_env = {var: str(threads) for var in THREAD_ENV_VARS}
+
+    def Process(self, *args, **kwargs) -> _ThreadCappedProcess:
+        process = _ThreadCappedProcess(*args, **kwargs)
+        process.thread_env = self.thread_env
+        return process
+
+# Set once per worker process by `_init_worker`, so the pipeline and model are
+# unpickled/loaded once rather than per shard.
+_worker_pipeline: IngestionPipeline | None = None
+_worker_embed_model = None
+
+def _init_worker(transformations: list[Callable[[], TransformComponent]], pipeline_kwargs: dict,
+                 embed_model_factory: Callable[[], Any] | None) -> None:
+    global _worker_pipeline, _worker_embed_model
+    _worker_pipeline = IngestionPipeline(transformations=[factory() for factory in transformations], **pipeline_kwargs)
+    _worker_embed_model = embed_model_factory() if embed_model_factory is not None else None
+
+def _transform_shard(filepaths: list[Path], metadata: dict | None, kwargs: dict) -> list[BaseDocument]:
+    """Hash, read, split (and embed) one shard inside a worker process."""
+    hashes = {path.absolute().as_posix(): file_hash(path) for path in filepaths}
+    docs = get_documents(filepath=filepaths, additional_metadata=metadata, **kwargs)
+    nodes = _worker_pipeline.run(documents=docs)
+    assign_chunk_ids(nodes, hashes)
+    if _worker_embed_model is not None and nodes:
+        # Same text the vector store would embed (content plus embed-visible metadata), in large batches.
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        for node, embedding in zip(nodes, _worker_embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+    return llamadocs_to_docs(nodes)
+
 class LlamaindexIngestionAdapter(IngestionPort):
-    def __init__(self, storage_dir: Path|str, transformations: list[TransformComponent]|None = None, **ingestion_pipeline_kwargs) -> None:
+    """
+    Reads files and runs the transformation chain (splitting, extractors).
+
+    With `workers` > 0, multi-file ingests are sharded by size across a
+    process pool, `shards_per_worker` shards per worker so that uneven files
+    still balance. Every worker runs the whole chain for its shard: hashing,
+    reading, transformations and, with `embed_model_factory`, embedding too.
+    Each worker builds its own transformations from `transformation_factories`
+    (pickling a transformation drops private state such as a splitter's
+    tokenizer) and its own model from the factory, with its math libraries
+    limited to `embed_threads` threads, and embeds in large batches. The
+    factories must be picklable zero-argument callables, e.g. partials.
+    `ingest_stream` yields each shard's chunks as soon as the shard
+    finishes, so the vector store writes while other shards are still being
+    processed.
+
+    Plain-text files of at least `stream_threshold_bytes` never become one
+    Document. With a `stream_chunker`, they are read in blocks of
+    `stream_block_chars` and split lazily, and `ingest_stream` and
+    `sync_stream` yield their chunks in batches of `stream_batch_size`. Since the caller indexes each
+    batch before asking for the next, memory stays bounded whatever the file
+    size.
+    """
+
+    def __init__(self, storage_dir: Path|str, transformations: list[TransformComponent]|None = None,
+                 workers: int = 0, shards_per_worker: int = 4,
+                 transformation_factories: list[Callable[[], TransformComponent]] | None = None,
+                 embed_model_factory: Callable[[], Any] | None = None, embed_threads: int = 1,
+                 stream_chunker: StreamingSentenceChunker | None = None, stream_threshold_bytes: int = 64 << 20,
+                 stream_batch_size: int = 256, stream_block_chars: int = 1 << 20,
+                 **ingestion_pipeline_kwargs) -> None:
         self.storage_dir = Path(storage_dir) if isinstance(storage_dir, str) else storage_dir
         if not self.storage_dir.exists():
             self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self._transformations = transformations or []
+        if transformation_factories is None:
+            # Best effort: hand workers the instances themselves, pickled.
+            transformation_factories = [partial(copy.copy, t) for t in self._transformations]
+        self._transformation_factories = transformation_factories
+        self._pipeline_kwargs = ingestion_pipeline_kwargs
         self._ingestion_pipeline = IngestionPipeline(
-            transformations=transformations or [],
+            transformations=self._transformations,
             **ingestion_pipeline_kwargs
 
         )
-        logger.info("Initialized LlamaindexIngestionAdapter with storage_dir=%s", self.storage_dir)
+        self.workers = workers
+        self.shards_per_worker = shards_per_worker
+        self._embed_model_factory = embed_model_factory
+        self.embed_threads = embed_threads
+        self._pool: ProcessPoolExecutor | None = None
+        self._manifest_lock = threading.Lock()
+        self._stream_chunker = stream_chunker
+        self.stream_threshold_bytes = stream_threshold_bytes
+        self.stream_batch_size = stream_batch_size
+        self.stream_block_chars = stream_block_chars
+        logger.info("Initialized LlamaindexIngestionAdapter with storage_dir=%s workers=%d", self.storage_dir, workers)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: the server process has threads (event loop, ONNX, log listener) that fork would not carry over safely.
+            # Capping the math libraries' thread pools keeps N workers from oversubscribing the cores.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ThreadCappedSpawnContext(self.embed_threads),
+                initializer=_init_worker,
+                initargs=(self._transformation_factories, self._pipeline_kwargs, self._embed_model_factory),
+            )
+        return self._pool
+
+    async def aclose(self) -> None:
+        if self._pool is not None:
+            await asyncio.to_thread(self._pool.shutdown, True, cancel_futures=True)
+            self._pool = None
 
     def _save_file(self, file_obj: Any, original_filename: str) -> Path:
         save_path = self.storage_dir / Path(original_filename).name
@@ -75,18 +298,174 @@ class LlamaindexIngestionAdapter(IngestionPort):
         logger.debug("Saving file: %s", original_filename)
         return save_path
 
-    async def ingest(self, filepath: Path | None = None, metadata:dict|None=None, **kwargs) -> list[BaseDocument]:
-        logger.info("Ingest called with filepath=%s metadata=%s", filepath, metadata)
+    async def ingest(self, filepath: Path | None = None, metadata:dict|None=None, filepaths: list[Path] | None = None, **kwargs) -> list[BaseDocument]:
+        logger.info("Ingest called with filepath=%s filepaths=%s metadata=%s", filepath, len(filepaths or []), metadata)
         """
         Ingest any type of data: file, path, text, etc.
+        `filepaths` ingests many files in one pass so their chunks are embedded together.
         """
+        docs = []
+        # Reading and the transformation chain are synchronous and CPU-bound: off the event loop, or in worker processes.
+        async for batch in self.ingest_stream(filepath=filepath, metadata=metadata, filepaths=filepaths, **kwargs):
+            docs.extend(batch)
+        logger.info("Ingested %d documents", len(docs))
+        return docs
+
+    async def ingest_stream(self, filepath: Path | None = None, metadata: dict | None = None,
+                            filepaths: list[Path] | None = None, **kwargs) -> AsyncIterator[list[BaseDocument]]:
+        """Like `ingest`, but yields chunks shard by shard as workers finish them (one batch without workers)."""
+        paths = [p for p in [filepath, *(filepaths or [])] if p is not None and p.exists()]
+        streamed = [p for p in paths if self._is_streamed(p)]
+        paths = [p for p in paths if p not in streamed]
+        for path in streamed:
+            logger.info("Streaming %s (%d bytes) in batches of %d chunks", path, path.stat().st_size, self.stream_batch_size)
+            chunks = self._stream_file(path, metadata, **kwargs)
+            while batch := await asyncio.to_thread(lambda: list(islice(chunks, self.stream_batch_size))):
+                yield batch
+        if not paths:
+            return
+        if self.workers <= 0 or len(paths) == 1:
+            yield await asyncio.to_thread(self._load_and_transform, paths, metadata, **kwargs)
+            return
+        shards = shard_files(paths, self.workers * self.shards_per_worker)
+        logger.info("Ingesting %d files in %d shards on %d workers", len(paths), len(shards), self.workers)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        pending = [
+            asyncio.wrap_future(pool.submit(_transform_shard, shard, metadata, kwargs), loop=loop)
+            for shard in shards
+        ]
+        try:
+            for done in asyncio.as_completed(pending):
+                yield await done
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _load_and_transform(self, filepaths: list[Path], metadata: dict | None, **kwargs) -> list[BaseDocument]:
+        with span("ingest.hashing"):
+            hashes = {path.absolute().as_posix(): file_hash(path) for path in filepaths}
+        with span("ingest.reading"):
+            docs = get_documents(filepath=filepaths, additional_metadata=metadata, **kwargs)
+        with span("ingest.transform"):
+            nodes = self._ingestion_pipeline.run(documents=docs)
+        assign_chunk_ids(nodes, hashes)
+        return llamadocs_to_docs(nodes)
+
+    def _is_streamed(self, path: Path) -> bool:
+        return (self._stream_chunker is not None and path.name.lower().endswith(STREAMABLE_SUFFIXES)
+                and path.stat().st_size >= self.stream_threshold_bytes)
+
+    def _stream_file(self, path: Path, metadata: dict | None, **kwargs) -> Iterator[BaseDocument]:
+        """Chunks of one plain-text file, read and split lazily. Ids follow the same scheme as `assign_chunk_ids`."""
+        content_hash = file_hash(path)
+        source = path.absolute().as_posix()
+        metadata_fn = kwargs.get('file_metadata', default_file_metadata_func)
+        file_metadata = add_metadata(source, metadata or {}, metadata_fn=metadata_fn)
+        blocks = iter_text_blocks(path, self.stream_block_chars, encoding=kwargs.get('encoding', 'utf-8'))
+        for ordinal, chunk in enumerate(self._stream_chunker.chunks(blocks)):
+            yield BaseDocument(
+                id=chunk_id(source, content_hash, ordinal, chunk.start_char_idx),
+                text=chunk.text,
+                score=0,
+                metadata=dict(file_metadata),
+                embedding=None,
+                start_char_idx=chunk.start_char_idx,
+                end_char_idx=chunk.end_char_idx,
+            )
+
+    def _sync_chunks(self, plan: SyncPlan, metadata: dict | None, **kwargs) -> Iterator[BaseDocument]:
+        """Chunks of the plan's new and changed files, one file at a time, recording their ids in the plan's manifest."""
+        for key in [*plan.added, *plan.changed]:
+            path = Path(key)
+            if self._is_streamed(path):
+                chunks = self._stream_file(path, metadata, **kwargs)
+            else:
+                chunks = self._load_and_transform([path], metadata, **kwargs)
+            chunk_ids = plan.manifest[key]['chunk_ids']
+            for doc in chunks:
+                chunk_ids.append(doc.id)
+                yield doc
 
-        if filepath is not None and filepath.exists():
-            logger.debug("Filepath exists: %s", filepath)
-            docs = get_documents(filepath=filepath,additional_metadata=metadata, **kwargs)
-            docs = self._ingestion_pipeline.run(documents=docs)
-            logger.info("Ingested %d documents", len(docs))
-            return docs
+    # ---------- incremental sync ----------
+
+    def manifest_path(self, root: Path, org_id: str | None = None) -> Path:
+        """One manifest per (org, synced directory): tenants and directories never see each other's state."""
+        key = hashlib.sha256(f"{org_id or ''}\0{root.as_posix()}".encode()).hexdigest()[:32]
+        return self.storage_dir / MANIFEST_DIR / f"{key}.json"
+
+    def load_manifest(self, root: Path, org_id: str | None = None) -> dict:
+        """{absolute path: {"hash": sha256, "chunk_ids": [...]}} of everything under `root` already indexed for the org."""
+        path = self.manifest_path(root, org_id)
+        if path.exists():
+            return json.loads(path.read_text())
+        legacy = self.storage_dir / LEGACY_MANIFEST_FILE
+        if org_id is None and legacy.exists():
+            prefix = root.as_posix().rstrip('/') + '/'
+            return {key: entry for key, entry in json.loads(legacy.read_text()).items() if key.startswith(prefix)}
+        return {}
+
+    async def sync(self, directory: Path | str | None = None, metadata: dict | None = None,
+                   org_id: str | None = None, **kwargs) -> SyncPlan:
+        """
+        Diff `directory` (default: storage_dir) against the org's manifest for
+        it, by content hash. Nothing is parsed here: `sync_stream` reads the
+        new and changed files. Chunk ids derive from the content hash, so
+        every chunk of a removed or changed file is returned as stale.
+        """
+        root = (Path(directory) if directory is not None else self.storage_dir).absolute()
+        return await asyncio.to_thread(self._plan_sync, root, metadata, org_id, **kwargs)
+
+    def _plan_sync(self, root: Path, metadata: dict | None, org_id: str | None, **kwargs) -> SyncPlan:
+        previous = self.load_manifest(root, org_id)
+        manifest: dict = {}
+        stale_ids: list[str] = []
+        added, changed = [], []
+        unchanged = 0
+        # Hidden files and directories (manifests among them) are not content.
+        for path in sorted(p for p in root.rglob('*')
+                           if p.is_file() and not any(part.startswith('.') for part in p.relative_to(root).parts)):
+            key = path.as_posix()
+            content_hash = file_hash(path)
+            entry = previous.get(key)
+            if entry is not None and entry['hash'] == content_hash:
+                manifest[key] = entry
+                unchanged += 1
+                continue
+            if entry is not None:
+                changed.append(key)
+                stale_ids.extend(entry['chunk_ids'])
+            else:
+                added.append(key)
+            # Filled in by sync_stream.
+            manifest[key] = {'hash': content_hash, 'chunk_ids': []}
+        removed = [key for key in previous if key not in manifest]
+        for key in removed:
+            stale_ids.extend(previous[key]['chunk_ids'])
+        logger.info("Sync plan for %s: %d added, %d changed, %d removed, %d unchanged",
+                    root, len(added), len(changed), len(removed), unchanged)
+        return SyncPlan(stale_ids=stale_ids, added=added, changed=changed,
+                        removed=removed, unchanged=unchanged, manifest=manifest,
+                        manifest_key=self.manifest_path(root, org_id).as_posix())
+
+    async def sync_stream(self, plan: SyncPlan, metadata: dict | None = None, directory: Path | str | None = None,
+                          **kwargs) -> AsyncIterator[list[BaseDocument]]:
+        """
+        Chunks of the plan's new and changed files in batches of at most
+        `stream_batch_size`. Files are read one at a time, large text files
+        lazily, and the caller indexes each batch before the next is read.
+        """
+        chunks = self._sync_chunks(plan, metadata, **kwargs)
+        while batch := await asyncio.to_thread(lambda: list(islice(chunks, self.stream_batch_size))):
+            yield batch
 
-        return []
+    def commit_sync(self, plan: SyncPlan) -> None:
+        """Persist the manifest once the plan has been applied to the index."""
+        path = Path(plan.manifest_key)
+        with self._manifest_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Unique temp name: other server processes may commit the same manifest.
+            tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_text(json.dumps(plan.manifest))
+            os.replace(tmp, path)
 
@@ -1,98 +1,412 @@
-from fastapi import FastAPI, UploadFile, File as FastAPIFile, Form
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Awaitable, Callable
+from fastapi import APIRouter, FastAPI, UploadFile, File as FastAPIFile, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 from ...domain.ports import AskQuestionPort, IngestionPort, Answer
-from ...domain.model import Citation
+from ...domain.model import Citation, Question
 from src.application.rag_service import RagService
+from src.application.admission import AdmissionRejected
+from src.application.ingestion_jobs import IngestionJobQueue, IngestionJob, QueueFullError
+from src.application.tenants import ORG_ID_PATTERN
+from src.config import AppConfig, load_config
+from src import tracing
+from src.logger import setup_logger
 from pathlib import Path
-app = FastAPI()
+import ast
+import json
+import shutil
+import time
+import uuid
 
-from src.adapters.outbound.retriever_llamaindex import LlamaindexRetriever
-from src.adapters.outbound.generator_openai import LitellmGenerator
-from src.application.rag_service import RagService
-from src.adapters.inbound.ingestion import LlamaindexIngestionAdapter
-from llama_index.core.indices import VectorStoreIndex
-import logging
-import sys
-import os
-from llama_index.core.extractors import (
-    TitleExtractor,
-    KeywordExtractor,
-    QuestionsAnsweredExtractor,
-)
-from llama_index.core.node_parser import SemanticSplitterNodeParser, SentenceSplitter
-
-import qdrant_client
-from IPython.display import Markdown, display
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
-from llama_index.core import StorageContext
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.core.vector_stores.types import BasePydanticVectorStore
-from llama_index.embeddings.fastembed import FastEmbedEmbedding
-from llama_index.core import Settings
-from src.adapters.llamaindex_utils import get_qdrant_vector_store, get_vectorstore_index
-from src.logger import setup_logger
+# Heavy dependencies (models, vector store clients, LLM SDK) are not imported
+# here: the service is built by `startup` (see src/server.py) in the lifespan
+# hook, or handed in ready-made.
 
-Settings.embed_model = FastEmbedEmbedding(model_name="BAAI/bge-base-en-v1.5", cache_dir='./fastembed_weights')
-
-url=os.getenv('QDRANT_DB_URL')
-api_key=os.getenv('QDRANT_API_KEY')
-url = 'http://localhost:6333'
-vector_store = get_qdrant_vector_store(url=url, api_key=api_key, collection_name='rag_collection')
-index = get_vectorstore_index(vector_store=vector_store)
-
-transformations=[
-    # SemanticSplitterNodeParser(embed_model=Settings.embed_model), 
-                #  QuestionsAnsweredExtractor(),
-    SentenceSplitter(chunk_size=312, chunk_overlap=50),
-                 ] 
-rag_service = RagService(
-    retriever=LlamaindexRetriever(index=index),
-    generator=LitellmGenerator(),
-    ingester=LlamaindexIngestionAdapter(storage_dir='ingestion_files', transformations=transformations),
-)
+UPLOAD_CHUNK_BYTES = 1 << 20
+MAX_BATCH_QUESTIONS = 1000
 
 logger = setup_logger(__name__)
 
+router = APIRouter()
+
+
+async def run_ingestion_job(rag_service: RagService, job: IngestionJob) -> dict:
+    if job.params.get("mode") == "sync":
+        params = {k: v for k, v in job.params.items() if k != "mode"}
+        return await rag_service.sync(progress=job.report, **params)
+    started = time.perf_counter()
+    chunks = await rag_service.ingest(progress=job.report, **job.params)
+    elapsed = time.perf_counter() - started
+    files = len(job.params.get("filepaths") or []) + (1 if job.params.get("filepath") else 0)
+    result = {
+        "files": files,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "docs_per_s": round(files / elapsed, 2) if elapsed else None,
+        "chunks_per_s": round(chunks / elapsed, 2) if elapsed else None,
+    }
+    logger.info("Ingestion job %s throughput: %s", job.id, result)
+    return result
+
+
+def create_app(rag_service: RagService | None = None,
+               startup: Callable[[], Awaitable[RagService]] | None = None,
+               config: AppConfig | None = None) -> FastAPI:
+    """
+    Build the FastAPI app around a RagService: either a ready one, or an
+    async `startup()` that builds it (model loading, warmup, clients) inside
+    the lifespan hook. The process can then bind its port and fork workers
+    without paying for it at import time.
+    """
+    if rag_service is None and startup is None:
+        raise ValueError("create_app needs a rag_service or a startup builder")
+    config = config or load_config()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        started = time.perf_counter()
+        service = rag_service or await startup()
+        app.state.rag_service = service
+        app.state.storage_dir = Path(config.ingestion.storage_dir)
+        app.state.ingestion_jobs = IngestionJobQueue(
+            partial(run_ingestion_job, service),
+            concurrency=config.ingestion.concurrency,
+            max_queue=config.ingestion.queue_size,
+        )
+        activity_file = config.tenants.activity_file or str(app.state.storage_dir / ".tenant_activity.json")
+        if service.tenants is not None:
+            warm = list(config.tenants.warm)
+            if config.tenants.warm_active:
+                warm += service.tenants.load_activity(activity_file)[:config.tenants.warm_active]
+            if warm:
+                await service.tenants.warm(warm)
+        logger.info("Application ready in %.2fs", time.perf_counter() - started)
+        yield
+        await app.state.ingestion_jobs.shutdown()
+        if service.tenants is not None:
+            if config.tenants.warm_active:
+                try:
+                    service.tenants.save_activity(activity_file, config.tenants.warm_active)
+                except OSError as e:
+                    logger.error("Failed to save tenant activity: %s", e)
+            await service.tenants.close()
+        await service.aclose()
+
+    app = FastAPI(lifespan=lifespan)
+    app.middleware("http")(correlation_and_metrics)
+    app.add_exception_handler(AdmissionRejected, admission_rejected_handler)
+    app.include_router(router)
+    return app
+
+
+async def correlation_and_metrics(request: Request, call_next):
+    """Bind a request id (from X-Request-ID or fresh) for logs/spans, and record per-route latency."""
+    request_id = request.headers.get("x-request-id") or tracing.new_request_id()
+    token = tracing.set_request_id(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        tracing.reset_request_id(token)
+        if tracing.is_enabled():
+            # Templated path (e.g. /ingest/{job_id}) so label cardinality stays bounded.
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            tracing.HTTP_SECONDS.observe(time.perf_counter() - started, request.method, route)
+            tracing.HTTP_REQUESTS.inc(request.method, route, str(status))
+
+
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    """Overload answers fast with 429 (stage queue full) or 503 (waited too long) and a Retry-After."""
+    return JSONResponse(
+        status_code=exc.status,
+        content={"error": str(exc), "stage": exc.stage},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+async def save_upload(file: UploadFile, save_path: Path) -> Path:
+    """Stream an upload to disk in fixed-size chunks instead of reading it into memory."""
+    with open(save_path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            f.write(chunk)
+    return save_path
+
+def parse_metadata(metadata: str) -> dict:
+    """JSON object, or a Python dict literal as the Streamlit client sends it. Never evaluated as code."""
+    try:
+        try:
+            metadata_dict = json.loads(metadata)
+        except ValueError:
+            metadata_dict = ast.literal_eval(metadata)
+        logger.debug("Parsed metadata: %s", metadata_dict)
+        if not isinstance(metadata_dict, dict):
+            metadata_dict = {}
+    except Exception:
+        logger.error("Failed to parse metadata: %s", metadata)
+        metadata_dict = {}
+    return metadata_dict
+
+def queue_ingestion(request: Request, **params):
+    try:
+        job = request.app.state.ingestion_jobs.submit(**params)
+    except QueueFullError as e:
+        logger.error("Rejecting ingestion: %s", e)
+        return JSONResponse(status_code=429, content={"error": str(e)}, headers={"Retry-After": "5"})
+    return {"status": "queued", "job_id": job.id}
+
 class AskRequest(BaseModel):
     query: str
     filters: dict
+    org_id: str | None = Field(None, pattern=ORG_ID_PATTERN)
 
 class AnswerDTO(BaseModel):
     text: str
     citations: list[Citation]
 
-@app.post("/ask", response_model=AnswerDTO)
-async def ask_endpoint(req: AskRequest) -> AnswerDTO:
+@router.post("/ask", response_model=AnswerDTO)
+async def ask_endpoint(req: AskRequest, request: Request) -> AnswerDTO:
     logger.info("Received ask request: %s", req)
-    answer: Answer = await rag_service.ask(req.query, filters=req.filters)
+    rag_service: RagService = request.app.state.rag_service
+    answer: Answer = await rag_service.ask(req.query, filters=req.filters, org_id=req.org_id)
     logger.debug("Answer generated: %s", answer)
     return AnswerDTO(**answer.__dict__)
 
-@app.post("/ingest")
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/ask/stream")
+async def ask_stream_endpoint(req: AskRequest, request: Request) -> StreamingResponse:
+    """Server-Sent Events: one `citations` event, then `token` events, then `done`."""
+    logger.info("Received streaming ask request: %s", req)
+    rag_service: RagService = request.app.state.rag_service
+    stream = rag_service.ask_stream(req.query, filters=req.filters, org_id=req.org_id)
+    # Run up to the first event (embedding, retrieval) before committing to a 200,
+    # so admission rejections still become a 429/503 with Retry-After.
+    first, first_error = None, None
+    try:
+        first = await anext(stream)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        first_error = e
+
+    async def replay():
+        if first_error is not None:
+            raise first_error
+        yield first
+        async for event in stream:
+            yield event
+
+    async def events():
+        try:
+            async for event in replay():
+                if event.type == "citations":
+                    yield _sse("citations", [c.__dict__ for c in event.data])
+                elif event.type == "token":
+                    yield _sse("token", {"text": event.data})
+                elif event.type == "done":
+                    yield _sse("done", {})
+        except Exception as e:
+            logger.error("Streaming ask failed: %s", e)
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class AskBatchRequest(BaseModel):
+    questions: list[AskRequest]
+    # Capped at generator.batch_concurrency by the service.
+    max_concurrency: int | None = Field(None, ge=1)
+
+@router.post("/ask/batch")
+async def ask_batch_endpoint(req: AskBatchRequest, request: Request) -> StreamingResponse:
+    """
+    Newline-delimited JSON, one line per question in completion order:
+    {"index", "text", "citations"} or {"index", "error"}.
+    """
+    logger.info("Received batch ask request with %d questions", len(req.questions))
+    if len(req.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+    rag_service: RagService = request.app.state.rag_service
+    questions = [Question(text=q.query, filters=q.filters, org_id=q.org_id) for q in req.questions]
+
+    results = rag_service.ask_batch(questions, max_concurrency=req.max_concurrency)
+    # Run up to the first result (query embedding, cache lookups) before committing to a 200,
+    # so an embedding admission rejection still becomes a 429/503 with Retry-After.
+    first, first_error = None, None
+    try:
+        first = await anext(results)
+    except AdmissionRejected:
+        raise
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        first_error = e
+
+    async def replay():
+        if first_error is not None:
+            raise first_error
+        if first is None:
+            return
+        yield first
+        async for result in results:
+            yield result
+
+    async def lines():
+        unanswered = set(range(len(questions)))
+        try:
+            async for result in replay():
+                unanswered.discard(result.index)
+                if result.answer is not None:
+                    data = {"index": result.index, "text": result.answer.text,
+                            "citations": [c.__dict__ for c in result.answer.citations]}
+                else:
+                    data = {"index": result.index, "error": result.error}
+                yield json.dumps(data) + "\n"
+        except Exception as e:
+            # The status is already sent: still give every question its line.
+            logger.error("Batch ask failed: %s", e)
+            for index in sorted(unanswered):
+                yield json.dumps({"index": index, "error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get("/cache/stats")
+async def cache_stats_endpoint(request: Request) -> dict:
+    rag_service: RagService = request.app.state.rag_service
+    cache = rag_service.answer_cache
+    retriever_stats = getattr(await rag_service.get_retriever(), "cache_stats", None)
+    embedding_cache = getattr(getattr(rag_service.embedder, "embed_model", None), "cache", None)
+    return {
+        "answers": cache.stats() if cache is not None else {},
+        "retrievers": retriever_stats() if retriever_stats is not None else {},
+        "embeddings": embedding_cache.stats() if embedding_cache is not None else {},
+    }
+
+@router.get("/metrics")
+async def metrics_endpoint() -> PlainTextResponse:
+    """Prometheus scrape target: stage and HTTP latency histograms, counters."""
+    return PlainTextResponse(tracing.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@router.get("/admission/stats")
+async def admission_stats_endpoint(request: Request) -> dict:
+    admission = request.app.state.rag_service.admission
+    return admission.stats() if admission is not None else {}
+
+@router.get("/tenants/stats")
+async def tenant_stats_endpoint(request: Request) -> dict:
+    tenants = request.app.state.rag_service.tenants
+    return tenants.stats() if tenants is not None else {}
+
+@router.get("/interactions/stats")
+async def interaction_stats_endpoint(request: Request) -> dict:
+    stats = getattr(request.app.state.rag_service.interactions, "stats", None)
+    return stats() if stats is not None else {}
+
+@router.post("/ingest", status_code=202)
 async def ingest_endpoint(
+    request: Request,
     file: UploadFile = FastAPIFile(...),
-    metadata: str = Form("{}")
+    metadata: str = Form("{}"),
+    org_id: str | None = Form(None, pattern=ORG_ID_PATTERN),
 ):
     logger.info("Received ingest request for file: %s", file.filename)
     if file.content_type != "text/plain":
-        return {"error": "Only text files are supported."}
-    
+        raise HTTPException(status_code=415, detail="Only text files are supported.")
+
     # Save file to disk using Path
-    save_dir = Path("ingestion_files")
+    save_dir: Path = request.app.state.storage_dir
     save_dir.mkdir(parents=True, exist_ok=True)
-    save_path = save_dir / Path(file.filename)
-    with open(save_path, "wb") as f:
-        f.write(await file.read())
+    save_path = save_dir / Path(file.filename).name
+    await save_upload(file, save_path)
     # Parse metadata string to dict
+    metadata_dict = parse_metadata(metadata)
+    # Hand the file to the background job queue; parsing and embedding happen off the request path
+    response = queue_ingestion(request, filepath=save_path, metadata=metadata_dict, org_id=org_id)
+    logger.info("Ingestion queued for file: %s", save_path)
+    return response
+
+@router.post("/ingest/bulk", status_code=202)
+async def ingest_bulk_endpoint(
+    request: Request,
+    files: list[UploadFile] = FastAPIFile(...),
+    metadata: str = Form("{}"),
+    org_id: str | None = Form(None, pattern=ORG_ID_PATTERN),
+):
+    """
+    Ingest many files (and/or zip/tar archives) as one job, so chunks from all
+    files are embedded and upserted in shared batches.
+    """
+    from src.adapters.inbound.ingestion import is_archive, extract_archive
+
+    logger.info("Received bulk ingest request with %d uploads", len(files))
+    save_dir: Path = request.app.state.storage_dir
+    save_dir.mkdir(parents=True, exist_ok=True)
+    filepaths: list[Path] = []
+    # Directories created for this request; removed unless the job is queued.
+    staged: list[Path] = []
+    queued = False
     try:
-        metadata_dict = eval(metadata)
-        logger.debug("Parsed metadata: %s", metadata_dict)
-        if not isinstance(metadata_dict, dict):
-            metadata_dict = {}
-    except Exception:
-        logger.error("Failed to parse metadata: %s", metadata)
-        metadata_dict = {}
-    # Pass file path and metadata to rag_service.ingest
-    await rag_service.ingest(filepath=save_path, metadata=metadata_dict)
-    logger.info("Ingestion completed for file: %s", save_path)
-    return {"status": "success"}
+        for file in files:
+            # Each upload gets its own staging directory: uploads sharing a filename must not overwrite each other.
+            upload_dir = save_dir / f"upload-{uuid.uuid4().hex[:12]}"
+            upload_dir.mkdir()
+            staged.append(upload_dir)
+            save_path = upload_dir / Path(file.filename).name
+            await save_upload(file, save_path)
+            if is_archive(save_path):
+                extract_dir = save_dir / f"{save_path.name.split('.')[0]}-{uuid.uuid4().hex[:8]}"
+                staged.append(extract_dir)
+                try:
+                    filepaths.extend(extract_archive(save_path, extract_dir))
+                except (ValueError, OSError) as e:
+                    raise HTTPException(status_code=400, detail=f"Could not extract {file.filename}: {e}")
+                finally:
+                    save_path.unlink(missing_ok=True)
+                    upload_dir.rmdir()
+            else:
+                filepaths.append(save_path)
+        if not filepaths:
+            raise HTTPException(status_code=400, detail="No files to ingest")
+        response = queue_ingestion(request, filepaths=filepaths, metadata=parse_metadata(metadata), org_id=org_id)
+        queued = not isinstance(response, JSONResponse)
+    finally:
+        if not queued:
+            for directory in staged:
+                shutil.rmtree(directory, ignore_errors=True)
+    logger.info("Bulk ingestion queued for %d files", len(filepaths))
+    return response
+
+class SyncRequest(BaseModel):
+    directory: str | None = None
+    metadata: dict = {}
+    org_id: str | None = Field(None, pattern=ORG_ID_PATTERN)
+
+@router.post("/ingest/sync", status_code=202)
+async def ingest_sync_endpoint(req: SyncRequest, request: Request):
+    """Re-index only what changed in a directory under ingestion_files (default: all of it) since the last sync."""
+    logger.info("Received sync request for directory: %s", req.directory)
+    root = request.app.state.storage_dir.resolve()
+    directory = (root / req.directory).resolve() if req.directory else root
+    # Only the ingestion storage may be indexed: anything else could be read back through /ask.
+    if not directory.is_relative_to(root):
+        raise HTTPException(status_code=400, detail="directory must be inside the ingestion storage directory")
+    if not directory.is_dir():
+        raise HTTPException(status_code=404, detail=f"No such directory: {req.directory}")
+    return queue_ingestion(request, mode="sync", directory=directory, metadata=req.metadata, org_id=req.org_id)
+
+@router.get("/ingest/{job_id}")
+async def ingest_status_endpoint(job_id: str, request: Request) -> dict:
+    job = request.app.state.ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return job.to_dict()
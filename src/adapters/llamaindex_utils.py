@@ -1,4 +1,5 @@
 from llama_index.core.indices import VectorStoreIndex
+import asyncio
 import os
 import qdrant_client
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
@@ -6,6 +7,8 @@ from llama_index.core import StorageContext
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from qdrant_client import AsyncQdrantClient
+from src.application.tenants import validate_org_id
+from src.core.bm25_index import BM25Index, STATE_FILE as BM25_STATE_FILE
 from src.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -15,19 +18,28 @@ def get_qdrant_vector_store(
     url: str,
     collection_name: str,
     api_key: str | None = None,
+    enable_hybrid: bool = False,
 ) -> BasePydanticVectorStore:
-    client = qdrant_client.QdrantClient(
-        
-        # location=":memory:",
-        api_key=api_key or os.getenv('QDRANT_API_KEY'), url=url,
-        # check_compatibility=False
-    )
-    aclient = qdrant_client.AsyncQdrantClient(
-        # location=":memory:",
-        api_key=api_key or os.getenv('QDRANT_API_KEY'), url=url,
-        # check_compatibility=False
-    )
-    vector_store = QdrantVectorStore(client=client,aclient=aclient, collection_name=collection_name, enable_hybrid=True,)
+    """
+    Qdrant store for one collection. Keyword matching is served in-process by
+    BM25Index, so Qdrant's server-side hybrid mode (and its extra sparse
+    model) is off unless `enable_hybrid` asks for it.
+
+    `url=":memory:"` gives an embedded in-process Qdrant (tests, benchmarks).
+    Its sync and async clients do not share data; the app only goes through
+    the async one.
+    """
+    if url == ":memory:":
+        client = qdrant_client.QdrantClient(location=":memory:")
+        aclient = qdrant_client.AsyncQdrantClient(location=":memory:")
+    else:
+        client = qdrant_client.QdrantClient(
+            api_key=api_key or os.getenv('QDRANT_API_KEY'), url=url,
+        )
+        aclient = qdrant_client.AsyncQdrantClient(
+            api_key=api_key or os.getenv('QDRANT_API_KEY'), url=url,
+        )
+    vector_store = QdrantVectorStore(client=client,aclient=aclient, collection_name=collection_name, enable_hybrid=enable_hybrid,)
     return vector_store
 
 def get_vectorstore_index(vector_store:BasePydanticVectorStore)-> VectorStoreIndex:
@@ -40,4 +52,45 @@ def get_vectorstore_index(vector_store:BasePydanticVectorStore)-> VectorStoreInd
     )
 
     logger.debug("Index created")
-    return index
\ No newline at end of file
+    return index
+
+def get_sparse_index(persist_dir: str | None = None) -> BM25Index:
+    """BM25 index, loaded from `persist_dir` when one has been saved there."""
+    sparse_index = BM25Index()
+    if persist_dir and os.path.exists(os.path.join(persist_dir, BM25_STATE_FILE)):
+        sparse_index.load(persist_dir)
+    return sparse_index
+
+def tenant_collection_name(prefix: str, org_id: str) -> str:
+    """Collection for one organisation. Org ids are used as they are (never rewritten, so never merged)."""
+    return f"{prefix}_{validate_org_id(org_id)}"
+
+def make_tenant_retriever_factory(url: str, collection_prefix: str, api_key: str | None = None,
+                                  sparse_dir: str | None = None, enable_hybrid: bool = False, **retriever_kwargs):
+    """
+    Async factory for TenantRegistry: builds a Qdrant-backed LlamaindexRetriever
+    on the org's own collection. Client construction does blocking I/O, so it
+    runs on a thread and several tenants can load concurrently. With
+    `sparse_dir`, each tenant also gets its own BM25 index under that directory.
+    """
+    from src.adapters.outbound.retriever_llamaindex import LlamaindexRetriever
+
+    def build(org_id: str) -> LlamaindexRetriever:
+        collection_name = tenant_collection_name(collection_prefix, org_id)
+        vector_store = get_qdrant_vector_store(
+            url=url,
+            api_key=api_key,
+            collection_name=collection_name,
+            enable_hybrid=enable_hybrid,
+        )
+        index = get_vectorstore_index(vector_store=vector_store)
+        if sparse_dir is None:
+            return LlamaindexRetriever(index=index, **retriever_kwargs)
+        persist_dir = os.path.join(sparse_dir, collection_name)
+        return LlamaindexRetriever(index=index, sparse_index=get_sparse_index(persist_dir),
+                                   sparse_persist_dir=persist_dir, **retriever_kwargs)
+
+    async def factory(org_id: str) -> LlamaindexRetriever:
+        return await asyncio.to_thread(build, org_id)
+
+    return factory
\ No newline at end of file
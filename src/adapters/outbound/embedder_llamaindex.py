@@ -0,0 +1,211 @@
+import asyncio
+from typing import Callable, List
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from src.core.embedding_cache import EmbeddingCache, normalize_text
+from ...domain.ports import EmbeddingPort
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def build_embed_model(model_name: str, cache_dir: str | None = None, batch_size: int = 256, threads: int | None = None,
+                      vector_cache_dir: str = "", vector_cache_mb: int = 256) -> BaseEmbedding:
+    """
+    FastEmbed model, behind the persistent EmbeddingCache when `vector_cache_dir`
+    is set. Module-level and argument-only, so a functools.partial of it can be
+    sent to ingestion worker processes to build their own copy.
+    """
+    from llama_index.embeddings.fastembed import FastEmbedEmbedding
+
+    embed_model = FastEmbedEmbedding(
+        model_name=model_name, cache_dir=cache_dir, embed_batch_size=batch_size, threads=threads,
+    )
+    if vector_cache_dir:
+        cache = EmbeddingCache(vector_cache_dir, model_name=model_name, max_bytes=vector_cache_mb << 20)
+        embed_model = CachedEmbedding(embed_model, cache)
+    return embed_model
+
+
+def query_embeddings(model: BaseEmbedding, texts: list[str]) -> list[List[float]]:
+    """Embed a batch of queries in as few model calls as the model allows. Blocking."""
+    batched = getattr(model, "get_query_embeddings", None)
+    if batched is not None:
+        return batched(texts)
+    # FastEmbedEmbedding only exposes single-query embedding; go to the
+    # underlying fastembed model so the whole batch is one ONNX run.
+    fastembed_model = getattr(model, "_model", None)
+    if fastembed_model is not None and hasattr(fastembed_model, "query_embed"):
+        return [vector.tolist() for vector in fastembed_model.query_embed(texts)]
+    return [model.get_query_embedding(text) for text in texts]
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    An embed model behind the persistent, content-addressed EmbeddingCache.
+
+    It stands in for the wrapped model everywhere (Settings.embed_model, the
+    index, the query embedders). Document and query embeddings are looked up
+    by the hash of their normalized text, and only the misses reach the
+    model, in one batch. Chunks repeated across documents and runs, and
+    repeated questions, are therefore embedded once per cache lifetime,
+    across all workers sharing the cache directory.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, **kwargs) -> None:
+        super().__init__(model_name=embed_model.model_name, embed_batch_size=embed_model.embed_batch_size, **kwargs)
+        self._inner = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _through_cache(self, texts: list[str], kind: str,
+                       embed: Callable[[list[str]], list[List[float]]]) -> list[List[float]]:
+        vectors, hits = self._cache.get_many(texts, kind)
+        if hits < len(texts):
+            # Misses that normalize to the same text are embedded once.
+            missing: dict[str, list[int]] = {}
+            for i, vector in enumerate(vectors):
+                if vector is None:
+                    missing.setdefault(normalize_text(texts[i]), []).append(i)
+            unique = [texts[indices[0]] for indices in missing.values()]
+            computed = embed(unique)
+            self._cache.put_many(unique, kind, computed)
+            for indices, vector in zip(missing.values(), computed):
+                for i in indices:
+                    vectors[i] = list(vector)
+        return vectors
+
+    def get_query_embeddings(self, texts: list[str]) -> list[List[float]]:
+        return self._through_cache(texts, "query", lambda misses: query_embeddings(self._inner, misses))
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.get_query_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        vectors, hits = self._cache.get_many([query], "query")
+        if hits:
+            return vectors[0]
+        vector = await self._inner.aget_query_embedding(query)
+        self._cache.put_many([query], "query", [vector])
+        return vector
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._through_cache(texts, "text", self._inner.get_text_embedding_batch)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+
+class LlamaindexEmbedder(EmbeddingPort):
+    """Query embeddings from a LlamaIndex embed model (defaults to Settings.embed_model)."""
+
+    def __init__(self, embed_model: BaseEmbedding | None = None) -> None:
+        self._embed_model = embed_model
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model or Settings.embed_model
+
+    async def embed_query(self, text: str) -> List[float]:
+        return await self.embed_model.aget_query_embedding(text)
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries in one model call on a worker thread."""
+        return await asyncio.to_thread(self._embed_batch, texts)
+
+    def _embed_batch(self, texts: list[str]) -> list[List[float]]:
+        return query_embeddings(self.embed_model, texts)
+
+
+class MicroBatchingEmbedder(LlamaindexEmbedder):
+    """
+    Coalesces concurrent `embed_query` calls into one model call.
+
+    Queries arriving within `max_wait_ms` of each other (up to
+    `max_batch_size`) are embedded together in a worker thread, and each
+    caller's future is resolved with its own vector. `max_concurrency` bounds
+    how many batches run at once so they do not fight over cores; queries
+    that arrive while a batch is running simply join the next one.
+    """
+
+    def __init__(self,
+                 embed_model: BaseEmbedding | None = None,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 max_concurrency: int = 1) -> None:
+        super().__init__(embed_model)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._max_concurrency = max_concurrency
+        self._semaphore: asyncio.Semaphore | None = None
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        logger.info("Initialized MicroBatchingEmbedder max_batch_size=%d max_wait_ms=%s", max_batch_size, max_wait_ms)
+
+    async def embed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """A caller-supplied batch skips the coalescing window but shares the concurrency limit."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            return await asyncio.to_thread(self._embed_batch, texts)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        texts = [text for text, _ in batch]
+        try:
+            async with self._semaphore:
+                vectors = await asyncio.to_thread(self._embed_batch, texts)
+        except Exception as e:
+            logger.error("Batched query embedding failed for %d queries: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        logger.debug("Embedded batch of %d queries", len(batch))
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+from llama_index.core.vector_stores.types import MetadataFilters, MetadataFilter, FilterOperator
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def canonical_key(value: Any) -> Hashable:
+    """
+    One hashable key per filter, independent of dict ordering. Scalars carry
+    their type so that 1, True and "1" do not collide.
+    """
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted((str(k), canonical_key(v)) for k, v in value.items())))
+    if isinstance(value, (list, tuple)):
+        return ("list", tuple(canonical_key(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted(canonical_key(v) for v in value)))
+    return (type(value).__name__, value)
+
+
+def _flatten(filters: dict, prefix: str = "") -> list[tuple[str, Any]]:
+    items = []
+    for key, value in filters.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.extend(_flatten(value, prefix=f"{path}."))
+        else:
+            items.append((path, value))
+    return items
+
+
+def compile_filters(filters: dict | None) -> MetadataFilters | None:
+    """
+    Plain filter dict -> MetadataFilters. Nested dicts become dotted keys
+    ({"author": {"name": "x"}} -> author.name == "x"); list/set values become IN.
+    """
+    if not filters:
+        return None
+    compiled = []
+    for key, value in _flatten(filters):
+        if isinstance(value, (list, tuple, set, frozenset)):
+            compiled.append(MetadataFilter(key=key, value=list(value), operator=FilterOperator.IN))
+        else:
+            compiled.append(MetadataFilter(key=key, value=value))
+    return MetadataFilters(filters=compiled)
+
+
+class RetrieverCache:
+    """
+    LRU cache of retrievers keyed by the canonical form of their filter dict,
+    so each MetadataFilters is compiled and each retriever built only once.
+    """
+
+    def __init__(self, build: Callable[[MetadataFilters | None], Any], max_size: int = 1024) -> None:
+        self._build = build
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, filters: dict | None) -> Any:
+        key = canonical_key(filters or {})
+        retriever = self._entries.get(key)
+        if retriever is not None:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return retriever
+        self._misses += 1
+        retriever = self._build(compile_filters(filters))
+        self._entries[key] = retriever
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+        logger.debug("Built retriever for filters: %s", filters)
+        return retriever
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+        }
@@ -1,18 +1,20 @@
-from typing import List
+from typing import AsyncIterator, List
 import openai
 from ...domain.model import BaseDocument, Answer, Citation
-from ...domain.ports import GenerateAnswerPort
+from ...domain.ports import StreamingGenerateAnswerPort
 from litellm import completion, acompletion
 from ...application.prompt import rag_prompt
 from src.logger import setup_logger
+from src.tracing import span
 
 logger = setup_logger(__name__)
 
 def format_question_and_context(prompt:str, question: str, docs: List[BaseDocument]) -> str:
-    context = "\n".join([f"Document {i+1}: {doc.text}" for i, doc in enumerate(docs)])
-    return rag_prompt.format(question=question, context=context)
+    with span("prompt_formatting"):
+        context = "\n".join([f"Document {i+1}: {doc.text}" for i, doc in enumerate(docs)])
+        return rag_prompt.format(question=question, context=context)
 
-class LitellmGenerator(GenerateAnswerPort):
+class LitellmGenerator(StreamingGenerateAnswerPort):
     def __init__(self, model: str = "openai/gpt-4o-mini") -> None:
         self._model = model
         logger.info("LitellmGenerator initialized with model=%s", model)
@@ -31,3 +33,17 @@ class LitellmGenerator(GenerateAnswerPort):
             text=answer.choices[0].message.content,
             citations=[]
         )
+
+    async def generate_stream(self, question: str, docs: List[BaseDocument]) -> AsyncIterator[str]:
+        logger.info("Streaming answer for question: '%s' with %d docs", question, len(docs))
+        response = await acompletion(
+            model=self._model,
+            messages=[
+                {"role": "user", "content": format_question_and_context(rag_prompt, question, docs)}
+            ],
+            stream=True,
+        )
+        async for chunk in response:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                yield token
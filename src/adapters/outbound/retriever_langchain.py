@@ -1,13 +1,347 @@
-from typing import List
+import asyncio
+import json
+import re
+from typing import Any, List, Sequence
 import asyncpg
-from ...domain.model import Document
-from ...domain.ports import RetrieveDocumentsPort
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from ...domain.model import BaseDocument
+from ...domain.ports import RetrieveDocumentsPort, EmbeddingPort
+from .filter_cache import _flatten
+from src.logger import setup_logger
+from src.tracing import span
+
+logger = setup_logger(__name__)
+
+# distance -> (pgvector operator, operator class, distance -> similarity score)
+DISTANCES = {
+    "cosine": ("<=>", "vector_cosine_ops", lambda d: 1.0 - d),
+    "l2": ("<->", "vector_l2_ops", lambda d: -d),
+    # `<#>` is the negative inner product.
+    "ip": ("<#>", "vector_ip_ops", lambda d: -d),
+}
+INDEX_TYPES = ("hnsw", "ivfflat")
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_COLUMNS = ("id", "text", "metadata", "embedding", "start_char_idx", "end_char_idx")
+
+
+def _encode_vector(vector: Sequence[float]) -> bytes:
+    # pgvector binary format: int16 dim, int16 unused, dim big-endian float4.
+    values = np.asarray(vector, dtype=">f4")
+    return len(values).to_bytes(2, "big") + b"\x00\x00" + values.tobytes()
+
+
+def _decode_vector(data: bytes) -> list[float]:
+    dim = int.from_bytes(data[:2], "big")
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).tolist()
+
+
+async def init_connection(conn: asyncpg.Connection, ef_search: int | None = None,
+                          probes: int | None = None, iterative_scan: bool = False) -> None:
+    """
+    Per-connection setup for the pool: binary codec for `vector` (needed by
+    COPY and saves text parsing on every query) and the ANN search knobs.
+    """
+    await conn.set_type_codec("vector", schema="public", encoder=_encode_vector,
+                              decoder=_decode_vector, format="binary")
+    if ef_search is not None:
+        await conn.execute(f"SET hnsw.ef_search = {int(ef_search)}")
+    if probes is not None:
+        await conn.execute(f"SET ivfflat.probes = {int(probes)}")
+    if iterative_scan:
+        # pgvector >= 0.8: keep scanning the index until LIMIT rows pass the metadata filter.
+        await conn.execute("SET hnsw.iterative_scan = relaxed_order")
+
+
+async def create_pool(dsn: str, min_size: int = 2, max_size: int = 10, **search_settings) -> asyncpg.Pool:
+    """asyncpg pool whose connections are set up by `init_connection`."""
+    # The vector type has to exist before the pool's connections register its codec.
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    finally:
+        await conn.close()
+
+    async def init(conn: asyncpg.Connection) -> None:
+        await init_connection(conn, **search_settings)
+
+    return await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size, init=init)
+
+
+def _nest(path: str, value: Any) -> dict:
+    doc = value
+    for part in reversed(path.split(".")):
+        doc = {part: doc}
+    return doc
+
+
+def compile_jsonb_filters(filters: dict | None, first_param: int = 1) -> tuple[str, list]:
+    """
+    Plain filter dict -> (SQL predicate on `metadata`, parameters). Same
+    semantics as `compile_filters`: nested dicts are paths, list/set values
+    mean IN. Equalities are merged into one `metadata @> $n` containment,
+    and each IN becomes `metadata @> ANY($n)`. Both can use the GIN
+    (jsonb_path_ops) index.
+    """
+    if not filters:
+        return "TRUE", []
+    equal: dict = {}
+    clauses, params = [], []
+    for path, value in _flatten(filters):
+        if isinstance(value, (list, tuple, set, frozenset)):
+            params.append([json.dumps(_nest(path, v), default=str) for v in value])
+            clauses.append(f"metadata @> ANY(${first_param + len(params) - 1}::jsonb[])")
+        else:
+            node = equal
+            *parents, leaf = path.split(".")
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[leaf] = value
+    if equal:
+        params.append(json.dumps(equal, default=str))
+        clauses.append(f"metadata @> ${first_param + len(params) - 1}::jsonb")
+    return " AND ".join(clauses), params
+
 
 class PGVectorRetriever(RetrieveDocumentsPort):
-    def __init__(self, pool: asyncpg.Pool, table: str = "embeddings") -> None:
+    """
+    Dense retrieval on Postgres with pgvector.
+
+    Chunks live in one table: id, text, metadata (jsonb), embedding and the
+    chunk's character span. Queries are a single `ORDER BY embedding <op> $1
+    LIMIT k` served by the HNSW or IVFFlat index, with metadata filters as
+    JSONB containment predicates (see `compile_jsonb_filters`).
+
+    Ingest embeds chunks on a thread, overlapping the next batch with the
+    current load. Each batch is streamed with binary COPY into a temporary
+    staging table and merged with one `INSERT .. ON CONFLICT (id) DO UPDATE`,
+    so re-ingesting changed chunks is an upsert. For a first load of a large
+    corpus, build the ANN index afterwards (`ensure_schema(create_index=False)`,
+    ingest, `create_index()`). IVFFlat needs the data present to pick its
+    lists anyway.
+
+    Pass a ready `pool` (see `create_pool`) or a `dsn`; with a dsn the pool
+    is created on first use, inside the event loop. The table (and an HNSW
+    index) are created on first use either way.
+    """
+
+    def __init__(self,
+                 pool: asyncpg.Pool | None = None,
+                 table: str = "embeddings",
+                 dimension: int = 768,
+                 embedder: EmbeddingPort | None = None,
+                 embed_model: BaseEmbedding | None = None,
+                 similarity_top_k: int = 3,
+                 filters: dict | None = None,
+                 distance: str = "cosine",
+                 index_type: str = "hnsw",
+                 hnsw_m: int = 16,
+                 hnsw_ef_construction: int = 64,
+                 ivfflat_lists: int = 100,
+                 insert_batch_size: int = 5000,
+                 dsn: str | None = None,
+                 pool_min_size: int = 2,
+                 pool_max_size: int = 10,
+                 **search_settings) -> None:
+        if pool is None and dsn is None:
+            raise ValueError("PGVectorRetriever needs a pool or a dsn")
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+        if distance not in DISTANCES:
+            raise ValueError(f"Unknown distance: {distance}")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
         self._pool = pool
+        self._dsn = dsn
+        self._pool_size = (pool_min_size, pool_max_size)
+        self._search_settings = search_settings
+        self._ready_lock = asyncio.Lock()
+        self._schema_ready = False
         self._table = table
+        self.dimension = dimension
+        # Query embedder (e.g. a MicroBatchingEmbedder); documents are embedded with embed_model.
+        self._embedder = embedder
+        self._embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+        self.distance = distance
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.ivfflat_lists = ivfflat_lists
+        self.insert_batch_size = insert_batch_size
+        operator, _, _ = DISTANCES[distance]
+        self._select = (
+            f"SELECT id, text, metadata, start_char_idx, end_char_idx, embedding {operator} $1 AS distance "
+            f"FROM {table} WHERE {{where}} ORDER BY embedding {operator} $1 LIMIT $2"
+        )
+        # One round trip for many queries: a LATERAL ANN search per query vector, each served by the index.
+        self._select_batch = (
+            f"SELECT q.ord, r.* FROM unnest($1::text[]) WITH ORDINALITY AS q(vec, ord) CROSS JOIN LATERAL ("
+            f"SELECT id, text, metadata, start_char_idx, end_char_idx, embedding {operator} q.vec::vector AS distance "
+            f"FROM {table} WHERE {{where}} ORDER BY embedding {operator} q.vec::vector LIMIT $2) r"
+        )
+        logger.info("Initialized PGVectorRetriever table=%s index=%s distance=%s top_k=%s",
+                    table, index_type, distance, similarity_top_k)
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model or Settings.embed_model
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        if self._pool is not None and self._schema_ready:
+            return self._pool
+        async with self._ready_lock:
+            if self._pool is None:
+                min_size, max_size = self._pool_size
+                self._pool = await create_pool(self._dsn, min_size=min_size, max_size=max_size,
+                                               **self._search_settings)
+            if not self._schema_ready:
+                # An IVFFlat index built on an empty table clusters nothing; create it after loading.
+                await self.ensure_schema(create_index=self.index_type == "hnsw")
+        return self._pool
+
+    async def ensure_schema(self, create_index: bool = True) -> None:
+        """Create the extension, table and metadata index (and ANN index) if missing."""
+        pool = self._pool
+        async with pool.acquire() as conn:
+            await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self._table} (
+                    id text PRIMARY KEY,
+                    text text NOT NULL,
+                    metadata jsonb NOT NULL DEFAULT '{{}}',
+                    embedding vector({int(self.dimension)}) NOT NULL,
+                    start_char_idx integer,
+                    end_char_idx integer
+                )""")
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._table}_metadata_idx "
+                f"ON {self._table} USING gin (metadata jsonb_path_ops)"
+            )
+        self._schema_ready = True
+        if create_index:
+            await self.create_index()
+
+    async def create_index(self) -> None:
+        _, opclass, _ = DISTANCES[self.distance]
+        if self.index_type == "hnsw":
+            options = f"m = {int(self.hnsw_m)}, ef_construction = {int(self.hnsw_ef_construction)}"
+        else:
+            options = f"lists = {int(self.ivfflat_lists)}"
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._table}_embedding_{self.index_type}_idx ON {self._table} "
+                f"USING {self.index_type} (embedding {opclass}) WITH ({options})"
+            )
+        logger.info("Ensured %s index on %s", self.index_type, self._table)
+
+    async def retrieve(self, query: str, filters: dict = None, query_embedding: list[float] | None = None) -> List[BaseDocument]:
+        """Top `similarity_top_k` chunks for the query; a precomputed query_embedding skips embedding it again."""
+        logger.info("Retrieving for query: '%s' with filters: %s", query, filters)
+        if query_embedding is None:
+            if self._embedder is not None:
+                query_embedding = await self._embedder.embed_query(query)
+            else:
+                query_embedding = await self.embed_model.aget_query_embedding(query)
+        where, params = compile_jsonb_filters(filters or self.filters, first_param=3)
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(self._select.format(where=where), query_embedding, self.similarity_top_k, *params)
+        return [self._to_document(row) for row in rows]
+
+    async def retrieve_batch(self, queries: list[str], filters: dict = None,
+                             query_embeddings: list[list[float]] | None = None) -> list[list[BaseDocument]]:
+        """All queries in one statement; vectors go as text since the array has no binary codec."""
+        logger.info("Retrieving batch of %d queries with filters: %s", len(queries), filters)
+        if query_embeddings is None:
+            if self._embedder is not None:
+                query_embeddings = await self._embedder.embed_queries(queries)
+            else:
+                query_embeddings = await asyncio.gather(*(self.embed_model.aget_query_embedding(q) for q in queries))
+        vectors = ["[" + ",".join(map(repr, map(float, embedding))) + "]" for embedding in query_embeddings]
+        where, params = compile_jsonb_filters(filters or self.filters, first_param=3)
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(self._select_batch.format(where=where), vectors, self.similarity_top_k, *params)
+        results: list[list[BaseDocument]] = [[] for _ in queries]
+        for row in rows:
+            results[row["ord"] - 1].append(self._to_document(row))
+        return results
+
+    def _to_document(self, row) -> BaseDocument:
+        _, _, to_score = DISTANCES[self.distance]
+        return BaseDocument(
+            id=row["id"],
+            text=row["text"],
+            metadata=json.loads(row["metadata"]),
+            score=to_score(row["distance"]),
+            embedding=None,
+            start_char_idx=row["start_char_idx"],
+            end_char_idx=row["end_char_idx"],
+        )
+
+    def _embed_missing(self, documents: list[BaseDocument]) -> list[list[float]]:
+        missing = [i for i, doc in enumerate(documents) if doc.embedding is None]
+        embeddings = [doc.embedding for doc in documents]
+        if missing:
+            with span("ingest.embedding"):
+                vectors = self.embed_model.get_text_embedding_batch([documents[i].text for i in missing])
+            for i, vector in zip(missing, vectors):
+                embeddings[i] = vector
+        return embeddings
+
+    def _records(self, documents: list[BaseDocument], embeddings: list[list[float]]) -> list[tuple]:
+        return [
+            (doc.id, doc.text, json.dumps(doc.metadata, default=str), embedding, doc.start_char_idx, doc.end_char_idx)
+            for doc, embedding in zip(documents, embeddings)
+        ]
+
+    async def _copy_batch(self, conn: asyncpg.Connection, records: list[tuple]) -> None:
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in _COLUMNS if col != "id")
+        columns = ", ".join(_COLUMNS)
+        async with conn.transaction():
+            await conn.execute(
+                f"CREATE TEMP TABLE _staging (LIKE {self._table} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            await conn.copy_records_to_table("_staging", records=records, columns=_COLUMNS)
+            # DISTINCT ON: a batch with a repeated id would otherwise fail ON CONFLICT.
+            await conn.execute(
+                f"INSERT INTO {self._table} ({columns}) SELECT DISTINCT ON (id) {columns} FROM _staging "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}"
+            )
+
+    async def ingest(self, documents: list[BaseDocument], **kwargs) -> None:
+        """Embed (where needed) and upsert chunks with binary COPY, one transaction per batch."""
+        logger.info("Ingesting %d documents", len(documents))
+        batches = [documents[i:i + self.insert_batch_size] for i in range(0, len(documents), self.insert_batch_size)]
+        if not batches:
+            return
+        pool = await self._get_pool()
+        embedding = asyncio.ensure_future(asyncio.to_thread(self._embed_missing, batches[0]))
+        try:
+            async with pool.acquire() as conn:
+                for i, batch in enumerate(batches):
+                    embeddings = await embedding
+                    if i + 1 < len(batches):
+                        embedding = asyncio.ensure_future(asyncio.to_thread(self._embed_missing, batches[i + 1]))
+                    with span("ingest.upsert"):
+                        await self._copy_batch(conn, self._records(batch, embeddings))
+                    logger.debug("Upserted batch %d/%d (%d rows)", i + 1, len(batches), len(batch))
+        finally:
+            embedding.cancel()
+
+    async def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        logger.info("Deleting %d rows", len(ids))
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(f"DELETE FROM {self._table} WHERE id = ANY($1::text[])", list(ids))
 
-    async def retrieve(self, query: str, *, k: int = 8) -> List[Document]:
-        # ‑‑ embed query, run ANN search, map rows → Document …
-        raise NotImplementedError
+    async def aclose(self) -> None:
+        """Close the pool (called when a tenant is evicted or on shutdown)."""
+        if self._pool is not None:
+            await self._pool.close()
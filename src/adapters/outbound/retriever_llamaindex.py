@@ -1,12 +1,13 @@
 from typing import List
+from dataclasses import replace
 import asyncpg
 from ...domain.model import BaseDocument
-from ...domain.ports import RetrieveDocumentsPort
+from ...domain.ports import RetrieveDocumentsPort, EmbeddingPort
 from llama_index.core import vector_stores
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.core import VectorStoreIndex
 from llama_index.core import Document
-from llama_index.core.schema import BaseNode, TransformComponent, NodeWithScore, TextNode
+from llama_index.core.schema import BaseNode, TransformComponent, NodeWithScore, TextNode, QueryBundle
 from typing import Any, Generator, List, Optional, Sequence, Union
 from llama_index.core.vector_stores.types import VectorStoreQuery, MetadataFilters, MetadataFilter, FilterCondition
 
@@ -14,90 +15,190 @@ from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.extractors import TitleExtractor
 from llama_index.core.ingestion import IngestionPipeline, IngestionCache
+import asyncio
+import fcntl
 import logging
-from functools import lru_cache
+import os
+import threading
+from llama_index.core.indices.utils import embed_nodes
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client.http import models as rest
+from .filter_cache import RetrieverCache, compile_filters
+from src.core.bm25_index import BM25Index, persisted_stamp
+from src.core.vector_utils import reciprocal_rank_fusion
 from src.logger import setup_logger
+from src.tracing import span
 
 logger = setup_logger(__name__)
 
 
 class LlamaindexRetriever(RetrieveDocumentsPort):
-    def __init__(self, index:VectorStoreIndex, similarity_top_k:int=3, filters:MetadataFilters=None, **kwargs) -> None:
+    """
+    Dense retrieval over a llama-index VectorStoreIndex.
+
+    With a `sparse_index` (BM25Index), every ingested chunk is also indexed
+    for BM25, and each query runs the dense and sparse searches concurrently.
+    The two rankings are merged with reciprocal rank fusion (`rrf_k`) and
+    the top `similarity_top_k` are returned. Keyword matches then no longer
+    depend on the dense side alone, so `dense_top_k` can stay small.
+    With `sparse_persist_dir`, changes to the BM25 index are saved in the
+    background at most every `sparse_persist_interval` seconds, and once
+    more on `aclose()`, so an ingest never pays for rewriting the whole
+    index.
+
+    Several processes (server workers) may share one `sparse_persist_dir`;
+    the saved files are the shared state and there is a single writer at a
+    time. A process takes an flock on the directory before its first
+    unsaved change, reloading the saved index first if another process has
+    saved since, and releases it once its changes are saved. A process
+    that wants to change the index meanwhile waits for that save (up to
+    `sparse_persist_interval`). Searches reload the saved index whenever
+    another process has saved a newer one.
+    """
+    def __init__(self, index:VectorStoreIndex, similarity_top_k:int=3, filters:MetadataFilters=None, embedder:EmbeddingPort|None=None, insert_batch_size:int=512, retriever_cache_size:int=1024,
+                 sparse_index:BM25Index|None=None, sparse_persist_dir:str|None=None, sparse_persist_interval:float=30.0, dense_top_k:int|None=None, sparse_top_k:int|None=None, rrf_k:int=60, **kwargs) -> None:
         self._index = index
+        self.insert_batch_size = insert_batch_size
+        # Optional query embedder (e.g. a MicroBatchingEmbedder); otherwise the index embeds per query.
+        self._embedder = embedder
         self.similarity_top_k = similarity_top_k
+        self.dense_top_k = dense_top_k or similarity_top_k
+        self.sparse_top_k = sparse_top_k or similarity_top_k
+        self.rrf_k = rrf_k
+        self._sparse_index = sparse_index
+        self._sparse_persist_dir = sparse_persist_dir
+        self.sparse_persist_interval = sparse_persist_interval
+        # Sparse changes made / saved so far; the index needs saving while they differ.
+        self._sparse_changes = 0
+        self._sparse_saved = 0
+        self._sparse_flusher: asyncio.Task | None = None
+        # Guards the writer flock and `_sparse_stamp`, the (inode, mtime) of the saved index held in memory.
+        self._sparse_guard = threading.Lock()
+        self._sparse_stamp: tuple[int, int] | None = None
+        self._sparse_lock_fd: int | None = None
+        self._sparse_lock_pid: int | None = None
+        self._sparse_writer = False
         self.filters = filters
         self.kwargs = kwargs
+        # Filtered retrievers, keyed by the canonical form of the filter dict.
+        self._retriever_cache = RetrieverCache(self._get_retriever, max_size=retriever_cache_size)
         self._retriever = self._get_retriever(filters)
         logger.info("Initialized LlamaindexRetriever with top_k=%s filters=%s", similarity_top_k, filters)
 
-    def _get_retriever(self, filters:dict=None):
+    def _get_retriever(self, filters:MetadataFilters|dict|None=None):
         # Accept filters as dict, convert to MetadataFilters if needed
-        if filters and isinstance(filters, dict):
-            filters = MetadataFilters(filters=[
-                MetadataFilter(key=k, value=v) for k, v in filters.items()
-            ]) # type: ignore
+        if isinstance(filters, dict):
+            filters = compile_filters(filters)
         logger.debug("Getting retriever with filters: %s", filters)
         return self._index.as_retriever(
-            similarity_top_k=self.similarity_top_k,
+            similarity_top_k=self.dense_top_k,
             filters=filters,
             kwargs=self.kwargs
         )
-    def _dict_to_tuple(self, d: Optional[dict]) -> Optional[tuple]:
-        if d is None:
-            return None
-        # Recursively convert dict to tuple for hashability
-        def convert(value):
-            if isinstance(value, dict):
-                return tuple(sorted((k, convert(v)) for k, v in value.items()))
-            elif isinstance(value, list):
-                return tuple(convert(v) for v in value)
-            else:
-                return value
-        return tuple(sorted((k, convert(v)) for k, v in d.items()))
-
-    @lru_cache(maxsize=512*8)
-    def get_retriever(self, filters_tuple: Optional[tuple] = None):
+
+    def get_retriever(self, filters: dict | None = None):
         """
-        Return a cached retriever for given filters.
-        filters_tuple: tuple of (key, value) pairs or None
+        Return a cached retriever for given filters (plain dict, may be nested
+        or hold lists). Each distinct filter set is compiled and built once.
         """
-        # Convert tuple back to dict for _get_retriever
-        def tuple_to_dict(t):
-            if t is None:
-                return None
-            return {k: tuple_to_dict(v) if isinstance(v, tuple) and len(v) and isinstance(v[0], tuple) else v for k, v in t}
-        filters = tuple_to_dict(filters_tuple)
-        return self._get_retriever(filters)
+        return self._retriever_cache.get(filters)
 
+    def cache_stats(self) -> dict:
+        return self._retriever_cache.stats()
 
     def set_filters(self, filters: dict = None):
         """Set new filters and update retriever."""
-        filters_tuple = tuple(sorted(filters.items())) if filters else None
         self.filters = filters
-        self._retriever = self.get_retriever(filters_tuple)
+        self._retriever = self.get_retriever(filters)
         logger.info("Setting new filters: %s", filters)
 
-    async def retrieve(self, query: str, filters: dict = None) -> List[Document]:
+    async def retrieve(self, query: str, filters: dict = None, query_embedding: list[float] | None = None) -> List[BaseDocument]:
         logger.info("Retrieving for query: '%s' with filters: %s", query, filters)
-        """Retrieve with optional filters (uses cached retriever if filters provided)."""
+        """Retrieve with optional filters (uses cached retriever if filters provided).
+        A precomputed query_embedding skips embedding the query again."""
         if filters is None or filters == {}:
             retriever = self._retriever
         else:
-            filters_tuple = self._dict_to_tuple(filters)
-            retriever = self.get_retriever(filters_tuple)
-        nodes = await retriever.aretrieve(query)
-        return self.parse_to_basedocuments(nodes)
+            retriever = self.get_retriever(filters)
+        if query_embedding is None and self._embedder is not None:
+            query_embedding = await self._embedder.embed_query(query)
+        bundle = QueryBundle(query_str=query, embedding=query_embedding)
+        if self._sparse_index is None:
+            nodes = await retriever.aretrieve(bundle)
+            return self.parse_to_basedocuments(nodes)
+        if not filters and isinstance(self.filters, dict):
+            filters = self.filters
+        nodes, hits = await asyncio.gather(
+            retriever.aretrieve(bundle),
+            asyncio.to_thread(self._search_sparse, [query], filters or None),
+        )
+        return self._fuse(self.parse_to_basedocuments(nodes), hits[0])
+
+    async def retrieve_batch(self, queries: list[str], filters: dict = None,
+                             query_embeddings: list[list[float]] | None = None) -> list[list[BaseDocument]]:
+        """
+        Several queries with one filter set. On a (dense-only) Qdrant store the
+        searches go out as one `query_batch_points` request, and BM25 runs for
+        all of them in one thread hop. Anything else falls back to concurrent
+        `retrieve` calls.
+        """
+        vector_store = self._index.vector_store
+        if query_embeddings is None and self._embedder is not None:
+            query_embeddings = await self._embedder.embed_queries(queries)
+        if query_embeddings is None or not isinstance(vector_store, QdrantVectorStore) or vector_store.enable_hybrid:
+            return await super().retrieve_batch(queries, filters=filters, query_embeddings=query_embeddings)
+        logger.info("Retrieving batch of %d queries with filters: %s", len(queries), filters)
+        if not filters and isinstance(self.filters, dict):
+            filters = self.filters
+        compiled = compile_filters(filters) if filters else (self.filters if isinstance(self.filters, MetadataFilters) else None)
+        query_filter = vector_store._build_query_filter(VectorStoreQuery(filters=compiled))
+        if vector_store._legacy_vector_format is None:
+            await vector_store._adetect_vector_format(vector_store.collection_name)
+        requests = [
+            rest.QueryRequest(query=embedding, using=vector_store.dense_vector_name, limit=self.dense_top_k,
+                              filter=query_filter, with_payload=True)
+            for embedding in query_embeddings
+        ]
+        dense_search = vector_store._aclient.query_batch_points(
+            collection_name=vector_store.collection_name, requests=requests,
+        )
+        if self._sparse_index is None:
+            responses, sparse = await dense_search, None
+        else:
+            responses, sparse = await asyncio.gather(
+                dense_search, asyncio.to_thread(self._search_sparse, queries, filters or None),
+            )
+        results = []
+        for i, response in enumerate(responses):
+            result = vector_store.parse_to_query_result(response.points)
+            docs = self.parse_to_basedocuments([
+                NodeWithScore(node=node, score=score) for node, score in zip(result.nodes, result.similarities)
+            ])
+            results.append(self._fuse(docs, sparse[i]) if sparse is not None else docs)
+        return results
+
+    def _fuse(self, dense: list[BaseDocument], sparse: list[dict]) -> list[BaseDocument]:
+        """Reciprocal rank fusion of the dense and BM25 rankings; the fused score replaces the raw ones."""
+        by_id = {doc.id: doc for doc in dense}
+        for hit in sparse:
+            by_id.setdefault(hit["id"], BaseDocument(
+                id=hit["id"], text=hit["document"], metadata=hit["metadata"], score=hit["score"], embedding=None,
+            ))
+        fused = reciprocal_rank_fusion([[doc.id for doc in dense], [hit["id"] for hit in sparse]], k=self.rrf_k)
+        return [replace(by_id[doc_id], score=score) for doc_id, score in fused[:self.similarity_top_k]]
     
-    def parse_to_basedocuments(self, nodes:list[NodeWithScore])-> list[Document]:
+    def parse_to_basedocuments(self, nodes:list[NodeWithScore])-> list[BaseDocument]:
         docs = []
         for node in nodes:
             docs.append(
-                Document(
+                BaseDocument(
                     text = node.text,
                     metadata = node.metadata,
                     id = node.id_,
                     score = node.score,
-                    embedding = node.embedding
+                    embedding = node.embedding,
+                    start_char_idx = getattr(node.node, 'start_char_idx', None),
+                    end_char_idx = getattr(node.node, 'end_char_idx', None),
                 )
             )
         return docs
@@ -108,9 +209,12 @@ class LlamaindexRetriever(RetrieveDocumentsPort):
             docs.append(
                 
                     TextNode(
+                    id_ = node.id,
                     text = node.text,
                     metadata = node.metadata,
-                    embedding = node.embedding,)
+                    embedding = node.embedding,
+                    start_char_idx = node.start_char_idx,
+                    end_char_idx = node.end_char_idx,)
             )
         return docs
 
@@ -119,7 +223,161 @@ class LlamaindexRetriever(RetrieveDocumentsPort):
         """
         Ingest nodes/documents into the vector database.
         """
-        print(type(documents))
         nodes = self.parse_to_nodes(documents)
-        if nodes:
-            await self._index.ainsert_nodes(nodes, **kwargs)
\ No newline at end of file
+        batches = [nodes[i:i + self.insert_batch_size] for i in range(0, len(nodes), self.insert_batch_size)]
+        if not batches:
+            return
+        # Embedding is CPU-bound (FastEmbed runs synchronously even on the async path): do it on a thread,
+        # and embed the next batch while the current one is being upserted.
+        embedding = asyncio.ensure_future(asyncio.to_thread(self._embed_missing, batches[0]))
+        try:
+            for i, batch in enumerate(batches):
+                await embedding
+                if i + 1 < len(batches):
+                    embedding = asyncio.ensure_future(asyncio.to_thread(self._embed_missing, batches[i + 1]))
+                with span("ingest.upsert"):
+                    await self._index.ainsert_nodes(batch, **kwargs)
+                logger.debug("Upserted batch %d/%d (%d nodes)", i + 1, len(batches), len(batch))
+        finally:
+            embedding.cancel()
+        if self._sparse_index is not None:
+            try:
+                with span("ingest.sparse_index"):
+                    await asyncio.to_thread(self._update_sparse, documents, [])
+            finally:
+                self._sparse_changed()
+
+    def _search_sparse(self, queries: list[str], filters: dict | None) -> list[list[dict]]:
+        self._refresh_sparse()
+        return [self._sparse_index.search(query, self.sparse_top_k, filters) for query in queries]
+
+    def _refresh_sparse(self) -> None:
+        """Reload the BM25 index if another process saved a newer one; never waits."""
+        if not self._sparse_persist_dir or persisted_stamp(self._sparse_persist_dir) == self._sparse_stamp:
+            return
+        # Busy means this process is changing the index or waiting to: search what is in memory.
+        if not self._sparse_guard.acquire(blocking=False):
+            return
+        try:
+            if not self._sparse_writer:
+                self._load_sparse()
+        finally:
+            self._sparse_guard.release()
+
+    def _load_sparse(self) -> None:
+        stamp = persisted_stamp(self._sparse_persist_dir)
+        if stamp is None or stamp == self._sparse_stamp:
+            return
+        try:
+            self._sparse_index.load(self._sparse_persist_dir)
+        except (OSError, ValueError) as e:
+            # Caught mid-save by another process; the next search tries again.
+            logger.warning("Could not reload BM25 index from %s: %s", self._sparse_persist_dir, e)
+            return
+        self._sparse_stamp = stamp
+
+    def _claim_sparse(self) -> None:
+        """Become the single writer of the saved BM25 index, starting from its latest save."""
+        if self._sparse_writer:
+            return
+        # flock is tied to the open file description, which a fork shares: reopen per process.
+        if self._sparse_lock_pid != os.getpid():
+            os.makedirs(self._sparse_persist_dir, exist_ok=True)
+            self._sparse_lock_fd = os.open(os.path.join(self._sparse_persist_dir, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            self._sparse_lock_pid = os.getpid()
+        fcntl.flock(self._sparse_lock_fd, fcntl.LOCK_EX)
+        self._sparse_writer = True
+        self._load_sparse()
+
+    def _release_sparse(self) -> None:
+        if self._sparse_writer:
+            fcntl.flock(self._sparse_lock_fd, fcntl.LOCK_UN)
+            self._sparse_writer = False
+
+    def _update_sparse(self, added: list[BaseDocument], deleted: List[str]) -> None:
+        with self._sparse_guard:
+            if self._sparse_persist_dir:
+                self._claim_sparse()
+            try:
+                if deleted:
+                    self._sparse_index.delete(deleted)
+                if added:
+                    self._sparse_index.add([d.id for d in added], [d.text for d in added], [d.metadata for d in added])
+            finally:
+                # Counted even if it failed part way, so the save that releases the writer lock still runs.
+                self._sparse_changes += 1
+
+    def _sparse_changed(self) -> None:
+        if self._sparse_persist_dir and self._sparse_flusher is None:
+            self._sparse_flusher = asyncio.create_task(self._persist_sparse_later())
+
+    async def _persist_sparse_later(self) -> None:
+        try:
+            await asyncio.sleep(self.sparse_persist_interval)
+        finally:
+            self._sparse_flusher = None
+        if not await self._persist_sparse() and self._sparse_flusher is None:
+            # Try again after another interval.
+            self._sparse_flusher = asyncio.create_task(self._persist_sparse_later())
+
+    async def _persist_sparse(self) -> bool:
+        if self._sparse_changes == self._sparse_saved:
+            return True
+        try:
+            with span("sparse_index.persist"):
+                await asyncio.to_thread(self._save_sparse)
+        except Exception as e:
+            logger.error("Failed to persist BM25 index to %s: %s", self._sparse_persist_dir, e)
+            return False
+        return True
+
+    def _save_sparse(self) -> None:
+        changes = self._sparse_changes
+        self._sparse_index.persist(self._sparse_persist_dir)
+        with self._sparse_guard:
+            self._sparse_stamp = persisted_stamp(self._sparse_persist_dir)
+            self._sparse_saved = max(self._sparse_saved, changes)
+            # Changes made during the save still need one: keep the lock until then.
+            if self._sparse_changes == self._sparse_saved:
+                self._release_sparse()
+
+    async def delete(self, ids: List[str]) -> None:
+        """Delete chunks by node id from the vector store."""
+        if not ids:
+            return
+        logger.info("Deleting %d nodes", len(ids))
+        await self._index.vector_store.adelete_nodes(node_ids=list(ids))
+        if self._sparse_index is not None:
+            try:
+                await asyncio.to_thread(self._update_sparse, [], list(ids))
+            finally:
+                self._sparse_changed()
+
+    async def aclose(self) -> None:
+        """Save pending BM25 changes and close the vector store's clients (on shutdown or tenant eviction)."""
+        if self._sparse_flusher is not None:
+            self._sparse_flusher.cancel()
+            await asyncio.gather(self._sparse_flusher, return_exceptions=True)
+            self._sparse_flusher = None
+        if self._sparse_persist_dir:
+            await self._persist_sparse()
+            if self._sparse_lock_pid == os.getpid():
+                os.close(self._sparse_lock_fd)
+                self._sparse_lock_pid = None
+                self._sparse_writer = False
+        vector_store = self._index.vector_store
+        aclient = getattr(vector_store, '_aclient', None)
+        if aclient is not None:
+            await aclient.close()
+        client = getattr(vector_store, 'client', None)
+        if client is not None and hasattr(client, 'close'):
+            client.close()
+
+    def _embed_missing(self, nodes: Sequence[BaseNode]) -> None:
+        missing = [node for node in nodes if node.embedding is None]
+        if not missing:
+            return
+        with span("ingest.embedding"):
+            embeddings = embed_nodes(missing, self._index._embed_model)
+        for node in missing:
+            node.embedding = embeddings[node.node_id]
\ No newline at end of file
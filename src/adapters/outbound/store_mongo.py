@@ -1,16 +1,160 @@
-from typing import List
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, List
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from ...domain.model import Answer, BaseDocument
 from ...domain.ports import StoreInteractionPort
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+# Mongo's duplicate key error: on a retried batch, a record that was already written.
+DUPLICATE_KEY = 11000
+
 
 class MongoInteractionRepo(StoreInteractionPort):
-    def __init__(self, client: AsyncIOMotorClient, db_name: str = "rag") -> None:
+    """
+    Write-behind interaction log.
+
+    `save` only builds the record and appends it to an in-memory buffer, so a
+    slow or unavailable Mongo never adds latency to a request. A background
+    task writes the buffer with `insert_many`. It flushes as soon as
+    `batch_size` records are waiting, and at least every `flush_interval`
+    seconds otherwise. At most `max_buffer` records are held. When full,
+    `overflow` decides whether the oldest buffered record or the new one is
+    dropped. Records of a batch that fail to insert go back to the front of
+    the buffer for the next flush, within the same cap; with an unordered
+    bulk write only the failed ones do. `aclose()` lets the background task
+    finish its current write and flush whatever is left.
+    """
+
+    def __init__(self,
+                 client: AsyncIOMotorClient,
+                 db_name: str = "rag",
+                 batch_size: int = 100,
+                 flush_interval: float = 1.0,
+                 max_buffer: int = 10000,
+                 overflow: str = DROP_OLDEST) -> None:
+        if overflow not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self._client = client
         self._coll = client[db_name]["interactions"]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        self._buffer: deque[dict] = deque()
+        self._wake: asyncio.Event | None = None
+        self._flusher: asyncio.Task | None = None
+        self._closed = False
+        self._written = 0
+        self._dropped = 0
+        self._failed_batches = 0
+        logger.info("Initialized MongoInteractionRepo batch_size=%d flush_interval=%ss max_buffer=%d",
+                    batch_size, flush_interval, max_buffer)
 
-    async def save(self, question: str, answer: Answer, docs: List[BaseDocument]) -> None:
-        await self._coll.insert_one({
+    @staticmethod
+    def _record(question: str, answer: Answer, docs: List[BaseDocument],
+                timings: dict[str, float] | None, context: dict | None) -> dict:
+        return {
             "question": question,
             "answer": answer.text,
             "citations": [c.__dict__ for c in answer.citations],
             "doc_ids": [d.id for d in docs],
-        })
+            "scores": [d.score for d in docs],
+            "timings_ms": {stage: round(seconds * 1000, 3) for stage, seconds in (timings or {}).items()},
+            **(context or {}),
+            "created_at": datetime.now(timezone.utc),
+        }
+
+    async def save(self, question: str, answer: Answer, docs: List[BaseDocument],
+                   timings: dict[str, float] | None = None, context: dict | None = None) -> None:
+        if self._closed:
+            self._dropped += 1
+            return
+        self._ensure_started()
+        self._push(self._record(question, answer, docs, timings, context))
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def _push(self, record: dict) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            self._dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            self._buffer.popleft()
+        self._buffer.append(record)
+
+    def _ensure_started(self) -> None:
+        if self._flusher is None:
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush()
+            if self._closed:
+                return
+
+    async def _flush(self) -> None:
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                await self._coll.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: everything but the listed records was written. insert_many set
+                # each record's _id, so a record that was in fact written fails as a duplicate.
+                errors = e.details.get("writeErrors", [])
+                failed = [batch[error["index"]] for error in errors if error.get("code") != DUPLICATE_KEY]
+                self._written += len(batch) - len(failed)
+                if failed:
+                    self._failed_batches += 1
+                    logger.error("Failed to write %d of %d interactions: %s", len(failed), len(batch), e)
+                    self._requeue(failed)
+                    return
+                continue
+            except Exception as e:
+                self._failed_batches += 1
+                logger.error("Failed to write %d interactions: %s", len(batch), e)
+                self._requeue(batch)
+                return
+            self._written += len(batch)
+            # A partial batch means the buffer is drained; wait for the next trigger.
+            if len(batch) < self.batch_size:
+                return
+
+    def _requeue(self, records: list[dict]) -> None:
+        # Retry on the next flush, oldest first, without exceeding the cap.
+        room = max(0, self.max_buffer - len(self._buffer))
+        self._dropped += len(records) - min(room, len(records))
+        self._buffer.extendleft(reversed(records[:room]))
+
+    async def aclose(self) -> None:
+        self._closed = True
+        if self._flusher is not None:
+            # Not cancelled: a batch being inserted is already out of the buffer.
+            self._wake.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._buffer:
+            logger.error("Dropping %d interactions that could not be written on shutdown", len(self._buffer))
+            self._dropped += len(self._buffer)
+            self._buffer.clear()
+        self._client.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "written": self._written,
+            "dropped": self._dropped,
+            "failed_batches": self._failed_batches,
+        }
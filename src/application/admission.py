@@ -0,0 +1,163 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, TypeVar
+from src.logger import setup_logger
+from src.tracing import REGISTRY
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+REJECTIONS = REGISTRY.counter("rag_admission_rejections_total", "Requests turned away by admission control.", ("stage", "reason"))
+COALESCED = REGISTRY.counter("rag_single_flight_total", "Asks by single-flight role.", ("role",))
+
+
+class AdmissionRejected(Exception):
+    """
+    A stage could not take the request. `status` is 429 when its wait queue
+    is full and 503 when the request waited longer than the queue timeout.
+    `retry_after` is the suggested wait in seconds.
+    """
+
+    def __init__(self, stage: str, status: int, retry_after: int, reason: str) -> None:
+        super().__init__(f"{stage} is overloaded ({reason}), retry in {retry_after}s")
+        self.stage = stage
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+@dataclass
+class StageStats:
+    admitted: int = 0
+    queue_full: int = 0
+    timed_out: int = 0
+    avg_seconds: float = 0.0
+
+
+class StageLimiter:
+    """
+    At most `limit` concurrent holders and at most `max_queue` waiters for one
+    stage. A request that finds the queue full is rejected at once, and one
+    that waits more than `queue_timeout` seconds is rejected too. Neither
+    adds to anyone's latency. Retry-After is estimated from the stage's
+    moving-average service time and the current queue depth.
+    """
+
+    def __init__(self, stage: str, limit: int, max_queue: int = 64, queue_timeout: float = 10.0) -> None:
+        self.stage = stage
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore: asyncio.Semaphore | None = None
+        self._waiting = 0
+        self._active = 0
+        self._stats = StageStats()
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain through `limit` slots, at least one second.
+        drain = self._stats.avg_seconds * (self._waiting + 1) / max(self.limit, 1)
+        return max(1, math.ceil(drain))
+
+    def _reject(self, status: int, reason: str) -> AdmissionRejected:
+        REJECTIONS.inc(self.stage, reason)
+        logger.error("Rejecting %s request: %s (active=%d waiting=%d)", self.stage, reason, self._active, self._waiting)
+        return AdmissionRejected(self.stage, status, self.retry_after(), reason)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of the stage's slots for the duration of the block."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self._stats.queue_full += 1
+                raise self._reject(429, "queue full")
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._stats.timed_out += 1
+                raise self._reject(503, "queue timeout") from None
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self._active += 1
+        self._stats.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+            elapsed = time.perf_counter() - started
+            # Exponential moving average of how long the stage holds a slot.
+            avg = self._stats.avg_seconds
+            self._stats.avg_seconds = elapsed if self._stats.admitted == 1 else avg + 0.1 * (elapsed - avg)
+
+    def stats(self) -> dict[str, Any]:
+        return {"limit": self.limit, "active": self._active, "waiting": self._waiting, **asdict(self._stats)}
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution. The first caller
+    starts `fn` as a task, and every caller (the first included) awaits it
+    shielded. A caller that disconnects therefore does not cancel the others.
+    The key is forgotten as soon as the call finishes, so nothing is cached
+    here.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._leaders = 0
+        self._followers = 0
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller has gone.
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            self._leaders += 1
+            COALESCED.inc("leader")
+        else:
+            self._followers += 1
+            COALESCED.inc("follower")
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, int]:
+        return {"inflight": len(self._inflight), "leaders": self._leaders, "followers": self._followers}
+
+
+class AdmissionController:
+    """Per-stage limiters plus single-flight de-duplication for the ask path."""
+
+    def __init__(self, limits: dict[str, int], max_queue: int = 64, queue_timeout: float = 10.0,
+                 single_flight: bool = True) -> None:
+        self.stages = {
+            stage: StageLimiter(stage, limit, max_queue=max_queue, queue_timeout=queue_timeout)
+            for stage, limit in limits.items()
+        }
+        self.single_flight = SingleFlight() if single_flight else None
+        logger.info("Initialized AdmissionController limits=%s max_queue=%d queue_timeout=%ss single_flight=%s",
+                    limits, max_queue, queue_timeout, single_flight)
+
+    def stage(self, name: str) -> StageLimiter | None:
+        return self.stages.get(name)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "stages": {name: limiter.stats() for name, limiter in self.stages.items()},
+            "single_flight": self.single_flight.stats() if self.single_flight is not None else {},
+        }
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from typing import Any, Sequence
+import json
+import threading
+import time
+import numpy as np
+from ..domain.model import Answer
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def canonical_filters(filters: dict | None) -> str:
+    """Order-independent string key for a filter dict ({} and None are the same)."""
+    if not filters:
+        return ""
+    return json.dumps(filters, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by query embedding + canonical filters.
+
+    A lookup hits when a cached query with the same filters has cosine
+    similarity >= `threshold`. Entries expire after `ttl` seconds, the least
+    recently used entry is evicted when full, and `bump_generation()` (called
+    on ingest) invalidates every answer cached before it.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, threshold: float = 0.95) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._vectors: np.ndarray | None = None
+        self._filter_keys: list[str | None] = [None] * max_entries
+        self._answers: list[Answer | None] = [None] * max_entries
+        self._generations = np.zeros(max_entries, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._live = np.zeros(max_entries, dtype=bool)
+        # slot -> None, least recently used first
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        logger.info("Initialized SemanticAnswerCache max_entries=%d ttl=%s threshold=%s", max_entries, ttl, threshold)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def bump_generation(self) -> None:
+        with self._lock:
+            self._generation += 1
+        logger.debug("Answer cache generation bumped to %d", self._generation)
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _valid(self, now: float) -> np.ndarray:
+        return self._live & (self._generations == self._generation) & (self._expires > now)
+
+    def _release(self, slot: int) -> None:
+        self._live[slot] = False
+        self._answers[slot] = None
+        self._filter_keys[slot] = None
+        self._lru.pop(slot, None)
+
+    def get(self, embedding: Sequence[float], filters: dict | None = None) -> Answer | None:
+        query = self._normalize(embedding)
+        key = canonical_filters(filters)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._misses += 1
+                return None
+            valid = self._valid(now)
+            valid &= np.fromiter((k == key for k in self._filter_keys), dtype=bool, count=self.max_entries)
+            if not valid.any():
+                self._misses += 1
+                return None
+            scores = np.where(valid, self._vectors @ query, -np.inf)
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self._misses += 1
+                return None
+            self._lru.move_to_end(slot)
+            self._hits += 1
+            return self._answers[slot]
+
+    def put(self, embedding: Sequence[float], answer: Answer, filters: dict | None = None) -> None:
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            free = np.flatnonzero(~self._valid(now))
+            if free.size:
+                slot = int(free[0])
+                self._release(slot)
+            else:
+                slot, _ = self._lru.popitem(last=False)
+                self._evictions += 1
+            self._vectors[slot] = vector
+            self._filter_keys[slot] = canonical_filters(filters)
+            self._answers[slot] = answer
+            self._generations[slot] = self._generation
+            self._expires[slot] = now + self.ttl
+            self._live[slot] = True
+            self._lru[slot] = None
+
+    def clear(self) -> None:
+        with self._lock:
+            for slot in list(self._lru):
+                self._release(slot)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": int(self._valid(time.monotonic()).sum()),
+                "generation": self._generation,
+            }
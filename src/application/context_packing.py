@@ -0,0 +1,154 @@
+from dataclasses import replace
+from typing import Callable, List
+import re
+from ..domain.model import BaseDocument
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+TokenCounter = Callable[[str], int]
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for when no tokenizer is configured."""
+    return (len(text) + 3) // 4
+
+
+def _source_key(doc: BaseDocument) -> tuple | None:
+    source = doc.metadata.get("file_path") or doc.metadata.get("file_name")
+    if source is None:
+        return None
+    # Multi-page files are loaded one document per page; offsets are per page.
+    return source, doc.metadata.get("page_label")
+
+
+def _text_overlap(left: str, right: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right` (0 if below min_overlap)."""
+    limit = min(len(left), len(right), max_overlap)
+    if limit < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    start = left.find(probe, len(left) - limit)
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextPacker:
+    """
+    Turns retrieved chunks into the context actually sent to the generator.
+
+    1. Chunks of the same source (file and page) that overlap or touch are
+       merged into one passage. Character offsets are used when known;
+       otherwise a suffix/prefix text match of at least `min_overlap` chars.
+    2. A passage whose word shingles are at least `duplicate_threshold`
+       contained in an already kept, higher-scored passage is dropped.
+    3. Passages are added in score order while they fit in `max_tokens`,
+       counted with `count_tokens` plus `per_doc_overhead` for the header the
+       prompt puts around each document. A passage that does not fit is
+       skipped so smaller ones can still use the space. If not even the best
+       passage fits, it is truncated.
+
+    A merged passage keeps the id and score of its best chunk.
+    """
+
+    def __init__(self,
+                 max_tokens: int = 2000,
+                 count_tokens: TokenCounter | None = None,
+                 duplicate_threshold: float = 0.85,
+                 min_overlap: int = 20,
+                 max_overlap: int = 2000,
+                 per_doc_overhead: int = 8) -> None:
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.per_doc_overhead = per_doc_overhead
+        self._count_tokens = count_tokens or approx_tokens
+        logger.info("Initialized ContextPacker max_tokens=%d", max_tokens)
+
+    def pack(self, docs: List[BaseDocument]) -> List[BaseDocument]:
+        if not docs:
+            return []
+        passages = self._merge(docs)
+        passages.sort(key=lambda doc: doc.score or 0.0, reverse=True)
+        packed = self._fill(self._dedupe(passages))
+        logger.debug("Packed %d chunks into %d passages", len(docs), len(packed))
+        return packed
+
+    def _merge(self, docs: List[BaseDocument]) -> List[BaseDocument]:
+        groups: dict = {}
+        passages = []
+        for doc in docs:
+            key = _source_key(doc)
+            if key is None:
+                passages.append(doc)
+            else:
+                groups.setdefault(key, []).append(doc)
+        for group in groups.values():
+            group.sort(key=lambda doc: doc.start_char_idx if doc.start_char_idx is not None else -1)
+            current = group[0]
+            for doc in group[1:]:
+                merged = self._join(current, doc) or self._join(doc, current)
+                if merged is None:
+                    passages.append(current)
+                    current = doc
+                else:
+                    current = merged
+            passages.append(current)
+        return passages
+
+    def _join(self, left: BaseDocument, right: BaseDocument) -> BaseDocument | None:
+        """`left` followed by `right` as one passage, or None if they are not contiguous."""
+        if None not in (left.start_char_idx, left.end_char_idx, right.start_char_idx, right.end_char_idx):
+            if right.start_char_idx < left.start_char_idx or right.start_char_idx > left.end_char_idx:
+                return None
+            skip = left.end_char_idx - right.start_char_idx
+            text = left.text + right.text[skip:] if right.end_char_idx > left.end_char_idx else left.text
+            end = max(left.end_char_idx, right.end_char_idx)
+        else:
+            skip = _text_overlap(left.text, right.text, self.min_overlap, self.max_overlap)
+            if not skip:
+                return None
+            text, end = left.text + right.text[skip:], None
+        best = left if (left.score or 0.0) >= (right.score or 0.0) else right
+        return replace(best, text=text, start_char_idx=left.start_char_idx, end_char_idx=end, embedding=None)
+
+    def _dedupe(self, passages: List[BaseDocument]) -> List[BaseDocument]:
+        kept, kept_shingles = [], []
+        for passage in passages:
+            shingles = _shingles(passage.text)
+            duplicate = any(
+                shingles and len(shingles & other) >= self.duplicate_threshold * len(shingles)
+                for other in kept_shingles
+            )
+            if duplicate:
+                logger.debug("Dropping near-duplicate passage %s", passage.id)
+                continue
+            kept.append(passage)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _fill(self, passages: List[BaseDocument]) -> List[BaseDocument]:
+        packed, used = [], 0
+        for passage in passages:
+            cost = self._count_tokens(passage.text) + self.per_doc_overhead
+            if used + cost <= self.max_tokens:
+                packed.append(passage)
+                used += cost
+        if not packed and passages:
+            best = passages[0]
+            available = max(self.max_tokens - self.per_doc_overhead, 0)
+            tokens = self._count_tokens(best.text)
+            cut = int(len(best.text) * available / tokens) if tokens else 0
+            packed.append(replace(best, text=best.text[:cut]))
+        return packed
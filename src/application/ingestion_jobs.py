@@ -0,0 +1,133 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Awaitable, Callable
+from src.logger import setup_logger
+from src.tracing import set_request_id, reset_request_id
+
+logger = setup_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised by `submit` when the job queue is at capacity."""
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    params: dict
+    status: str = QUEUED
+    stage: str = QUEUED
+    progress: float = 0.0
+    error: str | None = None
+    result: dict = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    def report(self, stage: str, progress: float) -> None:
+        """Progress callback handed to the ingestion run."""
+        self.stage = stage
+        self.progress = progress
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["params"] = {k: str(v) for k, v in self.params.items()}
+        return data
+
+
+class IngestionJobQueue:
+    """
+    Bounded background queue for ingestion.
+
+    `submit` enqueues a job and returns immediately; `concurrency` asyncio
+    workers pull jobs and await `run(job)`, which is expected to push its
+    blocking work (parsing, splitting, embedding) onto threads. When
+    `max_queue` jobs are already waiting, `submit` raises QueueFullError so
+    callers can apply backpressure. Finished jobs are kept for status queries
+    up to `max_finished`, oldest dropped first.
+    """
+
+    def __init__(self,
+                 run: Callable[[IngestionJob], Awaitable[dict | None]],
+                 concurrency: int = 2,
+                 max_queue: int = 64,
+                 max_finished: int = 1000) -> None:
+        self._run = run
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_finished = max_finished
+        self._queue: asyncio.Queue[IngestionJob] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        logger.info("Initialized IngestionJobQueue concurrency=%d max_queue=%d", concurrency, max_queue)
+
+    def _ensure_started(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+
+    def submit(self, **params) -> IngestionJob:
+        self._ensure_started()
+        job = IngestionJob(id=uuid.uuid4().hex, params=params)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Ingestion queue is full ({self.max_queue} jobs waiting)") from None
+        self._jobs[job.id] = job
+        self._trim()
+        logger.info("Queued ingestion job %s (queue depth=%d)", job.id, self._queue.qsize())
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _trim(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.status in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = job.stage = RUNNING
+            job.started_at = time.time()
+            logger.info("Worker %d started ingestion job %s", worker_id, job.id)
+            # Spans recorded while the job runs are correlated by its id.
+            token = set_request_id(job.id)
+            try:
+                job.result = await self._run(job) or {}
+                job.status = job.stage = SUCCEEDED
+                job.progress = 1.0
+            except Exception as e:
+                logger.error("Ingestion job %s failed: %s", job.id, e)
+                job.status = job.stage = FAILED
+                job.error = str(e)
+            finally:
+                reset_request_id(token)
+                job.finished_at = time.time()
+                self._queue.task_done()
+            logger.info("Ingestion job %s %s in %.2fs", job.id, job.status, job.finished_at - job.started_at)
+
+    async def shutdown(self, drain: bool = True) -> None:
+        """Stop the workers, optionally after finishing everything already queued."""
+        if not self._workers:
+            return
+        if drain:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -1,50 +1,399 @@
-from typing import Final, List, Any
-from ..domain.model import BaseDocument, Answer, File
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncIterator, Callable, Final, List, Any, Sequence
+from ..domain.model import BaseDocument, Answer, AnswerEvent, BatchAnswer, Citation, File, Question
 from ..domain.ports import (
     AskQuestionPort,
     RetrieveDocumentsPort,
     GenerateAnswerPort,
+    StreamingGenerateAnswerPort,
     IngestionPort,
     StoreInteractionPort,
+    EmbeddingPort,
 )
+from .admission import AdmissionController
+from .answer_cache import SemanticAnswerCache, canonical_filters
+from .context_packing import ContextPacker
+from .tenants import TenantRegistry
 from pathlib import Path
-from functools import cache
 from src.logger import setup_logger
+from src.tracing import REGISTRY, get_request_id, span
 
 logger = setup_logger(__name__)
 
-@cache
-def get_retriever(org_id:str)-> RetrieveDocumentsPort:
-    ...
+CACHE_LOOKUPS = REGISTRY.counter("rag_answer_cache_lookups_total", "Semantic answer cache lookups.", ("result",))
 
 class RagService:
     """Pure domain logic; knows nothing about HTTP, LangChain, or databases."""
 
     _TOP_K: Final[int] = 8
+    _SNIPPET_CHARS: Final[int] = 200
 
     def __init__(
         self,
         ingester:IngestionPort,
         retriever: RetrieveDocumentsPort,
         generator: GenerateAnswerPort,
+        embedder: EmbeddingPort | None = None,
+        answer_cache: SemanticAnswerCache | None = None,
+        tenants: TenantRegistry | None = None,
+        context_packer: ContextPacker | None = None,
+        interactions: StoreInteractionPort | None = None,
+        batch_generation_concurrency: int = 8,
+        admission: AdmissionController | None = None,
     ) -> None:
+        if answer_cache is not None and embedder is None:
+            raise ValueError("answer_cache requires an embedder")
         self._retriever = retriever
         self._generator = generator
         self._ingester = ingester
+        self._embedder = embedder
+        self._answer_cache = answer_cache
+        # One sync at a time per (org, directory), from planning to manifest commit.
+        self._sync_locks: dict[tuple[str | None, str | None], asyncio.Lock] = {}
+        self._tenants = tenants
+        self._context_packer = context_packer
+        self._interactions = interactions
+        # Upper bound on concurrent LLM calls per ask_batch.
+        self.batch_generation_concurrency = batch_generation_concurrency
+        self._admission = admission
 
-    async def ask(self, question: str, filters:dict) -> Answer:
-        logger.info("RagService.ask called with question='%s' filters=%s", question, filters)
-        docs: List[BaseDocument] = await self._retriever.retrieve(question, filters=filters)
+    @property
+    def embedder(self) -> EmbeddingPort | None:
+        return self._embedder
+
+    @property
+    def answer_cache(self) -> SemanticAnswerCache | None:
+        return self._answer_cache
+
+    @property
+    def context_packer(self) -> ContextPacker | None:
+        return self._context_packer
+
+    @property
+    def interactions(self) -> StoreInteractionPort | None:
+        return self._interactions
+
+    @property
+    def admission(self) -> AdmissionController | None:
+        return self._admission
+
+    @property
+    def tenants(self) -> TenantRegistry | None:
+        return self._tenants
+
+    async def get_retriever(self, org_id: str | None = None) -> RetrieveDocumentsPort:
+        """The org's retriever from the tenant registry, or the default one. Use `lease_retriever` across awaits."""
+        if org_id is None:
+            return self._retriever
+        if self._tenants is None:
+            raise ValueError("org_id given but no tenant registry is configured")
+        return await self._tenants.get(org_id)
+
+    @asynccontextmanager
+    async def lease_retriever(self, org_id: str | None = None) -> AsyncIterator[RetrieveDocumentsPort]:
+        """The org's retriever, which tenant eviction will not close before the block exits."""
+        if org_id is None:
+            yield self._retriever
+            return
+        if self._tenants is None:
+            raise ValueError("org_id given but no tenant registry is configured")
+        async with self._tenants.lease(org_id) as retriever:
+            yield retriever
+
+    def _admit(self, stage: str):
+        """Async context holding a slot of `stage` (may raise AdmissionRejected); a no-op without admission control."""
+        limiter = self._admission.stage(stage) if self._admission is not None else None
+        return limiter.slot() if limiter is not None else nullcontext()
+
+    @staticmethod
+    def _cache_scope(filters: dict | None, org_id: str | None) -> dict:
+        # Answers are only shared within one organisation.
+        return {**(filters or {}), "__org_id__": org_id} if org_id is not None else filters
+
+    async def _lookup_cache(self, question: str, filters: dict,
+                            timings: dict | None = None) -> tuple[Answer | None, list[float] | None]:
+        """Returns (cached answer or None, query embedding to reuse for retrieval)."""
+        if self._answer_cache is None:
+            return None, None
+        async with self._admit("embedding"):
+            with span("query_embedding", timings):
+                query_embedding = await self._embedder.embed_query(question)
+        with span("answer_cache", timings):
+            cached = self._answer_cache.get(query_embedding, filters)
+        CACHE_LOOKUPS.inc("hit" if cached is not None else "miss")
+        if cached is not None:
+            logger.info("Answer cache hit")
+        return cached, query_embedding
+
+    def _pack(self, docs: List[BaseDocument], timings: dict | None = None) -> List[BaseDocument]:
+        """Merge, de-duplicate and budget the retrieved chunks before they reach the prompt."""
+        if self._context_packer is None:
+            return docs
+        with span("context_packing", timings):
+            packed = self._context_packer.pack(docs)
+        logger.info('Packed %d retrieved chunks into %d passages', len(docs), len(packed))
+        return packed
+
+    async def _record(self, question: str, answer: Answer, docs: List[BaseDocument], timings: dict,
+                      filters: dict | None, org_id: str | None, cached: bool) -> None:
+        """Hand the interaction to the store. The store buffers it, and a failure never fails the request."""
+        if self._interactions is None:
+            return
+        try:
+            await self._interactions.save(
+                question, answer, docs, timings=timings,
+                context={"filters": filters, "org_id": org_id, "cached": cached, "request_id": get_request_id()},
+            )
+        except Exception as e:
+            logger.error("Failed to record interaction: %s", e)
+
+    @classmethod
+    def _citations(cls, docs: List[BaseDocument]) -> List[Citation]:
+        return [Citation(document_id=doc.id, snippet=doc.text[:cls._SNIPPET_CHARS]) for doc in docs]
+
+    async def ask(self, question: str, filters:dict, org_id: str | None = None) -> Answer:
+        logger.info("RagService.ask called with question='%s' filters=%s org_id=%s", question, filters, org_id)
+        single_flight = self._admission.single_flight if self._admission is not None else None
+        if single_flight is None:
+            return await self._ask(question, filters, org_id)
+        # Identical questions in flight at the same time share one embedding, search and LLM call.
+        key = (question, canonical_filters(filters), org_id)
+        return await single_flight.do(key, lambda: self._ask(question, filters, org_id))
+
+    async def _ask(self, question: str, filters: dict, org_id: str | None) -> Answer:
+        scope = self._cache_scope(filters, org_id)
+        timings: dict[str, float] = {}
+        cached, query_embedding = await self._lookup_cache(question, scope, timings)
+        if cached is not None:
+            await self._record(question, cached, [], timings, filters, org_id, cached=True)
+            return cached
+        async with self.lease_retriever(org_id) as retriever, self._admit("retrieval"):
+            with span("retrieval", timings):
+                docs: List[BaseDocument] = await retriever.retrieve(question, filters=filters, query_embedding=query_embedding)
         logger.info('Retrieved documents: %d', len(docs))
-        answer: Answer = await self._generator.generate(question, docs)
+        docs = self._pack(docs, timings)
+        async with self._admit("generation"):
+            with span("generation", timings):
+                answer: Answer = await self._generator.generate(question, docs)
         logger.debug("Generated answer: %s", answer)
+        if self._answer_cache is not None:
+            self._answer_cache.put(query_embedding, answer, scope)
+        await self._record(question, answer, docs, timings, filters, org_id, cached=False)
         return answer
 
-    async def ingest(self, **kwargs) -> None:
+    async def ask_stream(self, question: str, filters: dict, org_id: str | None = None) -> AsyncIterator[AnswerEvent]:
+        """
+        Streamed variant of `ask`: yields the citations as soon as retrieval is
+        done, then answer tokens as the generator produces them, then the full Answer.
+        """
+        logger.info("RagService.ask_stream called with question='%s' filters=%s org_id=%s", question, filters, org_id)
+        scope = self._cache_scope(filters, org_id)
+        timings: dict[str, float] = {}
+        cached, query_embedding = await self._lookup_cache(question, scope, timings)
+        if cached is not None:
+            yield AnswerEvent("citations", cached.citations)
+            yield AnswerEvent("token", cached.text)
+            await self._record(question, cached, [], timings, filters, org_id, cached=True)
+            yield AnswerEvent("done", cached)
+            return
+        async with self.lease_retriever(org_id) as retriever, self._admit("retrieval"):
+            with span("retrieval", timings):
+                docs: List[BaseDocument] = await retriever.retrieve(question, filters=filters, query_embedding=query_embedding)
+        logger.info('Retrieved documents: %d', len(docs))
+        docs = self._pack(docs, timings)
+        citations = self._citations(docs)
+        yield AnswerEvent("citations", citations)
+
+        if isinstance(self._generator, StreamingGenerateAnswerPort):
+            tokens = []
+            # Includes time the client takes to consume each token.
+            async with self._admit("generation"):
+                with span("generation_stream", timings):
+                    async for token in self._generator.generate_stream(question, docs):
+                        tokens.append(token)
+                        yield AnswerEvent("token", token)
+            answer = Answer(text="".join(tokens), citations=citations)
+        else:
+            async with self._admit("generation"):
+                with span("generation", timings):
+                    generated = await self._generator.generate(question, docs)
+            answer = Answer(text=generated.text, citations=generated.citations or citations)
+            yield AnswerEvent("token", answer.text)
+        if self._answer_cache is not None:
+            self._answer_cache.put(query_embedding, answer, scope)
+        await self._record(question, answer, docs, timings, filters, org_id, cached=False)
+        yield AnswerEvent("done", answer)
+
+    async def ask_batch(self, questions: Sequence[Question],
+                        max_concurrency: int | None = None) -> AsyncIterator[BatchAnswer]:
+        """
+        Answer many questions, yielding each result as soon as it is ready (in
+        completion order; `BatchAnswer.index` says which question it is).
+
+        All questions are embedded in one call and looked up in the answer
+        cache. The misses are grouped by (org, filters), and each group runs
+        one multi-query search (`retrieve_batch`). Generation then fans out
+        with at most `max_concurrency` LLM calls in flight, capped at
+        `batch_generation_concurrency`. A failure only
+        fails the questions it touched.
+        """
+        logger.info("RagService.ask_batch called with %d questions", len(questions))
+        batch_timings: dict[str, float] = {}
+        embeddings: list | None = None
+        if self._embedder is not None and questions:
+            async with self._admit("embedding"):
+                with span("query_embedding", batch_timings):
+                    embeddings = await self._embedder.embed_queries([q.text for q in questions])
+
+        groups: dict[tuple, list[int]] = {}
+        for i, question in enumerate(questions):
+            scope = self._cache_scope(question.filters, question.org_id)
+            if self._answer_cache is not None:
+                cached = self._answer_cache.get(embeddings[i], scope)
+                CACHE_LOOKUPS.inc("hit" if cached is not None else "miss")
+                if cached is not None:
+                    await self._record(question.text, cached, [], dict(batch_timings),
+                                       question.filters, question.org_id, cached=True)
+                    yield BatchAnswer(i, cached)
+                    continue
+            # Same filters written in a different key order still share a group.
+            groups.setdefault((question.org_id, canonical_filters(question.filters)), []).append(i)
+
+        results: asyncio.Queue[BatchAnswer] = asyncio.Queue()
+        # A caller may ask for less concurrency than configured, never more.
+        limit = self.batch_generation_concurrency
+        semaphore = asyncio.Semaphore(max(1, min(max_concurrency or limit, limit)))
+
+        async def answer(i: int, docs: List[BaseDocument], timings: dict) -> None:
+            question = questions[i]
+            try:
+                docs = self._pack(docs, timings)
+                async with semaphore:
+                    async with self._admit("generation"):
+                        with span("generation", timings):
+                            generated = await self._generator.generate(question.text, docs)
+            except Exception as e:
+                logger.error("Batch question %d failed: %s", i, e)
+                results.put_nowait(BatchAnswer(i, error=str(e)))
+                return
+            if self._answer_cache is not None:
+                self._answer_cache.put(embeddings[i], generated, self._cache_scope(question.filters, question.org_id))
+            await self._record(question.text, generated, docs, timings, question.filters, question.org_id, cached=False)
+            results.put_nowait(BatchAnswer(i, generated))
+
+        async def run_group(indices: list[int]) -> None:
+            first = questions[indices[0]]
+            timings = dict(batch_timings)
+            try:
+                async with self.lease_retriever(first.org_id) as retriever, self._admit("retrieval"):
+                    with span("retrieval", timings):
+                        retrieved = await retriever.retrieve_batch(
+                            [questions[i].text for i in indices],
+                            filters=first.filters,
+                            query_embeddings=[embeddings[i] for i in indices] if embeddings is not None else None,
+                        )
+                if len(retrieved) != len(indices):
+                    # Every question must get a result line, or the consumer below waits forever.
+                    raise RuntimeError(f"retrieve_batch returned {len(retrieved)} results for {len(indices)} questions")
+            except Exception as e:
+                logger.error("Batch retrieval failed for %d questions: %s", len(indices), e)
+                for i in indices:
+                    results.put_nowait(BatchAnswer(i, error=str(e)))
+                return
+            logger.info('Retrieved documents for %d batched questions', len(indices))
+            await asyncio.gather(*(answer(i, docs, dict(timings)) for i, docs in zip(indices, retrieved)))
+
+        tasks = [asyncio.create_task(run_group(indices)) for indices in groups.values()]
+        try:
+            for _ in range(sum(len(indices) for indices in groups.values())):
+                yield await results.get()
+        finally:
+            # Client went away (or the consumer stopped early): stop outstanding work.
+            for task in tasks:
+                task.cancel()
+
+    async def ingest(self, progress: Callable[[str, float], None] | None = None, org_id: str | None = None, **kwargs) -> int:
+        """Parse/split through the ingester, then index. `progress(stage, fraction)` is optional."""
         logger.info("RagService.ingest called with kwargs=%s", kwargs)
-        docs = await self._ingester.ingest(**kwargs)
-        if not docs:
+        report = progress or (lambda stage, fraction: None)
+        report("parsing", 0.0)
+        total = batches = 0
+        # Batches are indexed as the ingester produces them (e.g. one per worker shard),
+        # so parsing of later batches overlaps with indexing of earlier ones.
+        stream = self._ingester.ingest_stream(**kwargs)
+        async with self.lease_retriever(org_id) as retriever:
+            while True:
+                # Time spent waiting for the next batch to be parsed.
+                with span("ingest.parsing"):
+                    docs = await anext(stream, None)
+                if docs is None:
+                    break
+                if not docs:
+                    continue
+                batches += 1
+                total += len(docs)
+                report("indexing", 0.5)
+                with span("ingest.indexing"):
+                    await retriever.ingest(docs, **kwargs)
+                logger.info('Indexed batch %d (%d chunks, %d so far)', batches, len(docs), total)
+        if not total:
             logger.error("No documents ingested")
             raise ValueError("No documents ingested")
-        logger.info('Ingested documents: %d', len(docs))
-        await self._retriever.ingest(docs, **kwargs)
\ No newline at end of file
+        if self._answer_cache is not None:
+            # New documents can change answers: drop everything cached so far.
+            self._answer_cache.bump_generation()
+        report("done", 1.0)
+        return total
+
+    async def sync(self, progress: Callable[[str, float], None] | None = None, org_id: str | None = None, **kwargs) -> dict:
+        """
+        Incrementally sync a source directory: index only new/changed files and
+        delete chunks of removed ones. The ingester's manifest is only updated
+        once the index reflects the plan.
+        """
+        logger.info("RagService.sync called with kwargs=%s", kwargs)
+        directory = kwargs.get("directory")
+        lock = self._sync_locks.setdefault((org_id, str(directory) if directory else None), asyncio.Lock())
+        async with lock:
+            return await self._sync(progress, org_id, **kwargs)
+
+    async def _sync(self, progress: Callable[[str, float], None] | None, org_id: str | None, **kwargs) -> dict:
+        report = progress or (lambda stage, fraction: None)
+        report("planning", 0.0)
+        with span("ingest.planning"):
+            plan = await self._ingester.sync(org_id=org_id, **kwargs)
+        upserted = 0
+        async with self.lease_retriever(org_id) as retriever:
+            report("deleting", 0.4)
+            with span("ingest.deleting"):
+                await retriever.delete(plan.stale_ids)
+            report("indexing", 0.5)
+            # Each batch is indexed before the next is read, so memory does not grow with the files.
+            async for batch in self._ingester.sync_stream(plan, **kwargs):
+                with span("ingest.indexing"):
+                    await retriever.ingest(batch)
+                upserted += len(batch)
+        self._ingester.commit_sync(plan)
+        if self._answer_cache is not None and (upserted or plan.stale_ids):
+            self._answer_cache.bump_generation()
+        report("done", 1.0)
+        summary = {
+            "added": len(plan.added),
+            "changed": len(plan.changed),
+            "removed": len(plan.removed),
+            "unchanged": plan.unchanged,
+            "chunks_upserted": upserted,
+            "chunks_deleted": len(plan.stale_ids),
+        }
+        logger.info("Sync finished: %s", summary)
+        return summary
+
+    async def aclose(self) -> None:
+        """Flush buffered interactions, close the default retriever's clients and ingestion workers; called on shutdown."""
+        if self._interactions is not None:
+            await self._interactions.aclose()
+        for component in (self._retriever, self._ingester):
+            close = getattr(component, "aclose", None)
+            if close is not None:
+                await close()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable
+from ..domain.ports import RetrieveDocumentsPort
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+RetrieverFactory = Callable[[str], Awaitable[RetrieveDocumentsPort]]
+
+# Org ids name per-tenant collections and directories as they are, so no two may map to the same name.
+ORG_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+
+def validate_org_id(org_id: str) -> str:
+    if not re.fullmatch(ORG_ID_PATTERN, org_id):
+        raise ValueError(f"Invalid org_id {org_id!r}: use 1-64 letters, digits, '_' or '-'")
+    return org_id
+
+
+@dataclass
+class TenantStats:
+    hits: int = 0
+    loads: int = 0
+    load_seconds: float = 0.0
+    last_used: float = 0.0
+
+
+class TenantRegistry:
+    """
+    Lazily builds and caches one retriever (index, collection, clients) per organisation.
+
+    At most `max_tenants` retrievers stay resident; the least recently used one
+    is evicted and closed (`aclose()`), which releases its index memory and
+    client connections. Callers that use a retriever across awaits take it
+    with `lease()`: an evicted retriever that is still leased is closed only
+    when its last lease ends. Concurrent first requests for the same org
+    share a single build. Per-tenant stats are kept for at most `max_tracked`
+    orgs so memory stays flat however many tenants exist; `save_activity`
+    and `load_activity` carry the most active orgs over a restart for
+    warming.
+    """
+
+    def __init__(self, factory: RetrieverFactory, max_tenants: int = 32, max_tracked: int = 1024) -> None:
+        if max_tenants < 1:
+            raise ValueError(f"max_tenants must be at least 1, got {max_tenants}")
+        self._factory = factory
+        self.max_tenants = max_tenants
+        self.max_tracked = max_tracked
+        self._resident: OrderedDict[str, RetrieveDocumentsPort] = OrderedDict()
+        self._loading: dict[str, asyncio.Future] = {}
+        self._stats: OrderedDict[str, TenantStats] = OrderedDict()
+        # id(retriever) -> open leases, and evicted retrievers waiting for their last lease to end.
+        self._leases: dict[int, int] = {}
+        self._retired: dict[int, RetrieveDocumentsPort] = {}
+        self._evictions = 0
+        logger.info("Initialized TenantRegistry max_tenants=%d", max_tenants)
+
+    def _tenant_stats(self, org_id: str) -> TenantStats:
+        stats = self._stats.pop(org_id, None) or TenantStats()
+        self._stats[org_id] = stats
+        while len(self._stats) > self.max_tracked:
+            self._stats.popitem(last=False)
+        return stats
+
+    async def get(self, org_id: str) -> RetrieveDocumentsPort:
+        """The org's retriever, unleased: it may be closed by a later eviction."""
+        validate_org_id(org_id)
+        stats = self._tenant_stats(org_id)
+        stats.last_used = time.time()
+        retriever = self._resident.get(org_id)
+        if retriever is not None:
+            self._resident.move_to_end(org_id)
+            stats.hits += 1
+            return retriever
+
+        loading = self._loading.get(org_id)
+        if loading is not None:
+            # Someone is already building this tenant: wait for the same result.
+            stats.hits += 1
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                if not loading.cancelled():
+                    raise
+                # The build was cancelled, not this caller: start another one.
+                return await self.get(org_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[org_id] = future
+        started = time.perf_counter()
+        try:
+            retriever = await self._factory(org_id)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting.
+            future.exception()
+            raise
+        except BaseException:
+            # Cancelled mid-build: release the waiters instead of leaving them on an unresolved future.
+            future.cancel()
+            raise
+        finally:
+            self._loading.pop(org_id, None)
+        stats.loads += 1
+        stats.load_seconds += time.perf_counter() - started
+        logger.info("Loaded retriever for org %s in %.3fs", org_id, time.perf_counter() - started)
+        self._resident[org_id] = retriever
+        future.set_result(retriever)
+        await self._evict_overflow()
+        return retriever
+
+    @asynccontextmanager
+    async def lease(self, org_id: str) -> AsyncIterator[RetrieveDocumentsPort]:
+        """The org's retriever, kept open until the block exits even if it is evicted meanwhile."""
+        retriever = await self.get(org_id)
+        key = id(retriever)
+        self._leases[key] = self._leases.get(key, 0) + 1
+        try:
+            yield retriever
+        finally:
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+                retired = self._retired.pop(key, None)
+                if retired is not None:
+                    await self._close(retired)
+
+    async def _retire(self, retriever: RetrieveDocumentsPort) -> None:
+        if id(retriever) in self._leases:
+            self._retired[id(retriever)] = retriever
+        else:
+            await self._close(retriever)
+
+    async def _evict_overflow(self) -> None:
+        while len(self._resident) > self.max_tenants:
+            org_id, retriever = self._resident.popitem(last=False)
+            self._evictions += 1
+            logger.info("Evicting retriever for org %s", org_id)
+            await self._retire(retriever)
+
+    @staticmethod
+    async def _close(retriever: RetrieveDocumentsPort) -> None:
+        close = getattr(retriever, "aclose", None)
+        if close is None:
+            return
+        try:
+            await close()
+        except Exception as e:
+            logger.error("Failed to close retriever: %s", e)
+
+    async def evict(self, org_id: str) -> None:
+        retriever = self._resident.pop(org_id, None)
+        if retriever is not None:
+            await self._retire(retriever)
+
+    async def warm(self, org_ids: list[str]) -> None:
+        """Build retrievers for these orgs concurrently (at most max_tenants of them)."""
+        org_ids = list(dict.fromkeys(org_ids))[:self.max_tenants]
+        results = await asyncio.gather(*(self.get(org_id) for org_id in org_ids), return_exceptions=True)
+        for org_id, result in zip(org_ids, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to warm org %s: %s", org_id, result)
+
+    def most_active(self, n: int) -> list[str]:
+        """Org ids with the most requests among those still tracked."""
+        ranked = sorted(self._stats.items(), key=lambda item: item[1].hits + item[1].loads, reverse=True)
+        return [org_id for org_id, _ in ranked[:n]]
+
+    def save_activity(self, path: str, n: int) -> None:
+        """Write the `n` most active org ids, for `load_activity` to warm on the next start."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.most_active(n), f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load_activity(path: str) -> list[str]:
+        try:
+            with open(path) as f:
+                org_ids = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return [org_id for org_id in org_ids if isinstance(org_id, str) and re.fullmatch(ORG_ID_PATTERN, org_id)]
+
+    async def close(self) -> None:
+        """Close every retriever, leased or not; called on shutdown."""
+        while self._resident:
+            _, retriever = self._resident.popitem(last=False)
+            await self._close(retriever)
+        while self._retired:
+            _, retriever = self._retired.popitem()
+            await self._close(retriever)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "resident": len(self._resident),
+            "max_tenants": self.max_tenants,
+            "evictions": self._evictions,
+            "leased": len(self._leases),
+            "retired": len(self._retired),
+            "tenants": {org_id: asdict(stats) for org_id, stats in self._stats.items()},
+        }
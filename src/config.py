@@ -0,0 +1,198 @@
+import os
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any
+
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_CONFIG_PATH = "config.yaml"
+
+
+def env(name: str) -> dict:
+    """Field metadata: the environment variable that overrides this setting."""
+    return {"env": name}
+
+
+@dataclass
+class ServerConfig:
+    # Load model weights when the app is created, so forked workers (gunicorn --preload) share them.
+    preload: bool = field(default=False, metadata=env("RAG_PRELOAD"))
+    # Run one embedding at startup so the first request does not pay for lazy init.
+    warmup: bool = field(default=True, metadata=env("RAG_WARMUP"))
+    metrics: bool = field(default=True, metadata=env("RAG_METRICS"))
+
+
+@dataclass
+class QdrantConfig:
+    url: str = field(default="http://localhost:6333", metadata=env("QDRANT_DB_URL"))
+    api_key: str = field(default="", metadata=env("QDRANT_API_KEY"))
+    collection: str = field(default="rag_collection", metadata=env("QDRANT_COLLECTION"))
+    enable_hybrid: bool = field(default=False, metadata=env("QDRANT_ENABLE_HYBRID"))
+
+
+@dataclass
+class PostgresConfig:
+    # Set to serve the default (non-tenant) index from pgvector instead of Qdrant.
+    dsn: str = field(default="", metadata=env("POSTGRES_DSN"))
+    table: str = field(default="embeddings", metadata=env("PGVECTOR_TABLE"))
+    dimension: int = 768
+    distance: str = "cosine"
+    index_type: str = "hnsw"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    ef_search: int = 64
+    ivfflat_lists: int = 100
+    probes: int = 10
+    pool_min_size: int = 2
+    pool_max_size: int = field(default=10, metadata=env("PG_POOL_SIZE"))
+    insert_batch_size: int = 5000
+
+
+@dataclass
+class EmbeddingConfig:
+    model_name: str = field(default="BAAI/bge-base-en-v1.5", metadata=env("RAG_EMBED_MODEL"))
+    cache_dir: str = "./fastembed_weights"
+    batch_size: int = 256
+    query_batch_size: int = 32
+    query_wait_ms: float = 5.0
+    # Persistent content-addressed embedding cache shared by all workers, one table of
+    # vector_cache_mb per model under vector_cache_dir; empty disables it.
+    vector_cache_dir: str = field(default="embedding_cache", metadata=env("RAG_EMBED_CACHE_DIR"))
+    vector_cache_mb: int = field(default=256, metadata=env("RAG_EMBED_CACHE_MB"))
+
+
+@dataclass
+class GeneratorConfig:
+    model: str = field(default="openai/gpt-4o-mini", metadata=env("RAG_LLM_MODEL"))
+    # Concurrent LLM calls per /ask/batch request.
+    batch_concurrency: int = field(default=8, metadata=env("RAG_BATCH_CONCURRENCY"))
+
+
+@dataclass
+class RetrievalConfig:
+    similarity_top_k: int = 3
+    # Empty string disables the in-process BM25 index.
+    sparse_index_dir: str = field(default="sparse_index", metadata=env("RAG_SPARSE_INDEX_DIR"))
+    # Seconds between background saves of a changed BM25 index; it is also saved on shutdown.
+    sparse_persist_interval: float = field(default=30.0, metadata=env("RAG_SPARSE_PERSIST_INTERVAL"))
+    context_tokens: int = field(default=2000, metadata=env("RAG_CONTEXT_TOKENS"))
+    tokenizer: str = "o200k_base"
+
+
+@dataclass
+class AdmissionConfig:
+    enabled: bool = field(default=True, metadata=env("RAG_ADMISSION"))
+    # Share one execution between identical (question, filters, org) asks in flight.
+    single_flight: bool = True
+    embedding_concurrency: int = 32
+    retrieval_concurrency: int = field(default=32, metadata=env("RAG_RETRIEVAL_CONCURRENCY"))
+    generation_concurrency: int = field(default=16, metadata=env("RAG_GENERATION_CONCURRENCY"))
+    # Waiters per stage beyond which requests get 429, and the longest wait before 503.
+    max_queue: int = field(default=64, metadata=env("RAG_ADMISSION_QUEUE"))
+    queue_timeout: float = 10.0
+
+
+@dataclass
+class AnswerCacheConfig:
+    enabled: bool = True
+    max_entries: int = 2048
+    ttl: float = 3600.0
+    threshold: float = 0.95
+
+
+@dataclass
+class TenantsConfig:
+    max_tenants: int = field(default=32, metadata=env("RAG_MAX_TENANTS"))
+    warm: list = field(default_factory=list, metadata=env("RAG_WARM_TENANTS"))
+    # Also warm the orgs that were most active before the last shutdown (0 disables).
+    warm_active: int = field(default=8, metadata=env("RAG_WARM_ACTIVE_TENANTS"))
+    # Where that list is kept; empty means <ingestion.storage_dir>/.tenant_activity.json.
+    activity_file: str = ""
+
+
+@dataclass
+class IngestionConfig:
+    storage_dir: str = "ingestion_files"
+    concurrency: int = field(default=2, metadata=env("INGEST_CONCURRENCY"))
+    queue_size: int = field(default=64, metadata=env("INGEST_QUEUE_SIZE"))
+    chunk_size: int = 312
+    chunk_overlap: int = 50
+    # Process-pool ingestion: 0 keeps parsing in-process on a thread.
+    workers: int = field(default=0, metadata=env("INGEST_WORKERS"))
+    shards_per_worker: int = 4
+    # Embed chunks inside the workers (large batches) instead of in the server process.
+    embed_in_workers: bool = True
+    worker_threads: int = field(default=1, metadata=env("INGEST_WORKER_THREADS"))
+    # Plain-text files at least this large are read and chunked as a stream; 0 disables streaming.
+    stream_threshold_mb: int = field(default=64, metadata=env("INGEST_STREAM_THRESHOLD_MB"))
+    stream_batch_size: int = 256
+    stream_block_kb: int = 1024
+
+
+@dataclass
+class InteractionsConfig:
+    # Empty disables the interaction log.
+    mongo_url: str = field(default="", metadata=env("MONGO_URL"))
+    db_name: str = field(default="rag", metadata=env("MONGO_DB"))
+    batch_size: int = 100
+    flush_interval: float = 1.0
+    max_buffer: int = 10000
+    overflow: str = "drop_oldest"
+
+
+@dataclass
+class AppConfig:
+    server: ServerConfig = field(default_factory=ServerConfig)
+    qdrant: QdrantConfig = field(default_factory=QdrantConfig)
+    postgres: PostgresConfig = field(default_factory=PostgresConfig)
+    embedding: EmbeddingConfig = field(default_factory=EmbeddingConfig)
+    generator: GeneratorConfig = field(default_factory=GeneratorConfig)
+    retrieval: RetrievalConfig = field(default_factory=RetrievalConfig)
+    answer_cache: AnswerCacheConfig = field(default_factory=AnswerCacheConfig)
+    admission: AdmissionConfig = field(default_factory=AdmissionConfig)
+    tenants: TenantsConfig = field(default_factory=TenantsConfig)
+    ingestion: IngestionConfig = field(default_factory=IngestionConfig)
+    interactions: InteractionsConfig = field(default_factory=InteractionsConfig)
+
+
+def _coerce(value: Any, like: Any) -> Any:
+    if isinstance(like, bool):
+        return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    if isinstance(like, list):
+        return list(value) if isinstance(value, (list, tuple)) else [v.strip() for v in str(value).split(",") if v.strip()]
+    return "" if value is None else str(value)
+
+
+def load_config(path: str | Path | None = None) -> AppConfig:
+    """
+    Defaults, overridden by the YAML file (`path`, else $RAG_CONFIG, else
+    config.yaml when present), overridden by environment variables.
+    """
+    path = Path(path or os.getenv("RAG_CONFIG", DEFAULT_CONFIG_PATH))
+    data = {}
+    if path.exists():
+        import yaml
+        data = yaml.safe_load(path.read_text()) or {}
+    config = AppConfig()
+    for section_field in fields(AppConfig):
+        section = getattr(config, section_field.name)
+        values = data.get(section_field.name) or {}
+        unknown = set(values) - {f.name for f in fields(section)}
+        if unknown:
+            raise ValueError(f"Unknown settings in {path} [{section_field.name}]: {sorted(unknown)}")
+        for f in fields(section):
+            current = getattr(section, f.name)
+            if f.name in values:
+                current = _coerce(values[f.name], current)
+            env_name = f.metadata.get("env")
+            if env_name and os.getenv(env_name) is not None:
+                current = _coerce(os.getenv(env_name), current)
+            setattr(section, f.name, current)
+    logger.info("Loaded config from %s", path if path.exists() else "defaults/env")
+    return config
@@ -0,0 +1,335 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from array import array
+from pathlib import Path
+import json
+import math
+import os
+import re
+import threading
+import numpy as np
+from .vector_utils import top_k_indices, matches_filter
+from .metadata_index import MetadataIndex
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+STATE_FILE = "bm25.json"
+POSTINGS_FILE = "postings.npz"
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+Tokenizer = Callable[[str], List[str]]
+
+
+def persisted_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """(inode, mtime) of the state saved under `path`, None if nothing is saved; it changes on every persist."""
+    try:
+        st = os.stat(os.path.join(path, STATE_FILE))
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def default_tokenizer(text: str) -> List[str]:
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index.
+
+    Each term's postings are two append-only typed arrays (doc numbers and
+    term frequencies). Doc numbers are handed out in increasing order, so
+    postings stay sorted and can be binary-searched. Deletes are tombstones.
+    `compact()` rewrites the postings once dead docs exceed
+    `compaction_threshold`.
+
+    Top-k search uses MaxScore-style pruning, vectorised term-at-a-time.
+    Terms are visited from the highest score upper bound down. Each term's
+    whole posting list is scored while the bounds of the unvisited terms
+    could still lift an unseen doc into the top k. Past that point only the
+    existing candidates are scored, by binary search into the remaining
+    postings, and a candidate is dropped as soon as it cannot reach the
+    current k-th score. Rare, high-IDF terms do the work and the long
+    postings of common terms are mostly skipped.
+    """
+
+    def __init__(self,
+                 k1: float = 1.2,
+                 b: float = 0.75,
+                 tokenizer: Optional[Tokenizer] = None,
+                 compaction_threshold: float = 0.25) -> None:
+        self.k1 = k1
+        self.b = b
+        self.compaction_threshold = compaction_threshold
+        self._tokenize = tokenizer or default_tokenizer
+        self._lock = threading.RLock()
+        self._reset()
+        logger.info("Initialized BM25Index k1=%s b=%s", k1, b)
+
+    def _reset(self) -> None:
+        self._docs: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._df: Dict[str, int] = {}
+        self._lengths = array("i")
+        self._alive = bytearray()
+        self._ids: List[Optional[str]] = []
+        self._texts: List[Optional[str]] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._id_to_doc: Dict[str, int] = {}
+        self._metadata_index = MetadataIndex()
+        self._total_length = 0
+        self._dead = 0
+        # term -> max possible contribution; dropped whenever the corpus changes.
+        self._bounds: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._id_to_doc)
+
+    def add(self,
+            ids: Sequence[str],
+            texts: Sequence[str],
+            metadata: Optional[Sequence[Dict[str, Any]]] = None) -> None:
+        """Index documents; re-adding an existing id replaces it."""
+        metadata = metadata or [{} for _ in ids]
+        if not (len(ids) == len(texts) == len(metadata)):
+            raise ValueError("ids, texts and metadata must have the same length")
+        tokenized = [self._tokenize(text or "") for text in texts]
+        with self._lock:
+            self._delete([doc_id for doc_id in ids if doc_id in self._id_to_doc])
+            for doc_id, text, meta, tokens in zip(ids, texts, metadata, tokenized):
+                doc = len(self._ids)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for term, tf in counts.items():
+                    if term not in self._docs:
+                        self._docs[term] = array("i")
+                        self._tfs[term] = array("i")
+                        self._df[term] = 0
+                    self._docs[term].append(doc)
+                    self._tfs[term].append(tf)
+                    self._df[term] += 1
+                self._lengths.append(len(tokens))
+                self._alive.append(1)
+                self._ids.append(doc_id)
+                self._texts.append(text)
+                self._metadata.append(dict(meta))
+                self._metadata_index.add(doc, meta)
+                self._id_to_doc[doc_id] = doc
+                self._total_length += len(tokens)
+            self._bounds.clear()
+        logger.debug("Indexed %d documents (total=%d)", len(ids), len(self))
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete(ids)
+            if self._dead > self.compaction_threshold * max(1, len(self._ids)):
+                self.compact()
+
+    def _delete(self, ids: Sequence[str]) -> None:
+        for doc_id in ids:
+            doc = self._id_to_doc.pop(doc_id, None)
+            if doc is None:
+                continue
+            for term in set(self._tokenize(self._texts[doc] or "")):
+                self._df[term] -= 1
+            self._alive[doc] = 0
+            self._total_length -= self._lengths[doc]
+            self._metadata_index.remove(doc, self._metadata[doc])
+            self._ids[doc] = None
+            self._texts[doc] = None
+            self._metadata[doc] = {}
+            self._dead += 1
+        if ids:
+            self._bounds.clear()
+
+    def compact(self) -> None:
+        """Drop tombstoned docs and renumber the rest."""
+        with self._lock:
+            alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+            remap = np.cumsum(alive, dtype=np.int64) - 1
+            for term in list(self._docs):
+                docs = np.frombuffer(self._docs[term], dtype=np.int32)
+                keep = alive[docs]
+                if not keep.any():
+                    del self._docs[term], self._tfs[term], self._df[term]
+                    continue
+                self._docs[term] = array("i", remap[docs[keep]].astype(np.int32).tobytes())
+                self._tfs[term] = array("i", np.frombuffer(self._tfs[term], dtype=np.int32)[keep].tobytes())
+            keep_docs = np.flatnonzero(alive)
+            self._lengths = array("i", np.frombuffer(self._lengths, dtype=np.int32)[keep_docs].tobytes())
+            self._alive = bytearray(b"\x01" * keep_docs.size)
+            self._ids = [self._ids[d] for d in keep_docs]
+            self._texts = [self._texts[d] for d in keep_docs]
+            self._metadata = [self._metadata[d] for d in keep_docs]
+            self._id_to_doc = {doc_id: doc for doc, doc_id in enumerate(self._ids)}
+            self._metadata_index.clear()
+            for doc, meta in enumerate(self._metadata):
+                self._metadata_index.add(doc, meta)
+            self._dead = 0
+            self._bounds.clear()
+        logger.debug("Compacted BM25 index to %d documents", len(self))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _idf(self, term: str) -> float:
+        n, df = len(self._id_to_doc), self._df[term]
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def _contributions(self, term: str, docs: np.ndarray, tfs: np.ndarray, lengths: np.ndarray, avgdl: float) -> np.ndarray:
+        tfs = tfs.astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avgdl)
+        return (self._idf(term) * tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+    def search(self,
+               query: str,
+               top_k: int = 5,
+               metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        terms = list(dict.fromkeys(self._tokenize(query)))
+        with self._lock:
+            terms = [t for t in terms if self._df.get(t)]
+            if not terms or top_k <= 0 or not self._id_to_doc:
+                return []
+            n_docs = len(self._ids)
+            lengths = np.frombuffer(self._lengths, dtype=np.int32)
+            usable = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+            if metadata_filter:
+                usable &= self._filter_mask(metadata_filter, n_docs)
+                if not usable.any():
+                    return []
+            avgdl = max(self._total_length / len(self._id_to_doc), 1e-9)
+
+            postings = {t: (np.frombuffer(self._docs[t], dtype=np.int32),
+                            np.frombuffer(self._tfs[t], dtype=np.int32)) for t in terms}
+            for term in terms:
+                if term not in self._bounds:
+                    docs, tfs = postings[term]
+                    self._bounds[term] = float(self._contributions(term, docs, tfs, lengths, avgdl).max())
+            terms.sort(key=self._bounds.__getitem__, reverse=True)
+            # remaining[i]: best score a doc can still collect from terms i..end.
+            remaining = np.cumsum([self._bounds[t] for t in terms][::-1])[::-1].tolist() + [0.0]
+
+            scores = np.zeros(n_docs, dtype=np.float32)
+            seen = np.zeros(n_docs, dtype=bool)
+            threshold = 0.0
+            i = 0
+            # Phase 1: full postings, while an unseen doc could still make the top k.
+            while i < len(terms) and (seen.sum() < top_k or remaining[i] > threshold):
+                docs, tfs = postings[terms[i]]
+                keep = usable[docs]
+                docs = docs[keep]
+                scores[docs] += self._contributions(terms[i], docs, tfs[keep], lengths, avgdl)
+                seen[docs] = True
+                threshold = self._kth_score(scores[seen], top_k)
+                i += 1
+
+            candidates = np.flatnonzero(seen)
+            # Phase 2: only existing candidates can win; probe the rest of the postings for them.
+            for j in range(i, len(terms)):
+                candidates = candidates[scores[candidates] + remaining[j] >= threshold]
+                docs, tfs = postings[terms[j]]
+                pos = np.searchsorted(docs, candidates)
+                pos[pos == docs.size] = 0
+                hit = docs[pos] == candidates
+                matched = candidates[hit]
+                scores[matched] += self._contributions(terms[j], matched, tfs[pos[hit]], lengths, avgdl)
+                threshold = self._kth_score(scores[candidates], top_k)
+
+            best = top_k_indices(scores[candidates], top_k)
+            return [self._result(int(candidates[b]), float(scores[candidates[b]])) for b in best]
+
+    @staticmethod
+    def _kth_score(scores: np.ndarray, k: int) -> float:
+        if scores.size < k:
+            return 0.0
+        return float(np.partition(scores, scores.size - k)[scores.size - k])
+
+    def _filter_mask(self, metadata_filter: Dict[str, Any], n_docs: int) -> np.ndarray:
+        mask = np.zeros(n_docs, dtype=bool)
+        matched = self._metadata_index.lookup(metadata_filter)
+        if matched is None:
+            matched = [d for d in self._id_to_doc.values() if matches_filter(self._metadata[d], metadata_filter)]
+        mask[list(matched)] = True
+        return mask
+
+    def _result(self, doc: int, score: float) -> Dict[str, Any]:
+        return {
+            "id": self._ids[doc],
+            "score": score,
+            "document": self._texts[doc],
+            "metadata": dict(self._metadata[doc]),
+        }
+
+    def persist(self, path: str) -> None:
+        """
+        Save the index under `path`. The state is copied under the lock and
+        written outside it, so searches and adds are only held up for the copy.
+        Both files carry the same random version, which `load` checks.
+        """
+        target = Path(path)
+        target.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if self._dead:
+                self.compact()
+            terms = list(self._docs)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(self._docs[t]) for t in terms])
+            postings = {
+                "offsets": offsets,
+                "docs": np.concatenate([np.frombuffer(self._docs[t], dtype=np.int32) for t in terms] or [np.empty(0, np.int32)]),
+                "tfs": np.concatenate([np.frombuffer(self._tfs[t], dtype=np.int32) for t in terms] or [np.empty(0, np.int32)]),
+                "lengths": np.frombuffer(self._lengths, dtype=np.int32).copy(),
+            }
+            # Metadata dicts are replaced, never edited in place, so shallow copies are enough.
+            state = {
+                "k1": self.k1,
+                "b": self.b,
+                "terms": terms,
+                "ids": list(self._ids),
+                "documents": list(self._texts),
+                "metadata": list(self._metadata),
+            }
+            count = len(self)
+        version = os.urandom(8).hex()
+        state["version"] = version
+        tmp = target / (POSTINGS_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, version=np.array(version), **postings)
+        os.replace(tmp, target / POSTINGS_FILE)
+        tmp = target / (STATE_FILE + ".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, target / STATE_FILE)
+        logger.info("Persisted BM25 index with %d documents to %s", count, target)
+
+    def load(self, path: str) -> None:
+        source = Path(path)
+        state = json.loads((source / STATE_FILE).read_text())
+        with np.load(source / POSTINGS_FILE) as data:
+            offsets, docs, tfs, lengths = data["offsets"], data["docs"], data["tfs"], data["lengths"]
+            version = str(data["version"]) if "version" in data.files else None
+        if version != state.get("version"):
+            # Read while another process was replacing the files.
+            raise ValueError(f"BM25 files in {source} are from different saves")
+        with self._lock:
+            self._reset()
+            self.k1, self.b = state["k1"], state["b"]
+            for t, term in enumerate(state["terms"]):
+                start, end = offsets[t], offsets[t + 1]
+                self._docs[term] = array("i", docs[start:end].astype(np.int32).tobytes())
+                self._tfs[term] = array("i", tfs[start:end].astype(np.int32).tobytes())
+                self._df[term] = int(end - start)
+            self._lengths = array("i", lengths.astype(np.int32).tobytes())
+            self._alive = bytearray(b"\x01" * len(state["ids"]))
+            self._ids = list(state["ids"])
+            self._texts = list(state["documents"])
+            self._metadata = list(state["metadata"])
+            self._id_to_doc = {doc_id: doc for doc, doc_id in enumerate(self._ids)}
+            for doc, meta in enumerate(self._metadata):
+                self._metadata_index.add(doc, meta)
+            self._total_length = int(lengths.sum())
+        logger.info("Loaded BM25 index with %d documents from %s", len(self), source)
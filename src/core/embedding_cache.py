@@ -0,0 +1,260 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+META_FILE = "meta.json"
+_FORMAT_VERSION = 1
+# Per row: two uint64 key words, one uint64 last-use stamp.
+_ROW_OVERHEAD = 24
+
+
+def normalize_text(text: str) -> str:
+    """NFC and collapsed whitespace, so trivially different copies of a chunk share an entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def model_dir_name(model_name: str) -> str:
+    """Readable, collision-free directory name for a model's table."""
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("._")[:48]
+    return f"{safe}-{hashlib.blake2b(model_name.encode(), digest_size=4).hexdigest()}"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache on local disk, shared by every process
+    that opens the same directory. Each model gets its own subdirectory
+    (`model_dir_name`), so embedders of different models never share or
+    rebuild each other's table.
+
+    Keys are a 128-bit blake2b of (model name, kind, normalized text). "kind"
+    separates query and document embeddings, since many models embed them
+    differently. Entries live in fixed-size memory-mapped files (keys,
+    stamps, vectors; `meta.json` names the current ones), laid out as a
+    `ways`-way set-associative table sized from `max_bytes`. A key can only sit in the
+    `ways` rows of its set, so a lookup is one vectorized compare. When a set
+    is full, its least recently used row is overwritten. That is the size
+    bound: the files never grow.
+
+    Lookups take no lock. A writer clears a row's key before rewriting its
+    vector and sets the key last, and a reader re-checks the key after
+    copying the vector, so a row being replaced reads as a miss. Writers in
+    different processes are serialized with an flock on `lock`. The table is
+    created on the first write, once the dimension is known. It is replaced
+    by fresh files if the dimension or table size no longer match. Lookups
+    notice a rebuild by another process through `meta.json` and remap.
+    """
+
+    def __init__(self, path: str, model_name: str, max_bytes: int = 256 << 20, ways: int = 8) -> None:
+        self.path = os.path.join(path, model_dir_name(model_name))
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ways = ways
+        self.dim: Optional[int] = None
+        self.sets = 0
+        self._keys: Optional[np.ndarray] = None
+        self._stamps: Optional[np.ndarray] = None
+        self._vectors: Optional[np.ndarray] = None
+        # (sets, keys, stamps, vectors) of one table, replaced as a whole so lookups never mix two tables.
+        self._view: Optional[Tuple[int, np.ndarray, np.ndarray, np.ndarray]] = None
+        self._tag: Optional[str] = None
+        # (inode, mtime) of the meta.json last read; meta.json is replaced, never edited.
+        self._meta_stamp: Optional[Tuple[int, int]] = None
+        self._thread_lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+        self._lock_pid: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._open_existing()
+
+    # ---------- files ----------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._file(META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _map(self, meta: Dict, mode: str) -> None:
+        capacity = meta["sets"] * self.ways
+        tag = meta["tag"]
+        self._keys = np.memmap(self._file(f"{tag}.keys"), dtype=np.uint64, mode=mode, shape=(capacity, 2))
+        self._stamps = np.memmap(self._file(f"{tag}.stamps"), dtype=np.uint64, mode=mode, shape=(capacity,))
+        self._vectors = np.memmap(self._file(f"{tag}.vectors"), dtype=np.float32, mode=mode, shape=(capacity, meta["dim"]))
+        self.sets = meta["sets"]
+        self.dim = meta["dim"]
+        self._tag = tag
+        self._view = (self.sets, self._keys, self._stamps, self._vectors)
+
+    def _meta_changed(self) -> bool:
+        try:
+            st = os.stat(self._file(META_FILE))
+        except OSError:
+            return False
+        return (st.st_ino, st.st_mtime_ns) != self._meta_stamp
+
+    def _open_existing(self) -> bool:
+        try:
+            st = os.stat(self._file(META_FILE))
+            self._meta_stamp = (st.st_ino, st.st_mtime_ns)
+        except OSError:
+            pass
+        meta = self._read_meta()
+        if (meta is None or meta.get("version") != _FORMAT_VERSION or meta.get("model_name") != self.model_name
+                or meta.get("ways") != self.ways):
+            return False
+        if meta["tag"] != self._tag:
+            self._map(meta, "r+")
+        return True
+
+    def _create(self, dim: int) -> None:
+        """
+        New table files for this model and dimension; the caller holds the
+        write lock. Files of the previous table are unlinked, not truncated,
+        so processes that still map them keep working until they reopen.
+        """
+        previous = self._read_meta()
+        sets = self._sets_for(dim)
+        tag = hashlib.blake2b(f"{self.model_name}:{dim}:{sets}:{time.time_ns()}".encode(), digest_size=6).hexdigest()
+        meta = {"version": _FORMAT_VERSION, "model_name": self.model_name, "dim": dim,
+                "sets": sets, "ways": self.ways, "tag": tag}
+        self._map(meta, "w+")
+        for array in (self._keys, self._stamps, self._vectors):
+            array.flush()
+        tmp = self._file(META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file(META_FILE))
+        if previous and previous.get("tag"):
+            for suffix in ("keys", "stamps", "vectors"):
+                try:
+                    os.unlink(self._file(f"{previous['tag']}.{suffix}"))
+                except OSError:
+                    pass
+
+    def _sets_for(self, dim: int) -> int:
+        rows = max(self.ways, self.max_bytes // (dim * 4 + _ROW_OVERHEAD))
+        return rows // self.ways
+
+    def _ensure_table(self, dim: int) -> None:
+        # Another process may have created (or rebuilt) the table since we looked.
+        self._open_existing()
+        # A changed max_bytes resizes the table, like a changed dimension.
+        if self.dim != dim or self._keys is None or self.sets != self._sets_for(dim):
+            self._create(dim)
+
+    def _write_lock(self) -> int:
+        # flock is tied to the open file description, which a fork shares: reopen per process.
+        if self._lock_pid != os.getpid():
+            self._lock_fd = os.open(self._file("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        return self._lock_fd
+
+    # ---------- keys ----------
+
+    def keys(self, texts: Sequence[str], kind: str) -> np.ndarray:
+        prefix = f"{self.model_name}\0{kind}\0".encode()
+        digests = b"".join(
+            hashlib.blake2b(prefix + normalize_text(text).encode(), digest_size=16).digest() for text in texts
+        )
+        keys = np.frombuffer(digests, dtype="<u8").reshape(-1, 2).astype(np.uint64)
+        # An all-zero key marks an empty row.
+        keys[:, 1] |= np.uint64(1)
+        return keys
+
+    def _candidate_rows(self, keys: np.ndarray, n_sets: int) -> np.ndarray:
+        sets = (keys[:, 0] % np.uint64(n_sets)).astype(np.int64)
+        return sets[:, None] * self.ways + np.arange(self.ways)
+
+    # ---------- lookups ----------
+
+    def get_many(self, texts: Sequence[str], kind: str) -> Tuple[List[Optional[List[float]]], int]:
+        """Cached vectors (None for misses) in input order, and the number of hits."""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        # A table rebuilt by another process replaces meta.json: follow it.
+        if self._meta_changed():
+            self._open_existing()
+        view = self._view
+        if view is None:
+            self._misses += len(texts)
+            return results, 0
+        if not texts:
+            return results, 0
+        n_sets, table_keys, stamps, table_vectors = view
+        keys = self.keys(texts, kind)
+        candidates = self._candidate_rows(keys, n_sets)
+        match = (table_keys[candidates] == keys[:, None, :]).all(axis=-1)
+        found = np.flatnonzero(match.any(axis=1))
+        rows = candidates[found, match[found].argmax(axis=1)]
+        vectors = np.array(table_vectors[rows])
+        # Rows rewritten while we copied them no longer carry our key: count those as misses.
+        intact = (table_keys[rows] == keys[found]).all(axis=-1)
+        found, rows, vectors = found[intact], rows[intact], vectors[intact]
+        stamps[rows] = time.time_ns()
+        for i, vector in zip(found.tolist(), vectors):
+            results[i] = vector.tolist()
+        self._hits += len(found)
+        self._misses += len(texts) - len(found)
+        return results, len(found)
+
+    def put_many(self, texts: Sequence[str], kind: str, vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        keys = self.keys(texts, kind)
+        with self._thread_lock:
+            fd = self._write_lock()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                self._ensure_table(matrix.shape[1])
+                candidates = self._candidate_rows(keys, self.sets)
+                now = time.time_ns()
+                for key, rows, vector in zip(keys, candidates, matrix):
+                    current = self._keys[rows]
+                    if (current == key).all(axis=-1).any():
+                        continue
+                    empty = np.flatnonzero((current == 0).all(axis=-1))
+                    if len(empty):
+                        row = rows[empty[0]]
+                    else:
+                        row = rows[int(np.argmin(self._stamps[rows]))]
+                        self._evictions += 1
+                    self._keys[row] = 0
+                    self._vectors[row] = vector
+                    self._stamps[row] = now
+                    self._keys[row] = key
+                    self._writes += 1
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def flush(self) -> None:
+        """Write dirty pages to disk (other processes see writes immediately regardless)."""
+        for array in (self._keys, self._stamps, self._vectors):
+            if array is not None:
+                array.flush()
+
+    def stats(self) -> Dict[str, int]:
+        capacity = self.sets * self.ways
+        entries = int((self._keys[:, 1] != 0).sum()) if self._keys is not None else 0
+        return {
+            "entries": entries,
+            "capacity": capacity,
+            "dim": self.dim or 0,
+            "hits": self._hits,
+            "misses": self._misses,
+            "writes": self._writes,
+            "evictions": self._evictions,
+        }
@@ -0,0 +1,321 @@
+from typing import List, Dict, Any, Optional, Tuple, Union
+from pathlib import Path
+import json
+import os
+import threading
+import uuid
+import numpy as np
+from .base_vectordb import VectorDatabase
+from .vector_utils import EmbedFn, as_matrix, normalize_rows, top_k_indices, matches_filter
+from .quantization import get_quantizer
+from .metadata_index import MetadataIndex
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+STATE_FILE = "store.json"
+CODES_FILE = "codes.npy"
+QUANTIZER_FILE = "quantizer.npz"
+
+
+class FlatVectorDatabase(VectorDatabase):
+    """
+    In-process exact vector store.
+
+    Vectors live in one contiguous float32 matrix and a query is a single
+    matrix-vector product followed by an argpartition top-k. Rows are kept
+    dense: a delete moves the last row into the freed slot.
+    `persist` writes the matrix as `.npy` and `load` memory-maps it, so a
+    restarted worker only pages in what queries actually touch.
+
+    With `quantization="int8"` or `"binary"` the first pass scans compact
+    codes instead of the float matrix, and only the best
+    `top_k * rescore_factor` candidates are rescored exactly. Once loaded,
+    the float matrix stays memory-mapped and only rescored rows are paged in.
+    Raise `rescore_factor` for recall, lower it for latency.
+
+    Metadata filters are resolved through an inverted index. If the filter
+    matches at most `prefilter_threshold` of the rows, only those rows are
+    scored; otherwise the full contiguous scan runs and non-matching rows are
+    masked out afterwards, which is cheaper than gathering most of the matrix.
+    """
+
+    def __init__(self,
+                 dim: Optional[int] = None,
+                 embed_fn: Optional[EmbedFn] = None,
+                 normalize: bool = True,
+                 initial_capacity: int = 1024,
+                 quantization: Optional[str] = None,
+                 rescore_factor: int = 4,
+                 prefilter_threshold: float = 0.25) -> None:
+        self.dim = dim
+        self.normalize = normalize
+        self.rescore_factor = max(1, rescore_factor)
+        self.prefilter_threshold = prefilter_threshold
+        self._metadata_index = MetadataIndex()
+        self._quantizer = get_quantizer(quantization)
+        self._embed_fn = embed_fn
+        self._initial_capacity = max(1, initial_capacity)
+        self._lock = threading.RLock()
+        self._reset()
+        logger.info("Initialized FlatVectorDatabase dim=%s normalize=%s quantization=%s", dim, normalize, quantization)
+
+    def _reset(self) -> None:
+        self._vectors = np.empty((0, self.dim or 0), dtype=np.float32)
+        self._codes: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._metadata: List[Dict[str, Any]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadata_index.clear()
+
+    def __len__(self) -> int:
+        return self._size
+
+    # ---------- helpers ----------
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self._embed_fn is None:
+            raise ValueError("FlatVectorDatabase needs an embed_fn to accept raw text")
+        return as_matrix(self._embed_fn(texts), self.dim)
+
+    def _ensure_capacity(self, extra: int) -> None:
+        """Grow (or un-mmap) the matrix so that `extra` more rows fit."""
+        needed = self._size + extra
+        writable = isinstance(self._vectors, np.ndarray) and not isinstance(self._vectors, np.memmap)
+        if writable and self._vectors.shape[0] >= needed:
+            return
+        capacity = max(self._initial_capacity, self._vectors.shape[0])
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._vectors[:self._size]
+        self._vectors = grown
+        if self._quantizer is not None:
+            codes = np.empty((capacity, self._quantizer.code_size(self.dim)), dtype=self._quantizer.code_dtype)
+            if self._codes is not None:
+                codes[:self._size] = self._codes[:self._size]
+            self._codes = codes
+
+    def _query_vector(self, query: Union[str, np.ndarray]) -> np.ndarray:
+        q = self._embed([query])[0] if isinstance(query, str) else as_matrix(query, self.dim)[0]
+        q = q.copy()
+        if self.normalize:
+            normalize_rows(q.reshape(1, -1))
+        return q
+
+    def _result(self, row: int, score: float) -> Dict[str, Any]:
+        return {
+            "id": self._ids[row],
+            "score": float(score),
+            "document": self._documents[row],
+            "metadata": self._metadata[row],
+        }
+
+    # ---------- VectorDatabase ----------
+
+    def add_documents(self,
+                      documents: List[str],
+                      metadata: Optional[List[Dict[str, Any]]] = None,
+                      ids: Optional[List[str]] = None) -> List[str]:
+        embeddings = self._embed(documents)
+        return self._add(embeddings, metadata, ids, documents)
+
+    def add_embeddings(self,
+                       embeddings: List[np.ndarray],
+                       metadata: Optional[List[Dict[str, Any]]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        return self._add(as_matrix(embeddings, self.dim), metadata, ids, None)
+
+    def _add(self,
+             embeddings: np.ndarray,
+             metadata: Optional[List[Dict[str, Any]]],
+             ids: Optional[List[str]],
+             documents: Optional[List[str]]) -> List[str]:
+        n = embeddings.shape[0]
+        if n == 0:
+            return []
+        metadata = metadata or [{} for _ in range(n)]
+        ids = ids or [uuid.uuid4().hex for _ in range(n)]
+        documents = documents or [None] * n
+        if not (len(metadata) == len(ids) == len(documents) == n):
+            raise ValueError("embeddings, metadata and ids must have the same length")
+        if self.normalize:
+            embeddings = normalize_rows(embeddings.copy())
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            # Re-adding an existing id replaces it.
+            existing = [i for i in ids if i in self._id_to_row]
+            if existing:
+                self.delete(existing)
+            self._ensure_capacity(n)
+            start = self._size
+            self._vectors[start:start + n] = embeddings
+            if self._quantizer is not None:
+                if self._quantizer.update(embeddings):
+                    # The range widened: codes already stored were made with the old one.
+                    self._quantizer.reencode(self._vectors[:self._size], self._codes[:self._size])
+                self._codes[start:start + n] = self._quantizer.encode(embeddings)
+            for offset, (doc_id, meta, doc) in enumerate(zip(ids, metadata, documents)):
+                self._id_to_row[doc_id] = start + offset
+                self._ids.append(doc_id)
+                self._metadata.append(dict(meta))
+                self._metadata_index.add(start + offset, meta)
+                self._documents.append(doc)
+            self._size += n
+        logger.debug("Added %d vectors (total=%d)", n, self._size)
+        return list(ids)
+
+    def similarity_search(self,
+                          query: Union[str, np.ndarray],
+                          top_k: int = 5,
+                          metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        q = self._query_vector(query)
+        with self._lock:
+            if self._size == 0:
+                return []
+            rows, mask = None, None
+            if metadata_filter:
+                rows = self._filter_rows(metadata_filter)
+                if rows.size == 0:
+                    return []
+                if rows.size > self.prefilter_threshold * self._size:
+                    mask = np.zeros(self._size, dtype=bool)
+                    mask[rows] = True
+                    rows = None
+            rows, scores = self._score(q, rows, top_k, mask)
+            best = top_k_indices(scores, top_k)
+            return [self._result(int(rows[i]), scores[i]) for i in best if np.isfinite(scores[i])]
+
+    def _filter_rows(self, metadata_filter: Dict[str, Any]) -> np.ndarray:
+        matched = self._metadata_index.lookup(metadata_filter)
+        if matched is None:
+            # Not servable from the index (e.g. unhashable values): fall back to a scan.
+            matched = {r for r in range(self._size) if matches_filter(self._metadata[r], metadata_filter)}
+        return MetadataIndex.to_array(matched)
+
+    def _score(self,
+               q: np.ndarray,
+               rows: Optional[np.ndarray],
+               top_k: int,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score candidate rows (all rows if None; `mask` then hides non-matching
+        rows). With a quantizer, the codes are scanned first and only the
+        oversampled best rows get exact scores.
+        """
+        if self._quantizer is None:
+            if rows is not None:
+                return rows, self._vectors[rows] @ q
+            scores = self._vectors[:self._size] @ q
+            if mask is not None:
+                scores[~mask] = -np.inf
+            return np.arange(self._size), scores
+
+        codes = self._codes[:self._size] if rows is None else self._codes[rows]
+        approx = self._quantizer.score(q, codes)
+        if mask is not None:
+            approx[~mask] = -np.inf
+        shortlist = top_k_indices(approx, top_k * self.rescore_factor)
+        shortlist = shortlist[np.isfinite(approx[shortlist])]
+        candidates = shortlist if rows is None else rows[shortlist]
+        # Sorted row order keeps reads from a memory-mapped matrix sequential.
+        candidates = np.sort(candidates)
+        return candidates, self._vectors[candidates] @ q
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                row = self._id_to_row.pop(doc_id, None)
+                if row is None:
+                    continue
+                last = self._size - 1
+                self._metadata_index.remove(row, self._metadata[row])
+                if row != last:
+                    self._metadata_index.remove(last, self._metadata[last])
+                    self._metadata_index.add(row, self._metadata[last])
+                    self._ensure_capacity(0)
+                    self._vectors[row] = self._vectors[last]
+                    if self._codes is not None:
+                        self._codes[row] = self._codes[last]
+                    self._ids[row] = self._ids[last]
+                    self._metadata[row] = self._metadata[last]
+                    self._documents[row] = self._documents[last]
+                    self._id_to_row[self._ids[row]] = row
+                self._ids.pop()
+                self._metadata.pop()
+                self._documents.pop()
+                self._size -= 1
+        logger.debug("Deleted %d ids (total=%d)", len(ids), self._size)
+
+    def update_metadata(self,
+                        id: str,
+                        metadata: Dict[str, Any]) -> None:
+        with self._lock:
+            row = self._id_to_row.get(id)
+            if row is None:
+                raise KeyError(id)
+            self._metadata_index.remove(row, self._metadata[row])
+            self._metadata[row].update(metadata)
+            self._metadata_index.add(row, self._metadata[row])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def persist(self, path: str) -> None:
+        target = Path(path)
+        target.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            # Write to a temp file and rename, so a live memmap of the old file stays valid.
+            tmp = target / (VECTORS_FILE + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors[:self._size]))
+            os.replace(tmp, target / VECTORS_FILE)
+            if self._quantizer is not None and self._quantizer.is_fitted:
+                np.save(target / CODES_FILE, np.ascontiguousarray(self._codes[:self._size]))
+                np.savez(target / QUANTIZER_FILE, **self._quantizer.state())
+            state = {
+                "dim": self.dim,
+                "normalize": self.normalize,
+                "quantization": self._quantizer.name if self._quantizer is not None else None,
+                "ids": self._ids,
+                "metadata": self._metadata,
+                "documents": self._documents,
+            }
+            (target / STATE_FILE).write_text(json.dumps(state))
+        logger.info("Persisted %d vectors to %s", self._size, target)
+
+    def load(self, path: str) -> None:
+        source = Path(path)
+        state = json.loads((source / STATE_FILE).read_text())
+        vectors = np.load(source / VECTORS_FILE, mmap_mode="r")
+        quantizer = get_quantizer(state.get("quantization"))
+        codes = None
+        if quantizer is not None and (source / CODES_FILE).exists():
+            # Codes are the hot, compact part of the index: keep them in RAM.
+            codes = np.load(source / CODES_FILE)
+            with np.load(source / QUANTIZER_FILE) as params:
+                quantizer.set_state(dict(params))
+        elif quantizer is not None:
+            codes = np.empty((0, quantizer.code_size(state["dim"] or 0)), dtype=quantizer.code_dtype)
+        with self._lock:
+            self.dim = state["dim"]
+            self.normalize = state["normalize"]
+            self._quantizer = quantizer
+            self._codes = codes
+            self._vectors = vectors
+            self._size = vectors.shape[0]
+            self._ids = list(state["ids"])
+            self._metadata = list(state["metadata"])
+            self._documents = list(state["documents"])
+            self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._metadata_index.clear()
+            for row, meta in enumerate(self._metadata):
+                self._metadata_index.add(row, meta)
+        logger.info("Loaded %d vectors from %s (memory-mapped)", self._size, source)
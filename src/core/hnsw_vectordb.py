@@ -0,0 +1,527 @@
+from typing import List, Dict, Any, Optional, Tuple, Union
+from pathlib import Path
+import heapq
+import json
+import math
+import os
+import threading
+import uuid
+import numpy as np
+from .base_vectordb import VectorDatabase
+from .vector_utils import EmbedFn, as_matrix, normalize_rows, top_k_indices, matches_filter
+from .quantization import get_quantizer
+from .metadata_index import MetadataIndex
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+GRAPH_FILE = "graph.npz"
+STATE_FILE = "store.json"
+CODES_FILE = "codes.npy"
+QUANTIZER_FILE = "quantizer.npz"
+# Everything a compaction rebuilds and swaps in.
+GRAPH_STATE = ("_vectors", "_codes", "_size", "_ids", "_id_to_node", "_metadata", "_documents", "_deleted",
+               "_n_deleted", "_links", "_entry_point", "_max_level", "_metadata_index", "_quantizer")
+
+
+class HNSWVectorDatabase(VectorDatabase):
+    """
+    Approximate nearest-neighbour store built on a Hierarchical Navigable
+    Small World graph (Malkov & Yashunin), in pure Python/NumPy.
+
+    Similarity is cosine: vectors are L2-normalized on insert and the graph
+    uses `1 - dot` as distance. Deletes are tombstones - the node stays in the
+    graph for navigation but is never returned - and the graph is rebuilt
+    from the live nodes once tombstones exceed `compaction_threshold`. The
+    rebuild runs on a snapshot outside the lock, so searches carry on
+    against the old graph until the new one is swapped in.
+
+    With `quantization="int8"` or `"binary"`, query-time graph traversal
+    scores compact codes instead of float vectors, and the final
+    `max(ef_search, top_k * rescore_factor)` candidates are rescored exactly.
+    The graph itself is always built from the float vectors.
+
+    Metadata filters are resolved through an inverted index. A filter that
+    matches at most `prefilter_threshold` of the live nodes is answered by an
+    exact scan of just those nodes; a broader one walks the graph and drops
+    non-matching nodes from the results.
+    """
+
+    def __init__(self,
+                 dim: Optional[int] = None,
+                 embed_fn: Optional[EmbedFn] = None,
+                 M: int = 16,
+                 ef_construction: int = 200,
+                 ef_search: int = 64,
+                 compaction_threshold: float = 0.25,
+                 initial_capacity: int = 1024,
+                 seed: Optional[int] = None,
+                 quantization: Optional[str] = None,
+                 rescore_factor: int = 4,
+                 prefilter_threshold: float = 0.1) -> None:
+        if M < 2:
+            raise ValueError("M must be >= 2")
+        self.dim = dim
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.compaction_threshold = compaction_threshold
+        self.rescore_factor = max(1, rescore_factor)
+        self.prefilter_threshold = prefilter_threshold
+        self._metadata_index = MetadataIndex()
+        self._quantizer = get_quantizer(quantization)
+        self._level_mult = 1.0 / math.log(M)
+        self._embed_fn = embed_fn
+        self._initial_capacity = max(1, initial_capacity)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.RLock()
+        self._compacting = threading.Lock()
+        # Bumped whenever the state is replaced wholesale (clear, load, compaction).
+        self._generation = 0
+        self._reset()
+        logger.info("Initialized HNSWVectorDatabase M=%d ef_construction=%d ef_search=%d quantization=%s",
+                    M, ef_construction, ef_search, quantization)
+
+    def _reset(self) -> None:
+        self._vectors = np.empty((0, self.dim or 0), dtype=np.float32)
+        self._codes: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._id_to_node: Dict[str, int] = {}
+        self._metadata: List[Dict[str, Any]] = []
+        self._documents: List[Optional[str]] = []
+        self._deleted: List[bool] = []
+        self._n_deleted = 0
+        # _links[node][level] -> neighbour node ids at that level
+        self._links: List[List[List[int]]] = []
+        self._entry_point: Optional[int] = None
+        self._max_level = -1
+        self._metadata_index.clear()
+
+    def __len__(self) -> int:
+        return self._size - self._n_deleted
+
+    # ---------- helpers ----------
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self._embed_fn is None:
+            raise ValueError("HNSWVectorDatabase needs an embed_fn to accept raw text")
+        return as_matrix(self._embed_fn(texts), self.dim)
+
+    def _ensure_capacity(self, extra: int) -> None:
+        """Grow (or un-mmap) the matrix so that `extra` more rows fit."""
+        needed = self._size + extra
+        writable = isinstance(self._vectors, np.ndarray) and not isinstance(self._vectors, np.memmap)
+        if writable and self._vectors.shape[0] >= needed:
+            return
+        capacity = max(self._initial_capacity, self._vectors.shape[0])
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._vectors[:self._size]
+        self._vectors = grown
+        if self._quantizer is not None:
+            codes = np.empty((capacity, self._quantizer.code_size(self.dim)), dtype=self._quantizer.code_dtype)
+            if self._codes is not None:
+                codes[:self._size] = self._codes[:self._size]
+            self._codes = codes
+
+    def _query_vector(self, query: Union[str, np.ndarray]) -> np.ndarray:
+        q = self._embed([query])[0] if isinstance(query, str) else as_matrix(query, self.dim)[0]
+        return normalize_rows(q.copy().reshape(1, -1))[0]
+
+    def _random_level(self) -> int:
+        return int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+
+    def _distances(self, q: np.ndarray, nodes: List[int], approximate: bool = False) -> List[float]:
+        if approximate:
+            return (-self._quantizer.score(q, self._codes[nodes])).tolist()
+        return (1.0 - self._vectors[nodes] @ q).tolist()
+
+    def _search_layer(self,
+                      q: np.ndarray,
+                      entry_points: List[int],
+                      ef: int,
+                      level: int,
+                      approximate: bool = False) -> List[Tuple[float, int]]:
+        """Best-first search of one layer. Returns up to `ef` (distance, node) pairs, closest first."""
+        visited = set(entry_points)
+        candidates = list(zip(self._distances(q, entry_points, approximate), entry_points))
+        heapq.heapify(candidates)
+        # max-heap of the current best results
+        results = [(-d, n) for d, n in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            dist, node = heapq.heappop(candidates)
+            if dist > -results[0][0]:
+                break
+            neighbours = [n for n in self._links[node][level] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for d, n in zip(self._distances(q, neighbours, approximate), neighbours):
+                if len(results) < ef or d < -results[0][0]:
+                    heapq.heappush(candidates, (d, n))
+                    heapq.heappush(results, (-d, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted((-d, n) for d, n in results)
+
+    def _select_neighbours(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """
+        Neighbour-selection heuristic: keep a candidate only if it is closer to
+        the base node than to every neighbour already selected. `candidates`
+        must be sorted by distance.
+        """
+        selected: List[int] = []
+        for dist, node in candidates:
+            if len(selected) >= m:
+                break
+            if selected:
+                to_selected = 1.0 - self._vectors[selected] @ self._vectors[node]
+                if np.any(to_selected < dist):
+                    continue
+            selected.append(node)
+        return selected
+
+    def _greedy_descent(self, q: np.ndarray, target_level: int, approximate: bool = False) -> int:
+        entry = self._entry_point
+        for level in range(self._max_level, target_level, -1):
+            entry = self._search_layer(q, [entry], 1, level, approximate)[0][1]
+        return entry
+
+    def _insert_node(self, node: int) -> None:
+        q = self._vectors[node]
+        level = self._random_level()
+        self._links.append([[] for _ in range(level + 1)])
+
+        if self._entry_point is None:
+            self._entry_point, self._max_level = node, level
+            return
+
+        entry_points = [self._greedy_descent(q, level)]
+        for lc in range(min(level, self._max_level), -1, -1):
+            found = self._search_layer(q, entry_points, self.ef_construction, lc)
+            max_links = self.M0 if lc == 0 else self.M
+            neighbours = self._select_neighbours(found, self.M)
+            self._links[node][lc] = neighbours
+            for n in neighbours:
+                links = self._links[n][lc]
+                links.append(node)
+                if len(links) > max_links:
+                    ranked = sorted(zip(self._distances(self._vectors[n], links), links))
+                    self._links[n][lc] = self._select_neighbours(ranked, max_links)
+            entry_points = [n for _, n in found]
+
+        if level > self._max_level:
+            self._entry_point, self._max_level = node, level
+
+    def _result(self, node: int, score: float) -> Dict[str, Any]:
+        return {
+            "id": self._ids[node],
+            "score": float(score),
+            "document": self._documents[node],
+            "metadata": self._metadata[node],
+        }
+
+    # ---------- VectorDatabase ----------
+
+    def add_documents(self,
+                      documents: List[str],
+                      metadata: Optional[List[Dict[str, Any]]] = None,
+                      ids: Optional[List[str]] = None) -> List[str]:
+        return self._add(self._embed(documents), metadata, ids, documents)
+
+    def add_embeddings(self,
+                       embeddings: List[np.ndarray],
+                       metadata: Optional[List[Dict[str, Any]]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        return self._add(as_matrix(embeddings, self.dim), metadata, ids, None)
+
+    def _add(self,
+             embeddings: np.ndarray,
+             metadata: Optional[List[Dict[str, Any]]],
+             ids: Optional[List[str]],
+             documents: Optional[List[str]]) -> List[str]:
+        n = embeddings.shape[0]
+        if n == 0:
+            return []
+        metadata = metadata or [{} for _ in range(n)]
+        ids = ids or [uuid.uuid4().hex for _ in range(n)]
+        documents = documents or [None] * n
+        if not (len(metadata) == len(ids) == len(documents) == n):
+            raise ValueError("embeddings, metadata and ids must have the same length")
+        embeddings = normalize_rows(embeddings.copy())
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            # Re-adding an existing id replaces it.
+            self._tombstone([i for i in ids if i in self._id_to_node])
+            self._ensure_capacity(n)
+            if self._quantizer is not None:
+                if self._quantizer.update(embeddings):
+                    # The range widened: codes already stored were made with the old one.
+                    self._quantizer.reencode(self._vectors[:self._size], self._codes[:self._size])
+                self._codes[self._size:self._size + n] = self._quantizer.encode(embeddings)
+            for vector, doc_id, meta, doc in zip(embeddings, ids, metadata, documents):
+                node = self._size
+                self._vectors[node] = vector
+                self._ids.append(doc_id)
+                self._metadata.append(dict(meta))
+                self._metadata_index.add(node, meta)
+                self._documents.append(doc)
+                self._deleted.append(False)
+                self._id_to_node[doc_id] = node
+                self._size += 1
+                self._insert_node(node)
+        logger.debug("Added %d vectors (live=%d)", n, len(self))
+        return list(ids)
+
+    def similarity_search(self,
+                          query: Union[str, np.ndarray],
+                          top_k: int = 5,
+                          metadata_filter: Optional[Dict[str, Any]] = None,
+                          ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
+        q = self._query_vector(query)
+        with self._lock:
+            if self._entry_point is None or len(self) == 0:
+                return []
+            approximate = self._quantizer is not None
+            wanted = top_k * self.rescore_factor if approximate else top_k
+            matched = None
+            if metadata_filter:
+                matched = self._metadata_index.lookup(metadata_filter)
+                if matched is None:
+                    matched = {
+                        n for n in range(self._size)
+                        if not self._deleted[n] and matches_filter(self._metadata[n], metadata_filter)
+                    }
+                if not matched:
+                    return []
+                if len(matched) <= self.prefilter_threshold * len(self):
+                    return self._search_subset(q, MetadataIndex.to_array(matched), top_k)
+            entry = self._greedy_descent(q, 0, approximate)
+            ef = max(ef_search or self.ef_search, wanted)
+            while True:
+                found = self._search_layer(q, [entry], ef, 0, approximate)
+                hits = [
+                    (d, n) for d, n in found
+                    if not self._deleted[n] and (matched is None or n in matched)
+                ]
+                # Tombstones and filters can starve the candidate list; widen the beam and retry.
+                if len(hits) >= wanted or ef >= self._size:
+                    break
+                ef = min(ef * 2, self._size)
+            if approximate and hits:
+                nodes = [n for _, n in hits]
+                hits = sorted(zip(self._distances(q, nodes), nodes))
+            return [self._result(n, 1.0 - d) for d, n in hits[:top_k]]
+
+    def _search_subset(self, q: np.ndarray, nodes: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """Exact (or quantized + rescored) scan restricted to `nodes`, bypassing the graph."""
+        if self._quantizer is not None:
+            approx = self._quantizer.score(q, self._codes[nodes])
+            nodes = np.sort(nodes[top_k_indices(approx, top_k * self.rescore_factor)])
+        scores = self._vectors[nodes] @ q
+        return [self._result(int(nodes[i]), scores[i]) for i in top_k_indices(scores, top_k)]
+
+    def _tombstone(self, ids: List[str]) -> int:
+        removed = 0
+        for doc_id in ids:
+            node = self._id_to_node.pop(doc_id, None)
+            if node is None:
+                continue
+            self._deleted[node] = True
+            self._metadata_index.remove(node, self._metadata[node])
+            removed += 1
+        self._n_deleted += removed
+        return removed
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            removed = self._tombstone(ids)
+            due = self._size and self._n_deleted / self._size > self.compaction_threshold
+        logger.debug("Deleted %d ids (live=%d)", removed, len(self))
+        if due:
+            self.compact()
+
+    def _empty_like(self, seed: int) -> "HNSWVectorDatabase":
+        return HNSWVectorDatabase(
+            dim=self.dim, M=self.M, ef_construction=self.ef_construction, ef_search=self.ef_search,
+            compaction_threshold=self.compaction_threshold, initial_capacity=max(1, len(self)), seed=seed,
+            quantization=self._quantizer.name if self._quantizer is not None else None,
+            rescore_factor=self.rescore_factor, prefilter_threshold=self.prefilter_threshold,
+        )
+
+    def _catch_up(self, rebuilt: "HNSWVectorDatabase", snapshot_size: int) -> None:
+        """Replay onto `rebuilt` what changed since the snapshot of the first `snapshot_size` nodes; lock held."""
+        for doc_id, node in list(rebuilt._id_to_node.items()):
+            current = self._id_to_node.get(doc_id)
+            if current is None or current >= snapshot_size:
+                # Deleted, or re-added as a newer node.
+                rebuilt._tombstone([doc_id])
+            elif self._metadata[current] != rebuilt._metadata[node]:
+                rebuilt.update_metadata(doc_id, self._metadata[current])
+        fresh = [n for n in range(snapshot_size, self._size) if not self._deleted[n]]
+        if fresh:
+            rebuilt._add(np.array(self._vectors[fresh]), [self._metadata[n] for n in fresh],
+                         [self._ids[n] for n in fresh], [self._documents[n] for n in fresh])
+
+    def compact(self) -> None:
+        """
+        Drop tombstoned nodes and rebuild the graph from the live ones.
+
+        The graph is rebuilt from a snapshot without holding the lock. Adds,
+        deletes and metadata updates made meanwhile are replayed onto it, and
+        it replaces the old graph in one step. A compaction that finds another
+        one running returns at once.
+        """
+        if not self._compacting.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                generation = self._generation
+                snapshot_size = self._size
+                live = [n for n in range(self._size) if not self._deleted[n]]
+                vectors = np.array(self._vectors[live])
+                ids = [self._ids[n] for n in live]
+                metadata = [dict(self._metadata[n]) for n in live]
+                documents = [self._documents[n] for n in live]
+                dropped = self._n_deleted
+                seed = int(self._rng.integers(1 << 62))
+            rebuilt = self._empty_like(seed)
+            rebuilt._add(vectors, metadata, ids, documents)
+            with self._lock:
+                if self._generation != generation:
+                    logger.info("HNSW graph was cleared or reloaded during compaction; discarding the rebuild")
+                    return
+                self._catch_up(rebuilt, snapshot_size)
+                for name in GRAPH_STATE:
+                    setattr(self, name, getattr(rebuilt, name))
+                self._generation += 1
+        finally:
+            self._compacting.release()
+        logger.info("Compacted HNSW graph: dropped %d tombstones, %d live nodes", dropped, len(self))
+
+    def update_metadata(self,
+                        id: str,
+                        metadata: Dict[str, Any]) -> None:
+        with self._lock:
+            node = self._id_to_node.get(id)
+            if node is None:
+                raise KeyError(id)
+            self._metadata_index.remove(node, self._metadata[node])
+            self._metadata[node].update(metadata)
+            self._metadata_index.add(node, self._metadata[node])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            self._generation += 1
+
+    def persist(self, path: str) -> None:
+        target = Path(path)
+        target.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            # Write to temp files and rename, so a live memmap of the old file stays valid.
+            tmp = target / (VECTORS_FILE + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors[:self._size]))
+            os.replace(tmp, target / VECTORS_FILE)
+            if self._quantizer is not None and self._quantizer.is_fitted:
+                np.save(target / CODES_FILE, np.ascontiguousarray(self._codes[:self._size]))
+                np.savez(target / QUANTIZER_FILE, **self._quantizer.state())
+
+            # Layer 0 is a dense (n, M0) table; upper layers are few, so store them as (node, level, links) rows.
+            level0 = np.full((self._size, self.M0), -1, dtype=np.int32)
+            upper_keys, upper_links = [], []
+            for node, node_links in enumerate(self._links):
+                level0[node, :len(node_links[0])] = node_links[0]
+                for level in range(1, len(node_links)):
+                    row = np.full(self.M, -1, dtype=np.int32)
+                    row[:len(node_links[level])] = node_links[level]
+                    upper_keys.append((node, level))
+                    upper_links.append(row)
+            tmp = target / (GRAPH_FILE + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    levels=np.array([len(links) - 1 for links in self._links], dtype=np.int32),
+                    level0=level0,
+                    upper_keys=np.array(upper_keys, dtype=np.int32).reshape(-1, 2),
+                    upper_links=np.array(upper_links, dtype=np.int32).reshape(-1, self.M),
+                )
+            os.replace(tmp, target / GRAPH_FILE)
+
+            state = {
+                "dim": self.dim,
+                "M": self.M,
+                "ef_construction": self.ef_construction,
+                "ef_search": self.ef_search,
+                "quantization": self._quantizer.name if self._quantizer is not None else None,
+                "entry_point": self._entry_point,
+                "max_level": self._max_level,
+                "ids": self._ids,
+                "metadata": self._metadata,
+                "documents": self._documents,
+                "deleted": self._deleted,
+            }
+            (target / STATE_FILE).write_text(json.dumps(state))
+        logger.info("Persisted HNSW graph with %d nodes to %s", self._size, target)
+
+    def load(self, path: str) -> None:
+        source = Path(path)
+        state = json.loads((source / STATE_FILE).read_text())
+        vectors = np.load(source / VECTORS_FILE, mmap_mode="r")
+        with np.load(source / GRAPH_FILE) as graph:
+            levels = graph["levels"]
+            level0 = graph["level0"]
+            upper_keys = graph["upper_keys"]
+            upper_links = graph["upper_links"]
+
+        quantizer = get_quantizer(state.get("quantization"))
+        codes = None
+        if quantizer is not None and (source / CODES_FILE).exists():
+            # Codes are what traversal touches: keep them in RAM, leave floats mapped.
+            codes = np.load(source / CODES_FILE)
+            with np.load(source / QUANTIZER_FILE) as params:
+                quantizer.set_state(dict(params))
+
+        links: List[List[List[int]]] = [[[] for _ in range(level + 1)] for level in levels.tolist()]
+        for node, row in enumerate(level0):
+            links[node][0] = row[row >= 0].tolist()
+        for (node, level), row in zip(upper_keys.tolist(), upper_links):
+            links[node][level] = row[row >= 0].tolist()
+
+        with self._lock:
+            self._generation += 1
+            self.dim = state["dim"]
+            self.M = state["M"]
+            self.M0 = 2 * self.M
+            self._level_mult = 1.0 / math.log(self.M)
+            self.ef_construction = state["ef_construction"]
+            self.ef_search = state["ef_search"]
+            self._vectors = vectors
+            self._quantizer = quantizer
+            self._codes = codes
+            self._size = vectors.shape[0]
+            self._ids = list(state["ids"])
+            self._metadata = list(state["metadata"])
+            self._documents = list(state["documents"])
+            self._deleted = list(state["deleted"])
+            self._n_deleted = sum(self._deleted)
+            self._id_to_node = {doc_id: n for n, doc_id in enumerate(self._ids) if not self._deleted[n]}
+            self._metadata_index.clear()
+            for node in self._id_to_node.values():
+                self._metadata_index.add(node, self._metadata[node])
+            self._links = links
+            self._entry_point = state["entry_point"]
+            self._max_level = state["max_level"]
+        logger.info("Loaded HNSW graph with %d nodes from %s (vectors memory-mapped)", self._size, source)
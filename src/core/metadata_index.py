@@ -0,0 +1,77 @@
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from collections import defaultdict
+import numpy as np
+
+
+class MetadataIndex:
+    """
+    Inverted index from a metadata (key, value) pair to the set of row ids
+    that carry it. Vector stores keep it in sync on add/delete/update and
+    use it to resolve equality filters without touching every row.
+
+    Postings are plain sets rather than dense bitmaps: a dense bitmap costs
+    capacity/8 bytes per distinct value, which does not scale to
+    high-cardinality keys like file names.
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[Tuple[str, Hashable], Set[int]] = defaultdict(set)
+
+    @staticmethod
+    def _pairs(metadata: Dict[str, Any]):
+        for key, value in metadata.items():
+            if isinstance(value, Hashable):
+                yield key, value
+
+    def add(self, row: int, metadata: Dict[str, Any]) -> None:
+        for pair in self._pairs(metadata):
+            self._postings[pair].add(row)
+
+    def remove(self, row: int, metadata: Dict[str, Any]) -> None:
+        for pair in self._pairs(metadata):
+            posting = self._postings.get(pair)
+            if posting is None:
+                continue
+            posting.discard(row)
+            if not posting:
+                del self._postings[pair]
+
+    def clear(self) -> None:
+        self._postings.clear()
+
+    def lookup(self, metadata_filter: Dict[str, Any]) -> Optional[Set[int]]:
+        """
+        Rows matching every key of the filter; a list value matches any of its
+        items. Returns None if the filter holds values the index cannot serve
+        (unhashable), in which case the caller must scan.
+        """
+        per_key: List[Set[int]] = []
+        for key, expected in metadata_filter.items():
+            options = expected if isinstance(expected, (list, tuple, set)) else [expected]
+            if not all(isinstance(v, Hashable) for v in options):
+                return None
+            matched: Set[int] = set()
+            for value in options:
+                matched |= self._postings.get((key, value), set())
+            if not matched:
+                return set()
+            per_key.append(matched)
+        if not per_key:
+            return None
+        # Intersect smallest-first so the work is bounded by the most selective key.
+        per_key.sort(key=len)
+        result = set(per_key[0])
+        for rows in per_key[1:]:
+            result &= rows
+            if not result:
+                break
+        return result
+
+    @staticmethod
+    def to_array(rows: Set[int]) -> np.ndarray:
+        """
+        Sorted row ids, so gathers from a (memory-mapped) matrix read forward.
+        """
+        out = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        out.sort()
+        return out
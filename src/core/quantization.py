@@ -0,0 +1,198 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+import numpy as np
+
+# Rows scored per block, so the temporary float32 copy of int8 codes stays small.
+_BLOCK_ROWS = 65536
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+class Quantizer(ABC):
+    """
+    Compresses float32 vectors into compact codes for a first-pass search.
+    Scores are only approximate; callers rescore the best candidates against
+    the original float vectors.
+    """
+
+    name: str = ""
+
+    @property
+    def is_fitted(self) -> bool:
+        return True
+
+    def fit(self, vectors: np.ndarray) -> None:
+        """
+        Learn encoding parameters from a sample of vectors.
+        """
+
+    def update(self, vectors: np.ndarray) -> bool:
+        """
+        Adapt the parameters to a new batch before it is encoded. Returns True
+        when they changed, in which case every stored code must be re-encoded.
+        """
+        return False
+
+    @abstractmethod
+    def code_size(self, dim: int) -> int:
+        """
+        Number of code elements per vector.
+        """
+
+    @property
+    @abstractmethod
+    def code_dtype(self) -> np.dtype:
+        ...
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Encode an (n, dim) float32 matrix into an (n, code_size) code matrix.
+        """
+
+    @abstractmethod
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate similarity (higher is better) of `query` against each code row.
+        """
+
+    def reencode(self, vectors: np.ndarray, codes: np.ndarray) -> None:
+        """
+        Encode `vectors` into the matching rows of `codes` in place, block by block.
+        """
+        for start in range(0, vectors.shape[0], _BLOCK_ROWS):
+            codes[start:start + _BLOCK_ROWS] = self.encode(vectors[start:start + _BLOCK_ROWS])
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def set_state(self, state: Dict[str, np.ndarray]) -> None:
+        pass
+
+
+class ScalarQuantizer(Quantizer):
+    """
+    Per-dimension int8 quantization: each component is mapped linearly from
+    its observed [min, max] range onto [-128, 127]. 4x smaller than float32.
+    Queries stay in float32 (asymmetric distance), which keeps recall high.
+
+    The range grows with the data: a batch outside it widens the range, with
+    `headroom` (a fraction of the span) to spare so that slowly drifting data
+    does not force a re-encode on every add.
+    """
+
+    name = "int8"
+
+    def __init__(self, headroom: float = 0.1) -> None:
+        self.headroom = headroom
+        self._lo: Optional[np.ndarray] = None
+        self._hi: Optional[np.ndarray] = None
+        self._offset: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self._scale is not None
+
+    @property
+    def code_dtype(self) -> np.dtype:
+        return np.dtype(np.int8)
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def _set_range(self, lo: np.ndarray, hi: np.ndarray) -> None:
+        self._lo = lo.astype(np.float32)
+        self._hi = hi.astype(np.float32)
+        # A constant component (e.g. a single vector so far) gets a tiny scale, not a made-up range.
+        scale = np.maximum((self._hi - self._lo) / 255.0, np.float32(1e-12))
+        self._scale = scale.astype(np.float32)
+        # value = (code + 128) * scale + lo
+        self._offset = (self._lo + 128.0 * scale).astype(np.float32)
+
+    def fit(self, vectors: np.ndarray) -> None:
+        self._set_range(vectors.min(axis=0), vectors.max(axis=0))
+
+    def update(self, vectors: np.ndarray) -> bool:
+        if not self.is_fitted:
+            self.fit(vectors)
+            return False
+        lo = np.minimum(self._lo, vectors.min(axis=0))
+        hi = np.maximum(self._hi, vectors.max(axis=0))
+        below, above = lo < self._lo, hi > self._hi
+        if not (below.any() or above.any()):
+            return False
+        margin = (hi - lo) * self.headroom
+        self._set_range(np.where(below, lo - margin, lo), np.where(above, hi + margin, hi))
+        return True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self._offset) / self._scale)
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        weighted = (query * self._scale).astype(np.float32)
+        bias = float(self._offset @ query)
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            out[start:start + block.shape[0]] = block.astype(np.float32) @ weighted
+        return out + bias
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"lo": self._lo, "hi": self._hi}
+
+    def set_state(self, state: Dict[str, np.ndarray]) -> None:
+        if "lo" in state:
+            self._set_range(np.asarray(state["lo"]), np.asarray(state["hi"]))
+            return
+        # Saved before the range was kept explicitly.
+        scale = np.asarray(state["scale"], dtype=np.float32)
+        lo = np.asarray(state["offset"], dtype=np.float32) - 128.0 * scale
+        self._set_range(lo, lo + 255.0 * scale)
+
+
+class BinaryQuantizer(Quantizer):
+    """
+    1-bit quantization: keeps only the sign of each component, packed 8 per
+    byte. 32x smaller than float32; similarity is the negated Hamming distance.
+    Works best on normalized, roughly zero-centred embeddings.
+    """
+
+    name = "binary"
+
+    @property
+    def code_dtype(self) -> np.dtype:
+        return np.dtype(np.uint8)
+
+    def code_size(self, dim: int) -> int:
+        return (dim + 7) // 8
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=-1)
+
+    def score(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        bits = self.encode(query.reshape(1, -1))[0]
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            hamming = _POPCOUNT[np.bitwise_xor(block, bits)].sum(axis=1, dtype=np.int32)
+            out[start:start + block.shape[0]] = -hamming
+        return out
+
+
+QUANTIZERS = {
+    ScalarQuantizer.name: ScalarQuantizer,
+    BinaryQuantizer.name: BinaryQuantizer,
+}
+
+
+def get_quantizer(name: Optional[str]) -> Optional[Quantizer]:
+    """
+    Build a quantizer by name ("int8" or "binary"); None disables quantization.
+    """
+    if name is None:
+        return None
+    try:
+        return QUANTIZERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown quantization {name!r}, expected one of {sorted(QUANTIZERS)}") from None
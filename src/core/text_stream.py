@@ -0,0 +1,143 @@
+from typing import Callable, Deque, Iterable, Iterator, List, NamedTuple, Tuple
+from collections import deque
+from pathlib import Path
+import re
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a blank line.
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n\s*")
+WORD = re.compile(r"\S+\s*")
+
+
+class TextChunk(NamedTuple):
+    text: str
+    start_char_idx: int
+    end_char_idx: int
+
+
+def iter_text_blocks(path: Path, block_chars: int = 1 << 20, encoding: str = "utf-8") -> Iterator[str]:
+    """The file's text in blocks of at most `block_chars` characters. Undecodable bytes become U+FFFD."""
+    # newline='' keeps line endings as they are, so offsets are offsets into the decoded file.
+    with open(path, encoding=encoding, errors="replace", newline="") as f:
+        while block := f.read(block_chars):
+            yield block
+
+
+def whitespace_tokenizer(text: str) -> List[str]:
+    return text.split()
+
+
+class StreamingSentenceChunker:
+    """
+    Sentence-aware chunking of a text stream, in memory bounded by the chunk
+    size rather than by the document size.
+
+    Blocks of text go in and chunks come out, lazily. Complete sentences are
+    packed into chunks of at most `chunk_size` tokens. Each new chunk starts
+    with the trailing sentences of the previous one, up to `chunk_overlap`
+    tokens, and this overlap carries across block boundaries like
+    everything else. A sentence cut by a block boundary waits for the next
+    block. Text without a sentence end for `max_sentence_chars` characters
+    (minified data, huge log lines) is cut at its last whitespace, so the
+    pending buffer stays bounded. Sentences longer than `chunk_size` tokens
+    are split between words.
+
+    Chunks carry their character span in the stream. Sentences keep their
+    trailing whitespace, so spans tile the text and offsets are exact.
+    """
+
+    def __init__(self,
+                 chunk_size: int = 312,
+                 chunk_overlap: int = 50,
+                 tokenizer: Callable[[str], List] = whitespace_tokenizer,
+                 max_sentence_chars: int = 1 << 16) -> None:
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.tokenizer = tokenizer
+        self.max_sentence_chars = max_sentence_chars
+
+    def _count(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    def _cuts(self, text: str, cut: int, end: int) -> List[int]:
+        """Positions cutting text[cut:end] into pieces of at most max_sentence_chars, at whitespace where possible."""
+        stops = []
+        while end - cut > self.max_sentence_chars:
+            limit = cut + self.max_sentence_chars
+            space = max(text.rfind(" ", cut, limit), text.rfind("\n", cut, limit))
+            cut = space + 1 if space > cut else limit
+            stops.append(cut)
+        return stops
+
+    def sentences(self, blocks: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        """(text, start offset) of consecutive sentences, trailing whitespace included."""
+        pending = ""
+        offset = 0
+        for block in blocks:
+            pending += block
+            cut = 0
+            for match in SENTENCE_END.finditer(pending):
+                if match.end() == len(pending):
+                    # The whitespace run may continue in the next block.
+                    break
+                for stop in self._cuts(pending, cut, match.end()):
+                    yield pending[cut:stop], offset + cut
+                    cut = stop
+                yield pending[cut:match.end()], offset + cut
+                cut = match.end()
+            # Cut an unfinished sentence the same way, so the buffer never holds much more than a block.
+            for stop in self._cuts(pending, cut, len(pending)):
+                yield pending[cut:stop], offset + cut
+                cut = stop
+            pending = pending[cut:]
+            offset += cut
+        if pending:
+            yield pending, offset
+
+    def _pieces(self, blocks: Iterable[str]) -> Iterator[Tuple[str, int, int]]:
+        """Sentences with their token counts, over-long ones split between words."""
+        for text, start in self.sentences(blocks):
+            tokens = self._count(text)
+            if tokens <= self.chunk_size:
+                yield text, start, tokens
+                continue
+            piece_start = piece_tokens = 0
+            for word in WORD.finditer(text):
+                word_tokens = self._count(word.group())
+                if piece_tokens + word_tokens > self.chunk_size and word.start() > piece_start:
+                    yield text[piece_start:word.start()], start + piece_start, piece_tokens
+                    piece_start, piece_tokens = word.start(), 0
+                piece_tokens += word_tokens
+            yield text[piece_start:], start + piece_start, piece_tokens
+
+    @staticmethod
+    def _chunk(window: Deque[Tuple[str, int, int]]) -> TextChunk | None:
+        text = "".join(piece for piece, _, _ in window)
+        stripped = text.strip()
+        if not stripped:
+            return None
+        start = window[0][1] + len(text) - len(text.lstrip())
+        return TextChunk(stripped, start, start + len(stripped))
+
+    def chunks(self, blocks: Iterable[str]) -> Iterator[TextChunk]:
+        window: Deque[Tuple[str, int, int]] = deque()
+        window_tokens = 0
+        # Pieces added since the last chunk; a chunk of overlap alone is never emitted.
+        fresh = 0
+        for piece in self._pieces(blocks):
+            tokens = piece[2]
+            if fresh and window_tokens + tokens > self.chunk_size:
+                chunk = self._chunk(window)
+                if chunk is not None:
+                    yield chunk
+                fresh = 0
+                while window and (window_tokens > self.chunk_overlap or window_tokens + tokens > self.chunk_size):
+                    window_tokens -= window.popleft()[2]
+            window.append(piece)
+            window_tokens += tokens
+            fresh += 1
+        if fresh:
+            chunk = self._chunk(window)
+            if chunk is not None:
+                yield chunk
@@ -0,0 +1,71 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+EmbedFn = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+def as_matrix(embeddings: Sequence[Any], dim: Optional[int] = None) -> np.ndarray:
+    """
+    Stack a list of vectors into a contiguous (n, dim) float32 matrix.
+    """
+    matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-d array of embeddings, got shape {matrix.shape}")
+    if dim is not None and matrix.shape[0] and matrix.shape[1] != dim:
+        raise ValueError(f"Embedding dimension mismatch: expected {dim}, got {matrix.shape[1]}")
+    return matrix
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize rows in place so that a dot product equals cosine similarity.
+    """
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first. Uses argpartition so the
+    cost is O(n + k log k) instead of a full sort.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def matches_filter(metadata: Dict[str, Any], metadata_filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Exact-match metadata filter. A list value in the filter matches any of its items.
+    """
+    if not metadata_filter:
+        return True
+    for key, expected in metadata_filter.items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several best-first id rankings: score(id) = sum over rankings of 1 / (k + rank).
+    Only ranks are used, so scores on different scales (cosine, BM25) combine cleanly.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import Any, List
 from pathlib import Path
 
 @dataclass(frozen=True)
@@ -9,6 +9,9 @@ class BaseDocument:
     score: float
     metadata:dict
     embedding:list[float]|None
+    # Character span of a chunk within its source document, when known.
+    start_char_idx:int|None = None
+    end_char_idx:int|None = None
 
 @dataclass(frozen=True)
 class Citation:
@@ -20,6 +23,37 @@ class Answer:
     text: str
     citations: List[Citation]
 
+@dataclass(frozen=True)
+class AnswerEvent:
+    """One step of a streamed answer: "citations" (list[Citation]), "token" (str) or "done" (Answer)."""
+    type: str
+    data: Any
+
+@dataclass(frozen=True)
+class Question:
+    """One entry of a batch ask."""
+    text: str
+    filters: dict | None = None
+    org_id: str | None = None
+
+@dataclass(frozen=True)
+class BatchAnswer:
+    """Result for `Question` number `index` of a batch: an answer, or the error that replaced it."""
+    index: int
+    answer: Answer | None = None
+    error: str | None = None
+
+@dataclass(frozen=True)
+class SyncPlan:
+    """Result of diffing a source directory against the ingestion manifest."""
+    stale_ids: List[str]            # chunk ids of removed and changed files, to delete
+    added: List[str]                # new and changed files; their chunks come from the ingester's sync_stream
+    changed: List[str]
+    removed: List[str]
+    unchanged: int
+    manifest: dict                  # manifest to persist once the plan is applied; chunk ids filled in while streaming
+    manifest_key: str = ""          # where the ingester persists it (per org and directory)
+
 @dataclass(frozen=True)
 class File:
     path:Path
\ No newline at end of file
@@ -1,6 +1,7 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List
-from .model import BaseDocument, Answer
+from typing import AsyncIterator, List
+from .model import BaseDocument, Answer, SyncPlan
 
 # ---------- inbound (driving) ----------
 
@@ -14,6 +15,20 @@ class AskQuestionPort(InboundPort):
 class IngestionPort(InboundPort):
     @abstractmethod
     async def ingest(self, **kwargs) -> List[BaseDocument]: ...
+
+    async def ingest_stream(self, **kwargs) -> AsyncIterator[List[BaseDocument]]:
+        """Chunks in batches as they become ready; by default one batch from `ingest`."""
+        yield await self.ingest(**kwargs)
+
+    @abstractmethod
+    async def sync(self, **kwargs) -> SyncPlan: ...
+
+    @abstractmethod
+    def sync_stream(self, plan: SyncPlan, **kwargs) -> AsyncIterator[List[BaseDocument]]: ...
+
+    @abstractmethod
+    def commit_sync(self, plan: SyncPlan) -> None: ...
+
 # ---------- outbound (driven) ----------
 
 class OutboundPort(ABC):
@@ -26,10 +41,38 @@ class RetrieveDocumentsPort(OutboundPort):
     @abstractmethod
     async def ingest(self, documents:list[BaseDocument], **kwargs) -> None: ...
 
+    @abstractmethod
+    async def delete(self, ids: List[str]) -> None: ...
+
+    async def retrieve_batch(self, queries: List[str], filters: dict | None = None,
+                             query_embeddings: List[List[float]] | None = None) -> List[List[BaseDocument]]:
+        """Results for several queries sharing one filter set; adapters with a multi-query search override this."""
+        embeddings = query_embeddings or [None] * len(queries)
+        return list(await asyncio.gather(*(
+            self.retrieve(query, filters=filters, query_embedding=embedding)
+            for query, embedding in zip(queries, embeddings)
+        )))
+
 class GenerateAnswerPort(OutboundPort):
     @abstractmethod
     async def generate(self, question: str, docs: List[BaseDocument]) -> Answer: ...
 
+class StreamingGenerateAnswerPort(GenerateAnswerPort):
+    @abstractmethod
+    def generate_stream(self, question: str, docs: List[BaseDocument]) -> AsyncIterator[str]: ...
+
+class EmbeddingPort(OutboundPort):
+    @abstractmethod
+    async def embed_query(self, text: str) -> List[float]: ...
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.embed_query(text) for text in texts)))
+
 class StoreInteractionPort(OutboundPort):
     @abstractmethod
-    async def save(self, question: str, answer: Answer, docs: List[BaseDocument]) -> None: ...
+    async def save(self, question: str, answer: Answer, docs: List[BaseDocument],
+                   timings: dict[str, float] | None = None, context: dict | None = None) -> None:
+        """Record one answered question; `timings` are stage durations in seconds."""
+
+    async def aclose(self) -> None:
+        """Persist anything still buffered and release resources."""
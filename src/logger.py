@@ -1,30 +1,180 @@
+import json
 import logging
+import os
+import random
 import sys
 import queue
 import threading
 
 from logging.handlers import QueueHandler, QueueListener
 
-_log_queue = queue.Queue(-1)
+# Production mode (RAG_LOG_MODE=production) bounds the queue, sheds load under
+# pressure, writes JSON lines and truncates large messages. Every knob can also
+# be set on its own through the RAG_LOG_* variables read in `_config_from_env`.
+DROP = "drop"        # queue full: drop the new record
+DEGRADE = "degrade"  # queue past `degrade_at`: drop records below WARNING; full: drop
+
+
+def _parse_sampling(spec: str) -> dict[str, float]:
+    """"src.adapters.inbound.rest=0.1,src.application=0.5" -> {logger prefix: keep rate}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def _config_from_env() -> dict:
+    production = os.getenv("RAG_LOG_MODE", "").lower() in ("prod", "production")
+    return {
+        "queue_size": int(os.getenv("RAG_LOG_QUEUE_SIZE", "10000" if production else "-1")),
+        "policy": os.getenv("RAG_LOG_POLICY", DEGRADE if production else DROP),
+        "degrade_at": float(os.getenv("RAG_LOG_DEGRADE_AT", "0.8")),
+        "json": os.getenv("RAG_LOG_FORMAT", "json" if production else "text") == "json",
+        "max_chars": int(os.getenv("RAG_LOG_MAX_CHARS", "2000" if production else "0")),
+        "sampling": _parse_sampling(os.getenv("RAG_LOG_SAMPLING", "")),
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg and request_id when known."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler with a bounded queue, per-logger sampling and message truncation.
+
+    Records below WARNING from a logger matching a `sampling` prefix are kept
+    with that probability (longest prefix wins). The message is rendered on
+    the caller's thread, as QueueHandler always does, and then cut to
+    `max_chars`, so large payloads never reach the queue. A full queue never
+    blocks the caller: the record is dropped and counted, and under the
+    "degrade" policy low-severity records are shed early to leave room for
+    warnings and errors.
+    """
+
+    def __init__(self, log_queue: queue.Queue, policy: str = DROP, degrade_at: float = 0.8,
+                 max_chars: int = 0, sampling: dict[str, float] | None = None) -> None:
+        super().__init__(log_queue)
+        self.policy = policy
+        self.degrade_at = degrade_at
+        self.max_chars = max_chars
+        self.sampling = dict(sampling or {})
+        self._prefixes = sorted(self.sampling, key=len, reverse=True)
+        self._lock = threading.Lock()
+        self.counters = {"enqueued": 0, "dropped": 0, "shed": 0, "sampled_out": 0, "truncated": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _keep_rate(self, name: str) -> float:
+        for prefix in self._prefixes:
+            if name == prefix or name.startswith(prefix + "."):
+                return self.sampling[prefix]
+        return 1.0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._prefixes and record.levelno < logging.WARNING and random.random() >= self._keep_rate(record.name):
+            self._count("sampled_out")
+            return
+        maxsize = self.queue.maxsize
+        if (self.policy == DEGRADE and maxsize > 0 and record.levelno < logging.WARNING
+                and self.queue.qsize() >= self.degrade_at * maxsize):
+            self._count("shed")
+            return
+        try:
+            record.request_id = _request_id_provider() if _request_id_provider else None
+            self.enqueue(self.prepare(record))
+            self._count("enqueued")
+        except queue.Full:
+            self._count("dropped")
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if self.max_chars and len(record.msg) > self.max_chars:
+            extra = len(record.msg) - self.max_chars
+            record.msg = f"{record.msg[:self.max_chars]}... [truncated {extra} chars]"
+            record.message = record.msg
+            self._count("truncated")
+        return record
+
+
+_handler: BoundedQueueHandler | None = None
 _listener = None
+_request_id_provider = None
+
+
+def set_request_id_provider(provider) -> None:
+    """Callable returning the current correlation id; set by src.tracing."""
+    global _request_id_provider
+    _request_id_provider = provider
+
+
+def configure_logging(**overrides) -> BoundedQueueHandler:
+    """
+    (Re)build the shared handler and listener. Keys as in `_config_from_env`
+    (queue_size, policy, degrade_at, json, max_chars, sampling); missing keys
+    come from the environment. Loggers already set up keep working.
+    """
+    global _handler, _listener
+    config = {**_config_from_env(), **overrides}
+    if _listener is not None:
+        _listener.stop()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if config["json"]:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "[%(asctime)s] %(levelname)s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S"
+        ))
+    log_queue = queue.Queue(config["queue_size"])
+    if _handler is None:
+        _handler = BoundedQueueHandler(log_queue)
+    _handler.queue = log_queue
+    _handler.policy = config["policy"]
+    _handler.degrade_at = config["degrade_at"]
+    _handler.max_chars = config["max_chars"]
+    _handler.sampling = dict(config["sampling"])
+    _handler._prefixes = sorted(_handler.sampling, key=len, reverse=True)
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    return _handler
+
+
+def log_stats() -> dict:
+    """Counters of the shared handler plus current queue depth."""
+    if _handler is None:
+        return {}
+    with _handler._lock:
+        stats = dict(_handler.counters)
+    stats["queue_size"] = _handler.queue.qsize()
+    stats["queue_capacity"] = _handler.queue.maxsize
+    return stats
+
 
 def setup_logger(name: str = "rag", level: int = logging.INFO) -> logging.Logger:
-    global _listener
     logger = logging.getLogger(name)
     if not any(isinstance(h, QueueHandler) for h in logger.handlers):
-        # Create a handler for the queue
-        qh = QueueHandler(_log_queue)
-        logger.addHandler(qh)
+        # Only start one listener for the process; every logger shares its handler
+        if _handler is None:
+            configure_logging()
+        logger.addHandler(_handler)
         logger.setLevel(level)
-        # Only start one listener for the process
-        if _listener is None:
-            stream_handler = logging.StreamHandler(sys.stdout)
-            formatter = logging.Formatter(
-                "[%(asctime)s] %(levelname)s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S"
-            )
-            stream_handler.setFormatter(formatter)
-            _listener = QueueListener(_log_queue, stream_handler)
-            _listener.start()
     return logger
 
 # Usage:
@@ -0,0 +1,239 @@
+"""
+Composition root: builds the RAG service from config and exposes the ASGI app
+factory. Nothing is built at import time.
+
+    uvicorn src.server:create_app --factory
+    RAG_PRELOAD=1 gunicorn 'src.server:create_app()' -k uvicorn.workers.UvicornWorker --preload -w 4
+
+Heavy dependencies (FastEmbed/ONNX, llama-index, Qdrant, litellm, tiktoken)
+are imported inside the builders, not at module import. Without preload,
+models are loaded and warmed in the app's lifespan hook. With
+`server.preload`, the embedding model and tokenizer are loaded when the
+factory is called, which happens in the gunicorn master under --preload.
+Forked workers then share those weights copy-on-write. Clients, event-loop
+objects and background workers are always created per worker, after the
+fork.
+"""
+import asyncio
+from functools import partial
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from src.config import AppConfig, load_config
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class Models:
+    embed_model: Any
+    count_tokens: Callable[[str], int]
+
+
+@dataclass
+class Components:
+    """Everything RagService is made of, so callers (e.g. benchmarks) can wrap individual ports."""
+    ingester: Any
+    retriever: Any
+    generator: Any
+    embedder: Any
+    answer_cache: Any
+    tenants: Any
+    context_packer: Any
+    interactions: Any = None
+    admission: Any = None
+
+
+def embed_model_kwargs(config: AppConfig) -> dict:
+    embedding = config.embedding
+    return {
+        "model_name": embedding.model_name,
+        "cache_dir": embedding.cache_dir,
+        "batch_size": embedding.batch_size,
+        "vector_cache_dir": embedding.vector_cache_dir,
+        "vector_cache_mb": embedding.vector_cache_mb,
+    }
+
+
+def load_models(config: AppConfig) -> Models:
+    """Load (and optionally warm up) the embedding model and prompt tokenizer. Blocking."""
+    import tiktoken
+    from llama_index.core import Settings
+    from src.adapters.outbound.embedder_llamaindex import build_embed_model
+
+    embed_model = build_embed_model(**embed_model_kwargs(config))
+    Settings.embed_model = embed_model
+    encoding = tiktoken.get_encoding(config.retrieval.tokenizer)
+    if config.server.warmup:
+        # First inference initialises the ONNX session and allocates buffers; go around the embedding cache.
+        getattr(embed_model, "inner", embed_model).get_query_embedding("warmup")
+        encoding.encode("warmup")
+    logger.info("Loaded embedding model %s", config.embedding.model_name)
+    return Models(
+        embed_model=embed_model,
+        count_tokens=lambda text: len(encoding.encode(text, disallowed_special=())),
+    )
+
+
+def build_components(config: AppConfig, models: Models) -> Components:
+    """Create clients, indexes and ports. Blocking (Qdrant connects here)."""
+    import os
+    from llama_index.core import Settings
+    from llama_index.core.node_parser import SentenceSplitter
+    from src import tracing
+    from src.adapters.llamaindex_utils import (
+        get_qdrant_vector_store, get_vectorstore_index, get_sparse_index, make_tenant_retriever_factory,
+    )
+    from src.adapters.inbound.ingestion import LlamaindexIngestionAdapter
+    from src.adapters.outbound.embedder_llamaindex import MicroBatchingEmbedder
+    from src.adapters.outbound.generator_openai import LitellmGenerator
+    from src.adapters.outbound.retriever_llamaindex import LlamaindexRetriever
+    from src.application.admission import AdmissionController
+    from src.application.answer_cache import SemanticAnswerCache
+    from src.application.context_packing import ContextPacker
+    from src.application.tenants import TenantRegistry
+
+    tracing.configure(config.server.metrics)
+    Settings.embed_model = models.embed_model
+    qdrant = config.qdrant
+    api_key = qdrant.api_key or None
+    # In-process BM25 for keyword matching, unless Qdrant's own sparse vectors are used instead.
+    sparse_dir = config.retrieval.sparse_index_dir if not qdrant.enable_hybrid else ""
+
+    # One batcher shared by the answer cache and the retriever, so concurrent /ask queries embed together.
+    embedder = MicroBatchingEmbedder(
+        embed_model=models.embed_model,
+        max_batch_size=config.embedding.query_batch_size,
+        max_wait_ms=config.embedding.query_wait_ms,
+    )
+    sparse_persist_dir = os.path.join(sparse_dir, qdrant.collection) if sparse_dir else None
+    pg = config.postgres
+    if pg.dsn:
+        from src.adapters.outbound.retriever_langchain import PGVectorRetriever
+
+        # The pool is created on first use, inside the worker's event loop.
+        retriever = PGVectorRetriever(
+            dsn=pg.dsn, table=pg.table, dimension=pg.dimension, embedder=embedder, embed_model=models.embed_model,
+            similarity_top_k=config.retrieval.similarity_top_k, distance=pg.distance, index_type=pg.index_type,
+            hnsw_m=pg.hnsw_m, hnsw_ef_construction=pg.hnsw_ef_construction, ivfflat_lists=pg.ivfflat_lists,
+            insert_batch_size=pg.insert_batch_size, pool_min_size=pg.pool_min_size, pool_max_size=pg.pool_max_size,
+            ef_search=pg.ef_search, probes=pg.probes,
+        )
+    else:
+        vector_store = get_qdrant_vector_store(
+            url=qdrant.url, api_key=api_key, collection_name=qdrant.collection, enable_hybrid=qdrant.enable_hybrid,
+        )
+        retriever = LlamaindexRetriever(
+            index=get_vectorstore_index(vector_store=vector_store),
+            similarity_top_k=config.retrieval.similarity_top_k,
+            embedder=embedder,
+            sparse_index=get_sparse_index(sparse_persist_dir) if sparse_persist_dir else None,
+            sparse_persist_dir=sparse_persist_dir,
+            sparse_persist_interval=config.retrieval.sparse_persist_interval,
+        )
+    # Per-organisation retrievers on their own collections, built lazily and LRU-bounded.
+    tenants = TenantRegistry(
+        make_tenant_retriever_factory(
+            url=qdrant.url, collection_prefix=qdrant.collection, api_key=api_key,
+            sparse_dir=sparse_dir or None, enable_hybrid=qdrant.enable_hybrid,
+            similarity_top_k=config.retrieval.similarity_top_k, embedder=embedder,
+            sparse_persist_interval=config.retrieval.sparse_persist_interval,
+        ),
+        max_tenants=config.tenants.max_tenants,
+    )
+    # Factories rather than instances, so ingestion worker processes can build their own.
+    transformation_factories = [
+        partial(SentenceSplitter, chunk_size=config.ingestion.chunk_size, chunk_overlap=config.ingestion.chunk_overlap),
+    ]
+    cache = config.answer_cache
+    admission = config.admission
+    interactions = None
+    if config.interactions.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from src.adapters.outbound.store_mongo import MongoInteractionRepo
+
+        log = config.interactions
+        interactions = MongoInteractionRepo(
+            AsyncIOMotorClient(log.mongo_url), db_name=log.db_name, batch_size=log.batch_size,
+            flush_interval=log.flush_interval, max_buffer=log.max_buffer, overflow=log.overflow,
+        )
+    ingestion = config.ingestion
+    stream_chunker = None
+    if ingestion.stream_threshold_mb > 0:
+        from llama_index.core.utils import get_tokenizer
+        from src.core.text_stream import StreamingSentenceChunker
+
+        # Same chunk budget and tokenizer as the SentenceSplitter used for whole documents.
+        stream_chunker = StreamingSentenceChunker(
+            chunk_size=ingestion.chunk_size, chunk_overlap=ingestion.chunk_overlap, tokenizer=get_tokenizer(),
+        )
+    worker_embed_model = None
+    if ingestion.workers > 0 and ingestion.embed_in_workers:
+        from src.adapters.outbound.embedder_llamaindex import build_embed_model
+
+        # Each ingestion worker loads its own model; they share the on-disk embedding cache.
+        worker_embed_model = partial(build_embed_model, **embed_model_kwargs(config), threads=ingestion.worker_threads)
+    return Components(
+        ingester=LlamaindexIngestionAdapter(
+            storage_dir=ingestion.storage_dir, transformations=[factory() for factory in transformation_factories],
+            workers=ingestion.workers, shards_per_worker=ingestion.shards_per_worker,
+            transformation_factories=transformation_factories, embed_model_factory=worker_embed_model,
+            embed_threads=ingestion.worker_threads, stream_chunker=stream_chunker,
+            stream_threshold_bytes=ingestion.stream_threshold_mb << 20, stream_batch_size=ingestion.stream_batch_size,
+            stream_block_chars=ingestion.stream_block_kb << 10,
+        ),
+        retriever=retriever,
+        generator=LitellmGenerator(model=config.generator.model),
+        embedder=embedder,
+        answer_cache=SemanticAnswerCache(max_entries=cache.max_entries, ttl=cache.ttl, threshold=cache.threshold) if cache.enabled else None,
+        tenants=tenants,
+        # Token budget for retrieved context, counted with the generator model's tokenizer.
+        context_packer=ContextPacker(max_tokens=config.retrieval.context_tokens, count_tokens=models.count_tokens),
+        interactions=interactions,
+        admission=AdmissionController(
+            limits={
+                "embedding": admission.embedding_concurrency,
+                "retrieval": admission.retrieval_concurrency,
+                "generation": admission.generation_concurrency,
+            },
+            max_queue=admission.max_queue,
+            queue_timeout=admission.queue_timeout,
+            single_flight=admission.single_flight,
+        ) if admission.enabled else None,
+    )
+
+
+def build_rag_service(components: Components, config: AppConfig | None = None):
+    from src.application.rag_service import RagService
+
+    config = config or AppConfig()
+    return RagService(
+        ingester=components.ingester,
+        retriever=components.retriever,
+        generator=components.generator,
+        embedder=components.embedder,
+        answer_cache=components.answer_cache,
+        tenants=components.tenants,
+        context_packer=components.context_packer,
+        interactions=components.interactions,
+        batch_generation_concurrency=config.generator.batch_concurrency,
+        admission=components.admission,
+    )
+
+
+def make_startup(config: AppConfig, models: Models | None = None):
+    """Async builder for create_app's lifespan; blocking work runs on a thread."""
+    async def startup():
+        loaded = models or await asyncio.to_thread(load_models, config)
+        components = await asyncio.to_thread(build_components, config, loaded)
+        return build_rag_service(components, config)
+    return startup
+
+
+def create_app(config: AppConfig | None = None):
+    from src.adapters.inbound.rest import create_app as create_rest_app
+
+    config = config or load_config()
+    models = load_models(config) if config.server.preload else None
+    return create_rest_app(startup=make_startup(config, models), config=config)
@@ -0,0 +1,209 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Tuple
+
+from src.logger import setup_logger, set_request_id_provider, log_stats
+
+logger = setup_logger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+_enabled = os.getenv("RAG_METRICS", "1") != "0"
+
+
+def configure(enabled: bool) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> str | None:
+    return _request_id.get()
+
+
+# JSON log lines carry the request id of the task that logged them.
+set_request_id_provider(get_request_id)
+
+
+def set_request_id(request_id: str | None) -> contextvars.Token:
+    """Bind a correlation id to the current task; it follows awaits and asyncio.to_thread."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observations cost one bisect and three additions under a lock."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Counter | Histogram] = {}
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_duration_seconds", "Time spent per pipeline stage.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+HTTP_SECONDS = REGISTRY.histogram("rag_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter("rag_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+
+
+class _Span:
+    __slots__ = ("stage", "started", "into", "record")
+
+    def __init__(self, stage: str, into: dict | None = None, record: bool = True) -> None:
+        self.stage = stage
+        self.into = into
+        self.record = record
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self.started
+        if self.into is not None:
+            self.into[self.stage] = elapsed
+        if not self.record:
+            return
+        STAGE_SECONDS.observe(elapsed, self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.stage)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span stage=%s request_id=%s duration_ms=%.2f", self.stage, _request_id.get(), elapsed * 1000)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str, into: dict | None = None) -> "_Span | _NoopSpan":
+    """
+    Time a block as one pipeline stage: `with span("retrieval"): ...`.
+    Works in sync code, async code and worker threads. When metrics are
+    disabled a shared no-op object is returned, so the cost is one call.
+    With `into`, the duration in seconds is also stored as `into[stage]`,
+    whether or not metrics are enabled.
+    """
+    if into is not None:
+        return _Span(stage, into, record=_enabled)
+    return _Span(stage) if _enabled else _NOOP
+
+
+def _render_log_stats() -> str:
+    stats = log_stats()
+    if not stats:
+        return ""
+    lines = [
+        "# HELP rag_log_records_total Log records by outcome (enqueued, dropped, shed, sampled_out, truncated).",
+        "# TYPE rag_log_records_total counter",
+    ]
+    for outcome in ("enqueued", "dropped", "shed", "sampled_out", "truncated"):
+        lines.append(f'rag_log_records_total{{outcome="{outcome}"}} {stats[outcome]}')
+    lines += ["# HELP rag_log_queue_depth Records waiting for the log listener.", "# TYPE rag_log_queue_depth gauge",
+              f"rag_log_queue_depth {stats['queue_size']}"]
+    return "\n".join(lines) + "\n"
+
+
+def render_metrics() -> str:
+    return REGISTRY.render() + _render_log_stats()
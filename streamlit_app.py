@@ -1,15 +1,44 @@
 import streamlit as st
 import requests
 import ast
+import json
+import time
 from src.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 API_ASK_URL = "http://localhost:8000/ask"
+API_ASK_STREAM_URL = "http://localhost:8000/ask/stream"
 API_INGEST_URL = "http://localhost:8000/ingest"
 
 st.title("RAG Ingestion & Question Answering")
 
+
+def read_sse(response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def wait_for_ingestion(job_id, timeout=600, interval=1.0):
+    """Poll the ingestion job until it finishes or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    job = {}
+    while time.monotonic() < deadline:
+        job = requests.get(f"{API_INGEST_URL}/{job_id}").json()
+        if job.get("status") in ("succeeded", "failed"):
+            break
+        time.sleep(interval)
+    return job
+
+
 if "ingested" not in st.session_state:
     st.session_state.ingested = False
 if "ingest_status" not in st.session_state:
@@ -38,9 +67,15 @@ if st.button("Ingest"):
                 files = {"file": (uploaded_file.name, uploaded_file, "text/plain")}
                 data = {"metadata": str(metadata)}
                 response = requests.post(API_INGEST_URL, files=files, data=data)
-                if response.status_code == 200 and response.json().get("status") == "success":
-                    st.session_state.ingested = True
-                    st.session_state.ingest_status = "Ingestion successful!"
+                if response.status_code == 202:
+                    job_id = response.json()["job_id"]
+                    with st.spinner("Ingesting..."):
+                        job = wait_for_ingestion(job_id)
+                    if job.get("status") == "succeeded":
+                        st.session_state.ingested = True
+                        st.session_state.ingest_status = "Ingestion successful!"
+                    else:
+                        st.session_state.ingest_status = f"Ingestion failed: {job.get('error') or job.get('status')}"
                 else:
                     st.session_state.ingest_status = f"Ingestion failed: {response.text}"
         except Exception as e:
@@ -70,12 +105,23 @@ if st.button("Ask"):
                 st.session_state.last_answer = {"text": "Error: Filters must be a dictionary.", "citations": []}
             else:
                 payload = {"query": question, "filters": filters}
-                print("Payload for ask request:", payload)
-                response = requests.post(API_ASK_URL, json=payload)
-                if response.status_code == 200:
-                    st.session_state.last_answer = response.json()
-                else:
-                    st.session_state.last_answer = {"text": "Error: Could not get answer.", "citations": []}
+                logger.debug("Payload for ask request: %s", payload)
+                answer = {"text": "", "citations": []}
+                answer_box = st.empty()
+                with requests.post(API_ASK_STREAM_URL, json=payload, stream=True) as response:
+                    if response.status_code != 200:
+                        answer["text"] = "Error: Could not get answer."
+                    else:
+                        for event, data in read_sse(response):
+                            if event == "citations":
+                                answer["citations"] = data
+                            elif event == "token":
+                                answer["text"] += data["text"]
+                                answer_box.markdown(answer["text"])
+                            elif event == "error":
+                                answer["text"] = f"Error: {data.get('detail')}"
+                answer_box.empty()
+                st.session_state.last_answer = answer
         except Exception as e:
             logger.error("Filter error: %s", e)
             st.session_state.last_answer = {"text": f"Filter error: {e}", "citations": []}
@@ -0,0 +1,49 @@
+from llama_index.core.vector_stores.types import FilterOperator
+from src.adapters.outbound.filter_cache import RetrieverCache, _flatten, canonical_key, compile_filters
+
+
+def test_canonical_key_ignores_dict_order():
+    assert canonical_key({"a": 1, "b": {"c": 2, "d": 3}}) == canonical_key({"b": {"d": 3, "c": 2}, "a": 1})
+    assert canonical_key({"tags": {"x", "y"}}) == canonical_key({"tags": {"y", "x"}})
+
+
+def test_canonical_key_keeps_scalar_types_apart():
+    keys = {canonical_key(v) for v in (1, True, "1", 1.0)}
+    assert len(keys) == 4
+    assert canonical_key([1, 2]) != canonical_key([2, 1])
+
+
+def test_flatten_nested_paths():
+    assert _flatten({"author": {"name": "x", "org": {"id": 7}}, "year": 2024}) == [
+        ("author.name", "x"), ("author.org.id", 7), ("year", 2024),
+    ]
+
+
+def test_compile_filters():
+    assert compile_filters(None) is None and compile_filters({}) is None
+    compiled = compile_filters({"author": {"name": "x"}, "tag": ["a", "b"], "kind": ("c",)})
+    by_key = {f.key: f for f in compiled.filters}
+    assert by_key["author.name"].value == "x" and by_key["author.name"].operator == FilterOperator.EQ
+    assert by_key["tag"].value == ["a", "b"] and by_key["tag"].operator == FilterOperator.IN
+    assert by_key["kind"].value == ["c"] and by_key["kind"].operator == FilterOperator.IN
+
+
+def test_retriever_cache_hits_misses_and_evicts_lru():
+    built = []
+
+    def build(filters):
+        built.append(filters)
+        return object()
+
+    cache = RetrieverCache(build, max_size=2)
+    a = cache.get({"x": 1, "y": 2})
+    assert cache.get({"y": 2, "x": 1}) is a
+    b = cache.get({"x": 2})
+    cache.get({"x": 1, "y": 2})  # a becomes most recent, so b is evicted next
+    cache.get(None)
+    assert cache.get({"x": 1, "y": 2}) is a
+    assert cache.get({"x": 2}) is not b
+    assert len(built) == 4
+    assert cache.stats() == {
+        "hits": 3, "misses": 4, "hit_rate": 3 / 7, "evictions": 2, "entries": 2, "max_size": 2,
+    }
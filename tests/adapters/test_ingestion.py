@@ -0,0 +1,139 @@
+import asyncio
+import io
+import os
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from llama_index.core.node_parser import SentenceSplitter
+from src.adapters.inbound.ingestion import LlamaindexIngestionAdapter, ThreadCappedSpawnContext, extract_archive
+from src.core.text_stream import StreamingSentenceChunker
+
+
+@pytest.fixture
+def adapter(tmp_path):
+    return LlamaindexIngestionAdapter(tmp_path / "store", [SentenceSplitter(chunk_size=64, chunk_overlap=8)])
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "docs"
+    directory.mkdir()
+    (directory / "a.txt").write_text("Alpha is the first letter. " * 20)
+    (directory / "b.txt").write_text("Beta comes second. " * 20)
+    return directory
+
+
+def _sync(adapter, directory, org_id=None, batches=None):
+    batches = [] if batches is None else batches
+
+    async def run():
+        plan = await adapter.sync(directory=directory, org_id=org_id)
+        async for batch in adapter.sync_stream(plan, directory=directory):
+            batches.append(batch)
+        return plan
+
+    plan = asyncio.run(run())
+    adapter.commit_sync(plan)
+    return plan
+
+
+def test_sync_only_reindexes_changes(adapter, source):
+    batches = []
+    first = _sync(adapter, source, batches=batches)
+    assert len(first.added) == 2
+    indexed = [doc.id for batch in batches for doc in batch]
+    assert indexed and sorted(indexed) == sorted(i for entry in first.manifest.values() for i in entry["chunk_ids"])
+    batches.clear()
+    second = _sync(adapter, source, batches=batches)
+    assert second.unchanged == 2 and not batches and not second.stale_ids
+    (source / "a.txt").write_text("Alpha changed. " * 20)
+    (source / "b.txt").unlink()
+    third = _sync(adapter, source)
+    assert third.changed == [(source / "a.txt").absolute().as_posix()]
+    assert third.removed == [(source / "b.txt").absolute().as_posix()]
+    assert set(third.stale_ids) == {i for entry in first.manifest.values() for i in entry["chunk_ids"]}
+
+
+def test_manifest_is_per_org(adapter, source):
+    _sync(adapter, source, org_id="a")
+    plan = _sync(adapter, source, org_id="b")
+    assert len(plan.added) == 2 and all(entry["chunk_ids"] for entry in plan.manifest.values())
+    assert _sync(adapter, source, org_id="a").unchanged == 2
+
+
+def test_files_with_identical_content_keep_separate_chunks(adapter, source):
+    (source / "copy.txt").write_text((source / "a.txt").read_text())
+    batches = []
+    first = _sync(adapter, source, batches=batches)
+    ids = [doc.id for batch in batches for doc in batch]
+    assert len(ids) == len(set(ids))
+    original = first.manifest[(source / "a.txt").absolute().as_posix()]["chunk_ids"]
+    copy = first.manifest[(source / "copy.txt").absolute().as_posix()]["chunk_ids"]
+    assert original and len(original) == len(copy) and not set(original) & set(copy)
+    # Removing the copy only retires the copy's chunks.
+    (source / "copy.txt").unlink()
+    assert set(_sync(adapter, source).stale_ids) == set(copy)
+
+
+def test_chunk_ids_do_not_depend_on_batching(adapter, source):
+    (source / "copy.txt").write_text((source / "a.txt").read_text())
+    paths = sorted(source.glob("*.txt"))
+    together = asyncio.run(adapter.ingest(filepaths=paths))
+    alone = [doc for path in paths for doc in asyncio.run(adapter.ingest(filepath=path))]
+    assert sorted(d.id for d in together) == sorted(d.id for d in alone)
+
+
+def test_sync_streams_large_files_in_bounded_batches(tmp_path, source):
+    adapter = LlamaindexIngestionAdapter(
+        tmp_path / "store", [SentenceSplitter(chunk_size=64, chunk_overlap=8)],
+        stream_chunker=StreamingSentenceChunker(chunk_size=16, chunk_overlap=4),
+        stream_threshold_bytes=4096, stream_batch_size=8, stream_block_chars=512,
+    )
+    text = "".join(f"Sentence number {i} is here. " for i in range(400))
+    (source / "big.txt").write_text(text)
+    batches = []
+    plan = _sync(adapter, source, batches=batches)
+    assert max(map(len, batches)) == 8 and len(batches) > 10
+    big = [doc for batch in batches for doc in batch if doc.metadata["file_name"] == "big.txt"]
+    assert all(text[d.start_char_idx:d.end_char_idx] == d.text for d in big)
+    assert plan.manifest[(source / "big.txt").absolute().as_posix()]["chunk_ids"] == [d.id for d in big]
+
+
+def test_sync_skips_hidden_files_and_manifests(adapter, source):
+    (source / ".hidden").mkdir()
+    (source / ".hidden" / "c.txt").write_text("Hidden. " * 10)
+    adapter.storage_dir = source
+    _sync(adapter, source)
+    plan = _sync(adapter, source)
+    assert plan.unchanged == 2 and not plan.added
+
+
+def test_workers_start_with_thread_caps(monkeypatch):
+    monkeypatch.setenv("OMP_NUM_THREADS", "16")
+    monkeypatch.delenv("MKL_NUM_THREADS", raising=False)
+    with ProcessPoolExecutor(max_workers=1, mp_context=ThreadCappedSpawnContext(2)) as pool:
+        child = pool.submit(os.getenv, "OMP_NUM_THREADS").result(timeout=60)
+        child_mkl = pool.submit(os.getenv, "MKL_NUM_THREADS").result(timeout=60)
+    assert child == child_mkl == "2"
+    # Only the child's environment changes.
+    assert os.environ["OMP_NUM_THREADS"] == "16" and "MKL_NUM_THREADS" not in os.environ
+
+
+def _tar(path, name, data=b"x", kind=tarfile.REGTYPE):
+    with tarfile.open(path, "w") as tf:
+        info = tarfile.TarInfo(name)
+        info.type = kind
+        info.size = len(data) if kind == tarfile.REGTYPE else 0
+        tf.addfile(info, io.BytesIO(data) if kind == tarfile.REGTYPE else None)
+    return path
+
+
+@pytest.mark.parametrize("data_filter", [True, False])
+def test_extract_archive_rejects_escaping_tar_members(tmp_path, monkeypatch, data_filter):
+    if not data_filter:
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    files = extract_archive(_tar(tmp_path / "ok.tar", "docs/a.txt"), tmp_path / "ok")
+    assert [p.name for p in files] == ["a.txt"]
+    with pytest.raises(ValueError):
+        extract_archive(_tar(tmp_path / "bad.tar", "../evil.txt"), tmp_path / "bad")
+    assert not (tmp_path / "evil.txt").exists()
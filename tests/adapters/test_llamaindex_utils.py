@@ -0,0 +1,9 @@
+import pytest
+from src.adapters.llamaindex_utils import tenant_collection_name
+
+
+def test_tenant_collection_names_never_collide():
+    assert tenant_collection_name("docs", "acme_eu") == "docs_acme_eu"
+    for org_id in ("acme.eu", "acme/eu"):
+        with pytest.raises(ValueError):
+            tenant_collection_name("docs", org_id)
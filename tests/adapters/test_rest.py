@@ -0,0 +1,121 @@
+import json
+import pytest
+from pydantic import ValidationError
+from src.adapters.inbound.rest import AskBatchRequest, parse_metadata
+from src.application.admission import AdmissionRejected
+from src.domain.model import Answer, BatchAnswer
+
+
+def test_parse_metadata_accepts_json_and_python_literals():
+    assert parse_metadata('{"author": "a", "n": 1}') == {"author": "a", "n": 1}
+    assert parse_metadata("{'author': 'a'}") == {"author": "a"}
+
+
+def test_parse_metadata_never_evaluates_code():
+    assert parse_metadata('__import__("os").getcwd()') == {}
+    assert parse_metadata("[1, 2]") == {}
+
+
+def test_batch_concurrency_must_be_positive():
+    assert AskBatchRequest(questions=[], max_concurrency=3).max_concurrency == 3
+    for value in (0, -1):
+        with pytest.raises(ValidationError):
+            AskBatchRequest(questions=[], max_concurrency=value)
+
+
+class FakeService:
+    tenants = None
+
+    def __init__(self):
+        self.ingested = []
+        # Raised by ask_batch after answering `fail_after` questions.
+        self.batch_error = None
+        self.fail_after = 0
+
+    async def ingest(self, progress=None, **params):
+        self.ingested.append(params)
+
+    async def ask_batch(self, questions, max_concurrency=None):
+        for i, question in enumerate(questions):
+            if self.batch_error is not None and i == self.fail_after:
+                raise self.batch_error
+            yield BatchAnswer(i, Answer(text=question.text.upper(), citations=[]))
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def client(tmp_path):
+    from fastapi.testclient import TestClient
+    from src.adapters.inbound.rest import create_app
+    from src.config import AppConfig
+
+    config = AppConfig()
+    config.ingestion.storage_dir = str(tmp_path / "store")
+    config.tenants.warm_active = 0
+    with TestClient(create_app(rag_service=FakeService(), config=config)) as client:
+        yield client
+
+
+def test_ingest_rejects_non_text_with_415(client, tmp_path):
+    response = client.post("/ingest", files={"file": ("a.pdf", b"%PDF", "application/pdf")})
+    assert response.status_code == 415
+    assert not (tmp_path / "store" / "a.pdf").exists()
+
+
+def test_bulk_ingest_cleans_up_staged_files_on_failure(client, tmp_path):
+    response = client.post("/ingest/bulk", files=[
+        ("files", ("a.txt", b"alpha", "text/plain")),
+        ("files", ("broken.zip", b"not an archive", "application/zip")),
+    ])
+    assert response.status_code == 400
+    assert list((tmp_path / "store").iterdir()) == []
+
+
+def test_bulk_ingest_keeps_files_when_queued(client, tmp_path):
+    response = client.post("/ingest/bulk", files=[
+        ("files", ("a.txt", b"alpha", "text/plain")),
+        ("files", ("a.txt", b"beta", "text/plain")),
+    ])
+    assert response.status_code == 202 and response.json()["status"] == "queued"
+    assert sorted(p.read_text() for p in (tmp_path / "store").rglob("a.txt")) == ["alpha", "beta"]
+
+
+def _ask_batch(client, *queries):
+    return client.post("/ask/batch", json={"questions": [{"query": q, "filters": {}} for q in queries]})
+
+
+def test_ask_batch_streams_one_line_per_question(client):
+    response = _ask_batch(client, "a", "b")
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"index": 0, "text": "A", "citations": []}, {"index": 1, "text": "B", "citations": []},
+    ]
+
+
+def test_ask_batch_embedding_rejection_is_a_429(client):
+    client.app.state.rag_service.batch_error = AdmissionRejected("embedding", 429, 3, "queue full")
+    response = _ask_batch(client, "a", "b")
+    assert response.status_code == 429 and response.headers["Retry-After"] == "3"
+
+
+def test_ask_batch_failure_after_the_response_started_errors_the_rest(client):
+    service = client.app.state.rag_service
+    service.batch_error, service.fail_after = RuntimeError("embedder down"), 1
+    response = _ask_batch(client, "a", "b", "c")
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"index": 0, "text": "A", "citations": []},
+        {"index": 1, "error": "embedder down"},
+        {"index": 2, "error": "embedder down"},
+    ]
+
+
+def test_ask_batch_failure_before_any_result_errors_every_question(client):
+    client.app.state.rag_service.batch_error = RuntimeError("embedder down")
+    response = _ask_batch(client, "a", "b")
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"index": 0, "error": "embedder down"}, {"index": 1, "error": "embedder down"},
+    ]
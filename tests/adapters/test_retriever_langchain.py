@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import uuid
+import pytest
+
+pytest.importorskip("asyncpg")
+from src.adapters.outbound.retriever_langchain import (
+    PGVectorRetriever, _decode_vector, _encode_vector, compile_jsonb_filters,
+)
+from src.domain.model import BaseDocument
+
+DSN = os.environ.get("POSTGRES_DSN")
+
+
+def test_equalities_merge_into_one_containment():
+    where, params = compile_jsonb_filters({"author": {"name": "x"}, "year": 2024}, first_param=3)
+    assert where == "metadata @> $3::jsonb"
+    assert [json.loads(p) for p in params] == [{"author": {"name": "x"}, "year": 2024}]
+
+
+def test_lists_become_containment_any_and_number_params_in_order():
+    where, params = compile_jsonb_filters({"tag": ["a", "b"], "author": {"id": [1]}, "lang": "en"}, first_param=3)
+    assert where == "metadata @> ANY($3::jsonb[]) AND metadata @> ANY($4::jsonb[]) AND metadata @> $5::jsonb"
+    assert [json.loads(v) for v in params[0]] == [{"tag": "a"}, {"tag": "b"}]
+    assert [json.loads(v) for v in params[1]] == [{"author": {"id": 1}}]
+    assert json.loads(params[2]) == {"lang": "en"}
+
+
+def test_no_filters_match_everything():
+    assert compile_jsonb_filters(None) == ("TRUE", [])
+    assert compile_jsonb_filters({}) == ("TRUE", [])
+
+
+def test_vector_binary_round_trip():
+    vector = [0.5, -1.25, 3.0, 0.0]
+    data = _encode_vector(vector)
+    assert data[:4] == b"\x00\x04\x00\x00" and len(data) == 4 + 4 * len(vector)
+    assert _decode_vector(data) == vector
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"dsn": "postgresql://x", "table": "chunks; DROP TABLE x"},
+    {"dsn": "postgresql://x", "table": "1chunks"},
+    {"dsn": "postgresql://x", "distance": "manhattan"},
+    {"dsn": "postgresql://x", "index_type": "btree"},
+])
+def test_constructor_rejects_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        PGVectorRetriever(**kwargs)
+
+
+@pytest.mark.skipif(not DSN, reason="POSTGRES_DSN is not set")
+def test_ingest_retrieve_and_delete_against_postgres():
+    table = f"test_chunks_{uuid.uuid4().hex[:8]}"
+
+    def doc(id, embedding, **metadata):
+        return BaseDocument(id=id, text=f"text {id}", score=0, metadata=metadata, embedding=embedding)
+
+    async def run():
+        retriever = PGVectorRetriever(dsn=DSN, table=table, dimension=3, similarity_top_k=2)
+        try:
+            await retriever.ingest([
+                doc("a", [1.0, 0.0, 0.0], lang="en", tag="x"),
+                doc("b", [0.9, 0.1, 0.0], lang="de", tag="y"),
+                doc("c", [0.0, 1.0, 0.0], lang="en", tag="y"),
+            ])
+            nearest = await retriever.retrieve("q", query_embedding=[1.0, 0.0, 0.0])
+            filtered = await retriever.retrieve("q", filters={"lang": "en", "tag": ["y"]}, query_embedding=[1.0, 0.0, 0.0])
+            batch = await retriever.retrieve_batch(["q1", "q2"], query_embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+            await retriever.delete(["a"])
+            after_delete = await retriever.retrieve("q", query_embedding=[1.0, 0.0, 0.0])
+            return nearest, filtered, batch, after_delete
+        finally:
+            async with retriever._pool.acquire() as conn:
+                await conn.execute(f"DROP TABLE IF EXISTS {table}")
+            await retriever.aclose()
+
+    nearest, filtered, batch, after_delete = asyncio.run(run())
+    assert [d.id for d in nearest] == ["a", "b"]
+    assert nearest[0].score == pytest.approx(1.0) and nearest[0].metadata == {"lang": "en", "tag": "x"}
+    assert [d.id for d in filtered] == ["c"]
+    assert [[d.id for d in docs] for docs in batch] == [["a", "b"], ["c", "b"]]
+    assert [d.id for d in after_delete] == ["b", "c"]
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+
+pytest.importorskip("motor")
+from pymongo.errors import BulkWriteError
+from src.adapters.outbound.store_mongo import DROP_NEWEST, DUPLICATE_KEY, MongoInteractionRepo
+from src.domain.model import Answer
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self.fail = None
+        self.release: asyncio.Event | None = None
+
+    async def insert_many(self, batch, ordered=True):
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail is not None:
+            error, self.fail = self.fail(batch), None
+            raise error
+        self.docs.extend(batch)
+
+
+class FakeClient:
+    def __init__(self):
+        self.collection = FakeCollection()
+        self.closed = False
+
+    def __getitem__(self, name):
+        return {"interactions": self.collection}
+
+    def close(self):
+        self.closed = True
+
+
+def _repo(**kwargs):
+    client = FakeClient()
+    return MongoInteractionRepo(client, **kwargs), client.collection, client
+
+
+async def _save(repo, question):
+    await repo.save(question, Answer(text="a", citations=[]), [])
+
+
+def test_save_buffers_and_flushes_full_batches():
+    async def run():
+        repo, coll, client = _repo(batch_size=3, flush_interval=60)
+        for i in range(2):
+            await _save(repo, f"q{i}")
+        await asyncio.sleep(0.01)
+        buffered = (len(coll.docs), repo.stats()["buffered"])
+        await _save(repo, "q2")
+        await asyncio.sleep(0.01)
+        flushed = [d["question"] for d in coll.docs]
+        await repo.aclose()
+        return buffered, flushed, repo.stats(), client
+
+    buffered, flushed, stats, client = asyncio.run(run())
+    assert buffered == (0, 2)
+    assert flushed == ["q0", "q1", "q2"]
+    assert stats == {"buffered": 0, "written": 3, "dropped": 0, "failed_batches": 0}
+    assert client.closed
+
+
+@pytest.mark.parametrize("overflow, kept", [("drop_oldest", ["q2", "q3"]), (DROP_NEWEST, ["q0", "q1"])])
+def test_overflow_policies(overflow, kept):
+    async def run():
+        repo, coll, _ = _repo(batch_size=100, flush_interval=60, max_buffer=2, overflow=overflow)
+        for i in range(4):
+            await _save(repo, f"q{i}")
+        await repo.aclose()
+        return [d["question"] for d in coll.docs], repo.stats()
+
+    written, stats = asyncio.run(run())
+    assert written == kept
+    assert stats["dropped"] == 2
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError):
+        MongoInteractionRepo(FakeClient(), overflow="drop_all")
+
+
+def test_bulk_write_error_requeues_only_failed_records():
+    def partial_failure(batch):
+        # Record 0 was written, 1 was a retried duplicate, 2 failed.
+        return BulkWriteError({"writeErrors": [
+            {"index": 1, "code": DUPLICATE_KEY, "errmsg": "duplicate"},
+            {"index": 2, "code": 121, "errmsg": "validation"},
+        ]})
+
+    async def run():
+        repo, coll, _ = _repo(batch_size=3, flush_interval=60)
+        coll.fail = partial_failure
+        for i in range(3):
+            await _save(repo, f"q{i}")
+        await asyncio.sleep(0.01)
+        after_failure = repo.stats()
+        await repo.aclose()
+        return after_failure, [d["question"] for d in coll.docs], repo.stats()
+
+    after_failure, written, stats = asyncio.run(run())
+    assert after_failure == {"buffered": 1, "written": 2, "dropped": 0, "failed_batches": 1}
+    assert written == ["q2"]
+    assert stats["written"] == 3 and stats["buffered"] == 0
+
+
+def test_aclose_waits_for_the_batch_being_written():
+    async def run():
+        repo, coll, _ = _repo(batch_size=2, flush_interval=60)
+        coll.release = asyncio.Event()
+        for i in range(3):
+            await _save(repo, f"q{i}")
+        await asyncio.sleep(0.01)  # the flusher has taken q0 and q1 and is blocked writing them
+        closing = asyncio.create_task(repo.aclose())
+        await asyncio.sleep(0.01)
+        coll.release.set()
+        await closing
+        await _save(repo, "late")
+        return [d["question"] for d in coll.docs], repo.stats()
+
+    written, stats = asyncio.run(run())
+    assert written == ["q0", "q1", "q2"]
+    assert stats == {"buffered": 0, "written": 3, "dropped": 1, "failed_batches": 0}
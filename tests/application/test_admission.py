@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from src.application.admission import AdmissionController, AdmissionRejected, SingleFlight, StageLimiter
+
+
+def test_full_queue_is_rejected_with_429():
+    async def run():
+        limiter = StageLimiter("generation", limit=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with limiter.slot():
+                pass
+        stats = limiter.stats()
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return rejected.value, stats, limiter.stats()
+
+    rejected, busy, idle = asyncio.run(run())
+    assert rejected.status == 429 and rejected.reason == "queue full" and rejected.retry_after >= 1
+    assert busy["active"] == 1 and busy["waiting"] == 1 and busy["queue_full"] == 1
+    assert idle["active"] == 0 and idle["waiting"] == 0 and idle["admitted"] == 2
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def run():
+        limiter = StageLimiter("retrieval", limit=1, queue_timeout=0.01)
+        async with limiter.slot():
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with limiter.slot():
+                    pass
+        return rejected.value, limiter.stats()
+
+    rejected, stats = asyncio.run(run())
+    assert rejected.status == 503 and rejected.reason == "queue timeout"
+    assert stats["timed_out"] == 1 and stats["waiting"] == 0
+
+
+def test_retry_after_grows_with_queue_depth():
+    limiter = StageLimiter("generation", limit=2)
+    limiter._stats.avg_seconds = 3.0
+    assert limiter.retry_after() == 2
+    limiter._waiting = 5
+    assert limiter.retry_after() == 9
+
+
+def test_single_flight_shares_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("q", fn) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(run())
+    assert results == ["answer"] * 5 and len(calls) == 1
+    assert stats == {"inflight": 0, "leaders": 1, "followers": 4}
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def fn():
+            started.set()
+            await asyncio.sleep(0.02)
+            return 42
+
+        leader = asyncio.create_task(flight.do("q", fn))
+        await started.wait()
+        follower = asyncio.create_task(flight.do("q", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(run()) == (42, True)
+
+
+def test_single_flight_propagates_errors_and_forgets_key():
+    async def run():
+        flight = SingleFlight()
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await flight.do("q", fail)
+        return await flight.do("q", lambda: asyncio.sleep(0, result="ok")), flight.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == "ok" and stats["leaders"] == 2 and stats["inflight"] == 0
+
+
+def test_controller_only_limits_configured_stages():
+    controller = AdmissionController({"generation": 2}, single_flight=False)
+    assert controller.stage("generation").limit == 2
+    assert controller.stage("embedding") is None
+    assert controller.stats()["single_flight"] == {}
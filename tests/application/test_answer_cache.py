@@ -0,0 +1,55 @@
+from unittest import mock
+from src.application.answer_cache import SemanticAnswerCache, canonical_filters
+from src.domain.model import Answer
+
+
+def _answer(text):
+    return Answer(text=text, citations=[])
+
+
+def test_canonical_filters_ignores_order_and_empty():
+    assert canonical_filters({"a": 1, "b": 2}) == canonical_filters({"b": 2, "a": 1})
+    assert canonical_filters(None) == canonical_filters({}) == ""
+
+
+def test_hit_above_threshold_only():
+    cache = SemanticAnswerCache(max_entries=4, threshold=0.9)
+    cache.put([1.0, 0.0], _answer("x"))
+    assert cache.get([2.0, 0.1]).text == "x"
+    assert cache.get([0.0, 1.0]) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_filters_are_part_of_the_key():
+    cache = SemanticAnswerCache(max_entries=4)
+    cache.put([1.0, 0.0], _answer("a"), filters={"org": "a"})
+    assert cache.get([1.0, 0.0], filters={"org": "b"}) is None
+    assert cache.get([1.0, 0.0], filters={"org": "a"}).text == "a"
+
+
+def test_generation_bump_invalidates():
+    cache = SemanticAnswerCache(max_entries=4)
+    cache.put([1.0, 0.0], _answer("a"))
+    cache.bump_generation()
+    assert cache.get([1.0, 0.0]) is None
+
+
+def test_ttl_expiry():
+    cache = SemanticAnswerCache(max_entries=4, ttl=10)
+    with mock.patch("src.application.answer_cache.time.monotonic", return_value=100.0):
+        cache.put([1.0, 0.0], _answer("a"))
+    with mock.patch("src.application.answer_cache.time.monotonic", return_value=105.0):
+        assert cache.get([1.0, 0.0]) is not None
+    with mock.patch("src.application.answer_cache.time.monotonic", return_value=111.0):
+        assert cache.get([1.0, 0.0]) is None
+
+
+def test_lru_eviction():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.put([1.0, 0.0, 0.0], _answer("a"))
+    cache.put([0.0, 1.0, 0.0], _answer("b"))
+    cache.get([1.0, 0.0, 0.0])
+    cache.put([0.0, 0.0, 1.0], _answer("c"))
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    assert cache.get([1.0, 0.0, 0.0]).text == "a"
+    assert cache.stats()["evictions"] == 1
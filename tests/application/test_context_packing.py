@@ -0,0 +1,67 @@
+import random
+from src.application.context_packing import ContextPacker, approx_tokens
+from src.domain.model import BaseDocument
+
+SOURCE = "".join(f"Sentence {i} of the source talks about topic {i % 7}. " for i in range(60))
+
+
+def _doc(id, text, score, start=None, end=None, source="a.txt"):
+    metadata = {"file_path": source} if source else {}
+    return BaseDocument(id=id, text=text, score=score, metadata=metadata, embedding=None,
+                        start_char_idx=start, end_char_idx=end)
+
+
+def _span(id, start, end, score, source="a.txt"):
+    return _doc(id, SOURCE[start:end], score, start, end, source)
+
+
+def test_overlapping_spans_merge_into_one_passage():
+    packed = ContextPacker(max_tokens=10_000).pack([_span("x", 100, 300, 0.5), _span("y", 250, 400, 0.9)])
+    assert len(packed) == 1
+    passage = packed[0]
+    assert passage.text == SOURCE[100:400]
+    assert (passage.id, passage.score, passage.start_char_idx, passage.end_char_idx) == ("y", 0.9, 100, 400)
+
+
+def test_disjoint_spans_and_other_sources_stay_apart():
+    packed = ContextPacker(max_tokens=10_000).pack([
+        _span("x", 0, 100, 0.5), _span("y", 200, 300, 0.4), _span("z", 50, 150, 0.3, source="b.txt"),
+    ])
+    assert sorted(p.id for p in packed) == ["x", "y", "z"]
+
+
+def test_text_overlap_merges_chunks_without_offsets():
+    left, right = _doc("l", SOURCE[:200], 0.2), _doc("r", SOURCE[150:350], 0.7)
+    packed = ContextPacker(max_tokens=10_000).pack([right, left])
+    assert [p.text for p in packed] == [SOURCE[:350]]
+
+
+def test_near_duplicates_keep_the_best_scored():
+    text = SOURCE[:400]
+    packed = ContextPacker(max_tokens=10_000).pack([
+        _doc("low", text + " extra", 0.1, source="b.txt"),
+        _doc("high", text, 0.9, source="c.txt"),
+        _doc("other", SOURCE[1000:1400], 0.5, source="d.txt"),
+    ])
+    assert [p.id for p in packed] == ["high", "other"]
+
+
+def test_budget_is_never_exceeded():
+    rng = random.Random(0)
+    for _ in range(50):
+        budget = rng.randint(20, 400)
+        packer = ContextPacker(max_tokens=budget)
+        docs = []
+        for i in range(rng.randint(1, 12)):
+            start = rng.randint(0, len(SOURCE) - 50)
+            docs.append(_span(str(i), start, start + rng.randint(20, 1500), rng.random(), source=f"{i % 3}.txt"))
+        packed = packer.pack(docs)
+        assert packed
+        assert sum(approx_tokens(p.text) + packer.per_doc_overhead for p in packed) <= budget
+
+
+def test_oversized_best_passage_is_truncated():
+    packer = ContextPacker(max_tokens=30)
+    packed = packer.pack([_doc("big", SOURCE[:2000], 1.0, source=None)])
+    assert len(packed) == 1 and SOURCE.startswith(packed[0].text)
+    assert approx_tokens(packed[0].text) + packer.per_doc_overhead <= 30
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from src.application.ingestion_jobs import FAILED, SUCCEEDED, IngestionJobQueue, QueueFullError
+
+
+def test_full_queue_raises_queue_full_error():
+    async def run():
+        release = asyncio.Event()
+
+        async def job_run(job):
+            await release.wait()
+
+        jobs = IngestionJobQueue(job_run, concurrency=1, max_queue=2)
+        first = jobs.submit(n=0)
+        await asyncio.sleep(0)  # the worker takes the first job
+        jobs.submit(n=1)
+        jobs.submit(n=2)
+        with pytest.raises(QueueFullError):
+            jobs.submit(n=3)
+        depth = jobs.depth
+        release.set()
+        await jobs.shutdown(drain=True)
+        return first, depth, jobs
+
+    first, depth, jobs = asyncio.run(run())
+    assert depth == 2
+    assert first.status == SUCCEEDED and jobs.depth == 0
+    # The rejected job was never recorded.
+    assert len(jobs._jobs) == 3
+
+
+def test_job_status_progress_and_failure():
+    async def run():
+        async def job_run(job):
+            job.report("indexing", 0.5)
+            if job.params["fail"]:
+                raise RuntimeError("boom")
+            return {"chunks": 3}
+
+        jobs = IngestionJobQueue(job_run, concurrency=2)
+        ok, bad = jobs.submit(fail=False), jobs.submit(fail=True)
+        await jobs.shutdown(drain=True)
+        return ok, bad
+
+    ok, bad = asyncio.run(run())
+    assert (ok.status, ok.progress, ok.result) == (SUCCEEDED, 1.0, {"chunks": 3})
+    assert (bad.status, bad.stage, bad.error) == (FAILED, FAILED, "boom")
+    assert ok.to_dict()["params"] == {"fail": "False"}
+
+
+def test_finished_jobs_are_trimmed_oldest_first():
+    async def run():
+        async def job_run(job):
+            return None
+
+        jobs = IngestionJobQueue(job_run, concurrency=1, max_finished=2)
+        submitted = []
+        for i in range(4):
+            submitted.append(jobs.submit(i=i))
+            await asyncio.sleep(0.01)
+        await jobs.shutdown(drain=True)
+        jobs.submit(i=4)
+        await jobs.shutdown(drain=True)
+        return jobs, submitted
+
+    jobs, submitted = asyncio.run(run())
+    assert jobs.get(submitted[0].id) is None and jobs.get(submitted[1].id) is None
+    assert jobs.get(submitted[3].id) is not None
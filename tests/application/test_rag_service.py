@@ -0,0 +1,84 @@
+import asyncio
+from src.application.rag_service import RagService
+from src.domain.model import Answer, BaseDocument, Question, SyncPlan
+
+
+class FakeRetriever:
+    def __init__(self, drop=0):
+        self.drop = drop
+
+    async def retrieve_batch(self, queries, filters=None, query_embeddings=None):
+        return [[] for _ in queries[self.drop:]]
+
+
+class FakeGenerator:
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    async def generate(self, question, docs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return Answer(text=question.upper(), citations=[])
+
+
+def _run_batch(service, questions, **kwargs):
+    async def run():
+        return [result async for result in service.ask_batch(questions, **kwargs)]
+    return asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+
+def test_max_concurrency_is_capped_by_config():
+    generator = FakeGenerator()
+    service = RagService(ingester=None, retriever=FakeRetriever(), generator=generator, batch_generation_concurrency=2)
+    questions = [Question(text=f"q{i}") for i in range(8)]
+    results = _run_batch(service, questions, max_concurrency=100)
+    assert sorted(r.answer.text for r in results) == sorted(f"Q{i}" for i in range(8))
+    assert generator.peak == 2
+
+
+def test_short_retrieve_batch_fails_every_question():
+    service = RagService(ingester=None, retriever=FakeRetriever(drop=1), generator=FakeGenerator())
+    results = _run_batch(service, [Question(text="a"), Question(text="b")])
+    assert sorted(r.index for r in results) == [0, 1]
+    assert all(r.answer is None and "returned 1 results for 2" in r.error for r in results)
+
+
+class FakeIngester:
+    def __init__(self, batches):
+        self.batches = batches
+        self.events = []
+
+    async def sync(self, **kwargs):
+        return SyncPlan(stale_ids=["old"], added=["a"], changed=[], removed=[], unchanged=0, manifest={})
+
+    async def sync_stream(self, plan, **kwargs):
+        for i, size in enumerate(self.batches):
+            self.events.append(("read", i))
+            yield [BaseDocument(id=f"{i}-{j}", text="t", score=0, metadata={}, embedding=None) for j in range(size)]
+
+    def commit_sync(self, plan):
+        self.events.append(("commit",))
+
+
+class IndexingRetriever:
+    def __init__(self, events):
+        self.events = events
+
+    async def delete(self, ids):
+        self.events.append(("delete", list(ids)))
+
+    async def ingest(self, documents):
+        self.events.append(("ingest", len(documents)))
+
+
+def test_sync_indexes_each_batch_before_reading_the_next():
+    ingester = FakeIngester([3, 3, 1])
+    service = RagService(ingester=ingester, retriever=IndexingRetriever(ingester.events), generator=FakeGenerator())
+    summary = asyncio.run(service.sync(directory="docs"))
+    assert summary["chunks_upserted"] == 7 and summary["chunks_deleted"] == 1
+    assert ingester.events == [
+        ("delete", ["old"]), ("read", 0), ("ingest", 3), ("read", 1), ("ingest", 3), ("read", 2), ("ingest", 1), ("commit",),
+    ]
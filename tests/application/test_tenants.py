@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from src.application.tenants import TenantRegistry, validate_org_id
+
+
+class FakeRetriever:
+    def __init__(self, org_id):
+        self.org_id = org_id
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _registry(max_tenants=2):
+    built = []
+
+    async def factory(org_id):
+        await asyncio.sleep(0)
+        built.append(org_id)
+        return FakeRetriever(org_id)
+
+    return TenantRegistry(factory, max_tenants=max_tenants), built
+
+
+def test_org_ids_are_never_rewritten():
+    assert validate_org_id("acme_eu-1") == "acme_eu-1"
+    for org_id in ("acme.eu", "acme/eu", "", "x" * 65):
+        with pytest.raises(ValueError):
+            validate_org_id(org_id)
+
+
+def test_concurrent_first_requests_share_one_build():
+    async def run():
+        registry, built = _registry()
+        first, second = await asyncio.gather(registry.get("a"), registry.get("a"))
+        return first, second, built
+
+    first, second, built = asyncio.run(run())
+    assert first is second and built == ["a"]
+
+
+def test_lru_eviction_closes_unleased_retriever():
+    async def run():
+        registry, _ = _registry(max_tenants=2)
+        a = await registry.get("a")
+        await registry.get("b")
+        await registry.get("a")
+        b_evicted = registry._resident.get("b")
+        await registry.get("c")
+        return a, b_evicted, registry
+
+    a, b, registry = asyncio.run(run())
+    assert b.closed and not a.closed
+    assert registry.stats()["evictions"] == 1
+
+
+def test_eviction_waits_for_leases():
+    async def run():
+        registry, _ = _registry(max_tenants=1)
+        async with registry.lease("a") as a:
+            await registry.get("b")
+            assert not a.closed
+            assert registry.stats()["retired"] == 1
+        assert a.closed
+        assert registry.stats()["retired"] == 0
+
+    asyncio.run(run())
+
+
+def test_close_closes_retired_retrievers():
+    async def run():
+        registry, _ = _registry(max_tenants=1)
+        async with registry.lease("a") as a:
+            await registry.get("b")
+            await registry.close()
+            assert a.closed
+
+    asyncio.run(run())
+
+
+def test_activity_roundtrip(tmp_path):
+    async def run():
+        registry, _ = _registry(max_tenants=4)
+        for org_id in ("a", "b", "b", "c", "c", "c"):
+            await registry.get(org_id)
+        return registry
+
+    registry = asyncio.run(run())
+    path = str(tmp_path / "activity.json")
+    registry.save_activity(path, 2)
+    assert TenantRegistry.load_activity(path) == ["c", "b"]
+    assert TenantRegistry.load_activity(str(tmp_path / "missing.json")) == []
+
+
+def test_max_tenants_must_be_positive():
+    with pytest.raises(ValueError):
+        TenantRegistry(FakeRetriever, max_tenants=0)
+
+
+def test_cancelled_build_releases_waiters():
+    async def run():
+        started = asyncio.Event()
+        builds = []
+
+        async def factory(org_id):
+            builds.append(org_id)
+            if len(builds) == 1:
+                started.set()
+                await asyncio.sleep(10)
+            return FakeRetriever(org_id)
+
+        registry = TenantRegistry(factory)
+        builder = asyncio.create_task(registry.get("a"))
+        await started.wait()
+        waiter = asyncio.create_task(registry.get("a"))
+        await asyncio.sleep(0)
+        builder.cancel()
+        retriever = await asyncio.wait_for(waiter, timeout=1)
+        return builder, retriever, builds, registry
+
+    builder, retriever, builds, registry = asyncio.run(run())
+    assert builder.cancelled()
+    assert retriever.org_id == "a" and builds == ["a", "a"]
+    assert registry._loading == {} and registry._resident["a"] is retriever
@@ -0,0 +1,102 @@
+import math
+import random
+import pytest
+from src.core.bm25_index import STATE_FILE, BM25Index, default_tokenizer, persisted_stamp
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi omicron pi".split()
+
+
+def _corpus(n, seed=0):
+    rng = random.Random(seed)
+    # Skewed term frequencies, so some postings are long and some short.
+    return [" ".join(rng.choices(WORDS, weights=range(len(WORDS), 0, -1), k=rng.randint(3, 30))) for _ in range(n)]
+
+
+def _brute_force(texts, query, k1=1.2, b=0.75):
+    docs = [default_tokenizer(t) for t in texts]
+    avgdl = sum(map(len, docs)) / len(docs)
+    scores = [0.0] * len(docs)
+    for term in set(default_tokenizer(query)):
+        df = sum(term in d for d in docs)
+        if not df:
+            continue
+        idf = math.log(1.0 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, d in enumerate(docs):
+            tf = d.count(term)
+            if tf:
+                scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(d) / avgdl))
+    return scores
+
+
+@pytest.mark.parametrize("query", ["alpha", "pi omicron", "alpha beta xi", "mu nu xi omicron pi kappa"])
+@pytest.mark.parametrize("top_k", [1, 5, 20])
+def test_maxscore_matches_brute_force(query, top_k):
+    texts = _corpus(300)
+    index = BM25Index()
+    index.add([f"d{i}" for i in range(len(texts))], texts)
+    expected = _brute_force(texts, query)
+    results = index.search(query, top_k=top_k)
+    assert len(results) == min(top_k, sum(s > 0 for s in expected))
+    kth = sorted(expected, reverse=True)[len(results) - 1]
+    for result in results:
+        i = int(result["id"][1:])
+        assert result["score"] == pytest.approx(expected[i], rel=1e-4)
+        assert expected[i] >= kth - 1e-4
+
+
+def test_delete_and_compaction_keep_results_consistent():
+    texts = _corpus(100, seed=1)
+    index = BM25Index(compaction_threshold=0.1)
+    ids = [f"d{i}" for i in range(len(texts))]
+    index.add(ids, texts)
+    index.delete(ids[:50])
+    assert len(index) == 50
+    assert index._dead == 0  # compacted
+    expected = _brute_force(texts[50:], "alpha xi")
+    results = index.search("alpha xi", top_k=10)
+    assert all(int(r["id"][1:]) >= 50 for r in results)
+    assert results[0]["score"] == pytest.approx(max(expected), rel=1e-4)
+
+
+def test_readd_replaces_document():
+    index = BM25Index()
+    index.add(["a"], ["apple banana"])
+    index.add(["a"], ["cherry"])
+    assert len(index) == 1
+    assert index.search("apple") == []
+    assert index.search("cherry")[0]["id"] == "a"
+
+
+def test_metadata_filter():
+    index = BM25Index()
+    index.add(["a", "b"], ["apple pie", "apple tart"], [{"lang": "en"}, {"lang": "fr"}])
+    assert [r["id"] for r in index.search("apple", metadata_filter={"lang": "fr"})] == ["b"]
+    assert index.search("apple", metadata_filter={"lang": "de"}) == []
+
+
+def test_persist_and_load_round_trip(tmp_path):
+    texts = _corpus(50, seed=2)
+    index = BM25Index()
+    index.add([f"d{i}" for i in range(len(texts))], texts, [{"n": i} for i in range(len(texts))])
+    index.delete(["d0", "d1"])
+    index.persist(str(tmp_path))
+
+    loaded = BM25Index()
+    loaded.load(str(tmp_path))
+    assert len(loaded) == 48
+    assert loaded.search("beta gamma", top_k=5) == index.search("beta gamma", top_k=5)
+    assert [r["id"] for r in loaded.search("alpha", top_k=50, metadata_filter={"n": 7})] == ["d7"]
+
+
+def test_load_rejects_files_from_different_saves(tmp_path):
+    index = BM25Index()
+    index.add(["a"], ["alpha beta"])
+    index.persist(str(tmp_path / "first"))
+    first = persisted_stamp(str(tmp_path / "first"))
+    index.add(["b"], ["gamma"])
+    index.persist(str(tmp_path / "second"))
+    assert first is not None and persisted_stamp(str(tmp_path / "missing")) is None
+    # A reader that sees one file of a save and the other of the next one.
+    (tmp_path / "second" / STATE_FILE).replace(tmp_path / "first" / STATE_FILE)
+    with pytest.raises(ValueError):
+        BM25Index().load(str(tmp_path / "first"))
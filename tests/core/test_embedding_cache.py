@@ -0,0 +1,68 @@
+import os
+import numpy as np
+from src.core.embedding_cache import EmbeddingCache, model_dir_name, normalize_text
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_round_trip_and_kinds(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", max_bytes=1 << 16)
+    vectors = _vectors(3)
+    cache.put_many(["a", "b", "c"], "doc", vectors)
+    found, hits = cache.get_many(["a", "x", "c"], "doc")
+    assert hits == 2 and found[1] is None
+    np.testing.assert_allclose(found[0], vectors[0])
+    np.testing.assert_allclose(found[2], vectors[2])
+    # Query and document embeddings of the same text are separate entries.
+    assert cache.get_many(["a"], "query") == ([None], 0)
+
+
+def test_normalized_text_shares_an_entry(tmp_path):
+    assert normalize_text("  á  b\n") == "á b"
+    cache = EmbeddingCache(str(tmp_path), "m", max_bytes=1 << 16)
+    cache.put_many(["hello   world"], "doc", _vectors(1))
+    assert cache.get_many(["hello world\n"], "doc")[1] == 1
+
+
+def test_models_use_separate_tables(tmp_path):
+    small = EmbeddingCache(str(tmp_path), "org/small-model", max_bytes=1 << 16)
+    large = EmbeddingCache(str(tmp_path), "org/large-model", max_bytes=1 << 16)
+    assert small.path != large.path
+    assert os.path.basename(small.path) == model_dir_name("org/small-model")
+    small.put_many(["a"], "doc", _vectors(1, dim=4))
+    large.put_many(["a"], "doc", _vectors(1, dim=16))
+    # Writing one model's table leaves the other's intact.
+    assert len(small.get_many(["a"], "doc")[0][0]) == 4
+    assert len(large.get_many(["a"], "doc")[0][0]) == 16
+
+
+def test_size_is_bounded(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", max_bytes=64 * (8 * 4 + 24), ways=4)
+    cache.put_many([f"t{i}" for i in range(500)], "doc", _vectors(500))
+    stats = cache.stats()
+    assert stats["capacity"] == 64 and stats["entries"] <= 64
+    assert stats["writes"] == 500 and stats["evictions"] >= 500 - 64
+
+
+def test_reader_follows_rebuild_by_another_instance(tmp_path):
+    reader = EmbeddingCache(str(tmp_path), "m", max_bytes=1 << 16)
+    writer = EmbeddingCache(str(tmp_path), "m", max_bytes=1 << 16)
+    writer.put_many(["a"], "doc", _vectors(1, dim=8))
+    assert reader.get_many(["a"], "doc")[1] == 1
+    # A new dimension rebuilds the table; the reader must not keep the old one.
+    writer.put_many(["b"], "doc", _vectors(1, dim=16))
+    found, hits = reader.get_many(["a", "b"], "doc")
+    assert found[0] is None and hits == 1 and len(found[1]) == 16
+
+
+def test_changed_size_rebuilds_the_table(tmp_path):
+    small = EmbeddingCache(str(tmp_path), "m", max_bytes=1 << 14)
+    small.put_many(["a"], "doc", _vectors(1))
+    large = EmbeddingCache(str(tmp_path), "m", max_bytes=1 << 16)
+    # The existing table is reused for lookups until the first write with the new size.
+    assert large.stats()["capacity"] == small.stats()["capacity"]
+    large.put_many(["b"], "doc", _vectors(1))
+    assert large.stats()["capacity"] > small.stats()["capacity"]
+    assert large.get_many(["a", "b"], "doc")[1] == 1
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from src.core.flat_vectordb import FlatVectorDatabase
+from src.core.vector_utils import normalize_rows
+
+
+def _data(n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def _store(n=200):
+    vectors = _data(n)
+    store = FlatVectorDatabase(initial_capacity=8)
+    store.add_embeddings(vectors, ids=[str(i) for i in range(n)],
+                         metadata=[{"group": i % 3} for i in range(n)])
+    return store, vectors
+
+
+def test_search_returns_exact_top_k():
+    store, vectors = _store()
+    query = vectors[7]
+    expected = [str(i) for i in np.argsort(-(vectors @ query))[:5]]
+    results = store.similarity_search(query, top_k=5)
+    assert [r["id"] for r in results] == expected
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_metadata_filter():
+    store, vectors = _store()
+    results = store.similarity_search(vectors[0], top_k=10, metadata_filter={"group": 1})
+    assert len(results) == 10
+    assert all(r["metadata"]["group"] == 1 for r in results)
+    assert store.similarity_search(vectors[0], metadata_filter={"group": 9}) == []
+
+
+def test_delete_keeps_rows_dense_and_searchable():
+    store, vectors = _store()
+    store.delete(["7", "0"])
+    assert len(store) == 198
+    ids = [r["id"] for r in store.similarity_search(vectors[7], top_k=200)]
+    assert "7" not in ids and "0" not in ids
+    # The row moved into a freed slot is still found by its own vector.
+    assert store.similarity_search(vectors[199], top_k=1)[0]["id"] == "199"
+
+
+def test_readding_an_id_replaces_it():
+    store, vectors = _store()
+    store.add_embeddings(vectors[5:6], ids=["1"])
+    assert len(store) == 200
+    assert store.similarity_search(vectors[5], top_k=2)[1]["id"] in {"1", "5"}
+
+
+def test_persist_and_load(tmp_path):
+    store, vectors = _store()
+    store.persist(str(tmp_path))
+    loaded = FlatVectorDatabase()
+    loaded.load(str(tmp_path))
+    assert len(loaded) == len(store)
+    assert loaded.similarity_search(vectors[3], top_k=3) == store.similarity_search(vectors[3], top_k=3)
+    # Still writable after being memory-mapped.
+    loaded.add_embeddings(vectors[:1], ids=["new"])
+    assert len(loaded) == 201
+
+
+def test_raw_text_needs_embed_fn():
+    with pytest.raises(ValueError):
+        FlatVectorDatabase().add_documents(["hello"])
@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+from src.core.hnsw_vectordb import HNSWVectorDatabase
+from src.core.vector_utils import normalize_rows
+
+
+def _data(n=1000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def _store(vectors, **kwargs):
+    store = HNSWVectorDatabase(seed=1, **kwargs)
+    store.add_embeddings(vectors, ids=[str(i) for i in range(len(vectors))],
+                         metadata=[{"group": i % 4} for i in range(len(vectors))])
+    return store
+
+
+def _recall(store, vectors, queries, k=10, metadata_filter=None):
+    hits = 0
+    for q in queries:
+        scores = vectors @ q
+        if metadata_filter:
+            scores = np.where(np.arange(len(vectors)) % 4 == metadata_filter["group"], scores, -np.inf)
+        expected = {str(i) for i in np.argsort(-scores)[:k]}
+        found = {r["id"] for r in store.similarity_search(q, top_k=k, metadata_filter=metadata_filter)}
+        hits += len(found & expected)
+    return hits / (len(queries) * k)
+
+
+def test_recall_against_brute_force():
+    vectors, queries = _data(), _data(n=30, seed=2)
+    assert _recall(_store(vectors), vectors, queries) >= 0.95
+
+
+def test_filtered_search_only_returns_matches():
+    vectors, queries = _data(), _data(n=10, seed=2)
+    store = _store(vectors)
+    results = store.similarity_search(queries[0], top_k=10, metadata_filter={"group": 2})
+    assert results and all(r["metadata"]["group"] == 2 for r in results)
+    assert _recall(store, vectors, queries, metadata_filter={"group": 2}) >= 0.9
+
+
+def test_delete_and_compact():
+    vectors = _data(n=300)
+    store = _store(vectors, compaction_threshold=0.1)
+    deleted = [str(i) for i in range(0, 300, 2)]
+    store.delete(deleted)
+    assert len(store) == 150
+    found = {r["id"] for r in store.similarity_search(vectors[0], top_k=50)}
+    assert not found & set(deleted)
+    assert store.similarity_search(vectors[1], top_k=1)[0]["id"] == "1"
+
+
+def test_persist_and_load(tmp_path):
+    vectors = _data(n=300)
+    store = _store(vectors)
+    store.persist(str(tmp_path))
+    loaded = HNSWVectorDatabase()
+    loaded.load(str(tmp_path))
+    assert len(loaded) == 300
+    assert [r["id"] for r in loaded.similarity_search(vectors[9], top_k=5)] == \
+        [r["id"] for r in store.similarity_search(vectors[9], top_k=5)]
+
+
+def test_compaction_builds_outside_the_lock_and_replays_concurrent_changes():
+    vectors = _data(n=200)
+    store = _store(vectors)
+    store.delete([str(i) for i in range(0, 100)])
+    extra = _data(n=1, seed=5)
+    build = store._empty_like
+
+    def empty_like(seed):
+        # Runs between snapshot and swap: searches must not be blocked, and changes must survive.
+        searcher = threading.Thread(target=store.similarity_search, args=(vectors[150],))
+        searcher.start()
+        searcher.join(timeout=5)
+        assert not searcher.is_alive()
+        store.add_embeddings(extra, ids=["new"], metadata=[{"group": 9}])
+        store.delete(["150"])
+        store.update_metadata("151", {"tag": "x"})
+        return build(seed)
+
+    store._empty_like = empty_like
+    store.compact()
+    assert store._n_deleted == 1 and len(store) == 100
+    assert store.similarity_search(extra[0], top_k=1)[0]["id"] == "new"
+    assert "150" not in {r["id"] for r in store.similarity_search(vectors[150], top_k=20)}
+    assert store.similarity_search(vectors[151], top_k=1)[0]["metadata"]["tag"] == "x"
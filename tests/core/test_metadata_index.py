@@ -0,0 +1,38 @@
+from src.core.metadata_index import MetadataIndex
+
+
+def _index():
+    index = MetadataIndex()
+    index.add(0, {"lang": "en", "org": "a"})
+    index.add(1, {"lang": "de", "org": "a"})
+    index.add(2, {"lang": "en", "org": "b", "tags": ["x"]})
+    return index
+
+
+def test_lookup_intersects_keys():
+    index = _index()
+    assert index.lookup({"lang": "en"}) == {0, 2}
+    assert index.lookup({"lang": "en", "org": "a"}) == {0}
+    assert index.lookup({"lang": "fr"}) == set()
+
+
+def test_list_value_matches_any():
+    assert _index().lookup({"lang": ["de", "en"], "org": "a"}) == {0, 1}
+
+
+def test_unservable_filters_return_none():
+    index = _index()
+    assert index.lookup({}) is None
+    assert index.lookup({"tags": [["x"]]}) is None
+
+
+def test_remove_drops_empty_postings():
+    index = _index()
+    index.remove(1, {"lang": "de", "org": "a"})
+    assert index.lookup({"lang": "de"}) == set()
+    assert ("lang", "de") not in index._postings
+    assert index.lookup({"org": "a"}) == {0}
+
+
+def test_to_array_is_sorted():
+    assert MetadataIndex.to_array({5, 1, 3}).tolist() == [1, 3, 5]
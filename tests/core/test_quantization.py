@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from src.core.flat_vectordb import FlatVectorDatabase
+from src.core.hnsw_vectordb import HNSWVectorDatabase
+from src.core.quantization import BinaryQuantizer, ScalarQuantizer, get_quantizer
+from src.core.vector_utils import normalize_rows
+
+
+def _data(n=500, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def _recall(store, vectors, queries, k=10):
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    hits = 0
+    for q, expected in zip(queries, truth):
+        found = {int(r["id"]) for r in store.similarity_search(q, top_k=k)}
+        hits += len(found & {int(i) for i in expected})
+    return hits / (len(queries) * k)
+
+
+def test_scalar_roundtrip_error_is_small():
+    vectors = _data()
+    q = ScalarQuantizer()
+    q.fit(vectors)
+    codes = q.encode(vectors)
+    decoded = (codes.astype(np.float32) + 128) * q._scale + q._lo
+    assert np.abs(decoded - vectors).max() <= q._scale.max()
+
+
+def test_scalar_update_widens_range_only_when_needed():
+    vectors = _data()
+    q = ScalarQuantizer()
+    assert q.update(vectors[:1]) is False
+    assert q.is_fitted
+    assert q.update(vectors[1:]) is True
+    # Already covered: nothing to re-encode.
+    assert q.update(vectors[1:]) is False
+
+
+def test_scalar_state_roundtrip():
+    vectors = _data()
+    q = ScalarQuantizer()
+    q.fit(vectors)
+    restored = ScalarQuantizer()
+    restored.set_state(q.state())
+    np.testing.assert_array_equal(restored.encode(vectors), q.encode(vectors))
+
+
+def test_binary_score_prefers_same_signs():
+    vectors = _data(n=50)
+    q = BinaryQuantizer()
+    scores = q.score(vectors[3], q.encode(vectors))
+    assert int(np.argmax(scores)) == 3
+
+
+def test_get_quantizer_rejects_unknown_name():
+    assert get_quantizer(None) is None
+    with pytest.raises(ValueError):
+        get_quantizer("int4")
+
+
+@pytest.mark.parametrize("store_cls", [FlatVectorDatabase, HNSWVectorDatabase])
+def test_int8_incremental_adds_match_bulk_add(store_cls):
+    vectors = _data()
+    queries = _data(n=20, seed=1)
+    ids = [str(i) for i in range(len(vectors))]
+
+    bulk = store_cls(quantization="int8", rescore_factor=1)
+    bulk.add_embeddings(vectors, ids=ids)
+    incremental = store_cls(quantization="int8", rescore_factor=1)
+    for i, vector in enumerate(vectors):
+        incremental.add_embeddings(vector[None, :], ids=[ids[i]])
+
+    bulk_recall = _recall(bulk, vectors, queries)
+    assert bulk_recall >= 0.9
+    assert _recall(incremental, vectors, queries) >= bulk_recall - 0.05
@@ -0,0 +1,69 @@
+import pytest
+from src.core.text_stream import StreamingSentenceChunker, iter_text_blocks
+
+
+def _blocks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+TEXT = "".join(
+    f"Sentence {i} has {'a few words ' * (i % 7)}in it.{chr(10) * 2 if i % 11 == 0 else ' '}" for i in range(300)
+)
+
+
+@pytest.mark.parametrize("block", [1, 7, 64, 1000, len(TEXT)])
+def test_chunks_do_not_depend_on_block_size(block):
+    chunker = StreamingSentenceChunker(chunk_size=40, chunk_overlap=10, max_sentence_chars=200)
+    expected = list(chunker.chunks([TEXT]))
+    assert list(chunker.chunks(_blocks(TEXT, block))) == expected
+
+
+def test_offsets_are_exact_and_sizes_bounded():
+    chunker = StreamingSentenceChunker(chunk_size=40, chunk_overlap=10)
+    chunks = list(chunker.chunks(_blocks(TEXT, 97)))
+    assert len(chunks) > 10
+    for chunk in chunks:
+        assert TEXT[chunk.start_char_idx:chunk.end_char_idx] == chunk.text
+        assert len(chunk.text.split()) <= 40
+    # Together the chunks cover the whole text, in order.
+    assert chunks[0].start_char_idx == 0 and chunks[-1].end_char_idx == len(TEXT.rstrip())
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.start_char_idx < b.start_char_idx and not TEXT[a.end_char_idx:b.start_char_idx].strip()
+
+
+def test_consecutive_chunks_overlap_by_whole_sentences():
+    text = "".join(f"This is sentence {i}. " for i in range(50))
+    chunks = list(StreamingSentenceChunker(chunk_size=20, chunk_overlap=8).chunks([text]))
+    for a, b in zip(chunks, chunks[1:]):
+        overlap = a.end_char_idx - b.start_char_idx
+        assert overlap > 0 and b.text.startswith("This is sentence")
+        assert len(text[b.start_char_idx:a.end_char_idx].split()) <= 8
+
+
+def test_long_runs_without_sentence_end_are_cut_at_whitespace():
+    text = " ".join(f"w{i}" for i in range(5000))
+    chunker = StreamingSentenceChunker(chunk_size=100, chunk_overlap=0, max_sentence_chars=300)
+    sentences = list(chunker.sentences(_blocks(text, 128)))
+    assert "".join(s for s, _ in sentences) == text
+    assert all(len(s) <= 300 for s, _ in sentences)
+    assert all(text[start - 1] == " " for _, start in sentences[1:])
+    assert all(len(c.text.split()) <= 100 for c in chunker.chunks(_blocks(text, 128)))
+
+
+def test_long_sentences_are_split_between_words():
+    text = " ".join(["word"] * 95) + ". Short one."
+    chunks = list(StreamingSentenceChunker(chunk_size=30, chunk_overlap=0).chunks([text]))
+    assert [len(c.text.split()) for c in chunks] == [30, 30, 30, 5 + 2]
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        StreamingSentenceChunker(chunk_size=10, chunk_overlap=10)
+
+
+def test_iter_text_blocks_keeps_line_endings(tmp_path):
+    path = tmp_path / "t.txt"
+    path.write_bytes(b"a\r\nb\n\xffc")
+    blocks = list(iter_text_blocks(path, block_chars=2))
+    assert all(len(b) <= 2 for b in blocks)
+    assert "".join(blocks) == "a\r\nb\n�c"
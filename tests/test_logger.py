@@ -0,0 +1,52 @@
+import logging
+import queue
+import pytest
+from src.logger import DEGRADE, DROP, BoundedQueueHandler
+
+
+def _record(level=logging.INFO, msg="message", name="src.app"):
+    return logging.LogRecord(name, level, __file__, 1, msg, None, None)
+
+
+def test_drop_policy_drops_new_records_when_full():
+    handler = BoundedQueueHandler(queue.Queue(2), policy=DROP)
+    for _ in range(3):
+        handler.emit(_record())
+    handler.emit(_record(logging.ERROR))
+    assert handler.queue.qsize() == 2
+    assert handler.counters["enqueued"] == 2 and handler.counters["dropped"] == 2
+
+
+def test_degrade_policy_sheds_low_severity_first():
+    handler = BoundedQueueHandler(queue.Queue(4), policy=DEGRADE, degrade_at=0.5)
+    for _ in range(4):
+        handler.emit(_record())
+    assert handler.counters["enqueued"] == 2 and handler.counters["shed"] == 2
+    # Warnings and errors still get the remaining room, then are dropped.
+    for _ in range(3):
+        handler.emit(_record(logging.WARNING))
+    assert handler.queue.qsize() == 4
+    assert handler.counters["enqueued"] == 4 and handler.counters["dropped"] == 1
+
+
+def test_long_messages_are_truncated_before_queueing():
+    handler = BoundedQueueHandler(queue.Queue(), max_chars=10)
+    handler.emit(_record(msg="x" * 25))
+    handler.emit(_record(msg="short"))
+    long, short = handler.queue.get_nowait(), handler.queue.get_nowait()
+    assert long.getMessage() == "x" * 10 + "... [truncated 15 chars]"
+    assert short.getMessage() == "short"
+    assert handler.counters["truncated"] == 1
+
+
+@pytest.mark.parametrize("name, kept", [
+    ("src.adapters.rest", 0), ("src.adapters.rest.sub", 0), ("src.adapters", 20), ("src.adaptersx", 20),
+])
+def test_sampling_uses_longest_prefix_and_spares_warnings(monkeypatch, name, kept):
+    monkeypatch.setattr("src.logger.random.random", lambda: 0.5)
+    handler = BoundedQueueHandler(queue.Queue(), sampling={"src.adapters": 1.0, "src.adapters.rest": 0.0})
+    for _ in range(20):
+        handler.emit(_record(name=name))
+    handler.emit(_record(logging.WARNING, name=name))
+    assert handler.counters["enqueued"] == kept + 1
+    assert handler.counters["sampled_out"] == 20 - kept